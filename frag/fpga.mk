@@ -1,7 +1,7 @@
 ## DO NOT MODIFY ANYTHING IN THIS FILE WITHOUT PERMISSION FROM THE INSTRUCTOR OR TAs
 
 # Path to the repository root
-REPO_ROOT ?= $(shell git rev-parse --show-toplevel)
+REPO_ROOT ?= $(abspath $(CURDIR)/../..)
 
 # If you have the tools installed in a non-standard path,
 # you can override these to specify the path to the executable.
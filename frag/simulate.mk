@@ -1,7 +1,7 @@
 ## DO NOT MODIFY ANYTHING IN THIS FILE WITHOUT PERMISSION FROM THE INSTRUCTOR OR TAs
 
 # Path to the repository root
-REPO_ROOT ?= $(shell git rev-parse --show-toplevel)
+REPO_ROOT ?= $(abspath $(CURDIR)/../..)
 
 # If you have iverilog or verilator installed in a non-standard path,
 # you can override these to specify the path to the executable.
@@ -12,10 +12,11 @@ VERILATOR ?= verilator
 # that students can edit the filelist, that make knows about updates
 # to that filelist *and* the files themselves, and that pytest can
 # read the filelist, we store the listlist in a json file. We then
-# read the json file while checking dependencies.
-SIM_SOURCES = $(shell python3 $(REPO_ROOT)/util/get_filelist.py)
-SIM_SOURCES := $(addprefix $(REPO_ROOT)/,$(SIM_SOURCES))
-SIM_TOP = $(shell python3 $(REPO_ROOT)/util/get_top.py)
+# read the json file (through a generated filelist.mk, see
+# sources.mk) while checking dependencies.
+include $(REPO_ROOT)/frag/sources.mk
+SIM_SOURCES := $(addprefix $(REPO_ROOT)/,$(FILELIST_SOURCES))
+SIM_TOP := $(FILELIST_TOP)
 
 all: help
 
@@ -25,6 +26,11 @@ test: results.json
 results.json: filelist.json $(SIM_SOURCES)
 	pytest -rA
 
+# Run all simulation tests in parallel, across JOBS worker processes.
+JOBS ?= $(shell nproc)
+regress: filelist.json $(SIM_SOURCES)
+	python3 $(REPO_ROOT)/util/regress.py -j $(JOBS) -o results.json
+
 # lint runs the Verilator linter on your code.
 lint:
 	$(VERILATOR) --lint-only -top $(SIM_TOP) $(SIM_SOURCES)  -Wall
@@ -40,12 +46,14 @@ sim-clean:
 # Remove all generated files
 extraclean: clean
 	rm -f results.json
+	rm -f filelist.mk
 	rm -f verilator.json
 	rm -f icarus.json
 
 sim-help:
 	@echo "  test: Shortcut for results.json"
 	@echo "  results.json: Run all simulation tests"
+	@echo "  regress: Run all simulation tests in parallel (writes results.json)"
 	@echo "  lint: Run the Verilator linter on all source files"
 	@echo "  clean: Remove all compiler outputs."
 	@echo "  extraclean: Remove all generated files (runs clean)"
@@ -57,6 +65,14 @@ vars-intro-help:
 sim-vars-help:
 	@echo "    VERILATOR: Override this variable to set the location of your verilator executable."
 	@echo "    IVERILOG: Override this variable to set the location of your iverilog executable."
+	@echo "    JOBS: Override this variable to set the number of parallel workers used by regress."
+	@echo "    SIM_TRACE: Waveforms: off (default), on, rerun (rerun failing tests with waves), or window (rerun, dumping around the failure)."
+	@echo "    SIM_REFMODEL: Reference models: python (default), or native (compiled into Verilator simulations)."
+	@echo "    SIM_OBJCACHE: Set to 0 to compile Verilator models without the shared object cache (ccache, or util/objcache.py)."
+	@echo "    SIM_PROFILE: Build profile for every test: default, fast-compile, fast-run or debug (overrides each test's own)."
+	@echo "    SIM_THREADS: Threads per Verilator model (default 1; see util/threadbench.py for when more pay off)."
+	@echo "    SIM_MAKE_JOBS: Parallel jobs for the C++ compile of Verilator models (default: the CPU count)."
+	@echo "    SIM_SNAPSHOT: Set to 1 to restore the post-reset state saved with the model instead of running reset (off for grading)."
 
 clean: sim-clean
 targets-help: sim-help
@@ -64,4 +80,4 @@ vars-help: vars-intro-help sim-vars-help
 
 help: targets-help vars-help 
 
-.PHONY: all test lint sim-clean extraclean sim-help vars-intro-help sim-vars-help clean targets-help vars-help help test results.json
+.PHONY: all test regress lint sim-clean extraclean sim-help vars-intro-help sim-vars-help clean targets-help vars-help help test results.json
@@ -0,0 +1,27 @@
+## DO NOT MODIFY ANYTHING IN THIS FILE WITHOUT PERMISSION FROM THE INSTRUCTOR OR TAs
+
+# The filelist, as make variables (FILELIST_TOP, FILELIST_SOURCES,
+# FILELIST_TOP_SOURCES, FILELIST_INCLUDES and FILELIST_DEFINES,
+# relative to the repository root). filelist.mk is generated from
+# filelist.json, and make only regenerates it (and restarts) when
+# filelist.json or one of the sources is newer, so reading the
+# filelist doesn't start any processes. (FILELIST_TOP_SOURCES depends
+# on which modules the sources instantiate.)
+ifndef SOURCES_MK_INCLUDED
+SOURCES_MK_INCLUDED := 1
+
+# Path to the repository root (module directories are two levels down)
+REPO_ROOT ?= $(abspath $(CURDIR)/../..)
+
+# Don't let these rules become the default goal.
+SOURCES_MK_GOAL := $(.DEFAULT_GOAL)
+filelist.mk: filelist.json
+	python3 $(REPO_ROOT)/util/filelist_mk.py
+
+-include filelist.mk
+
+# The sources are only known once filelist.mk has been read.
+filelist.mk: $(addprefix $(REPO_ROOT)/,$(FILELIST_SOURCES))
+.DEFAULT_GOAL := $(SOURCES_MK_GOAL)
+
+endif
@@ -1,7 +1,7 @@
 ## DO NOT MODIFY ANYTHING IN THIS FILE WITHOUT PERMISSION FROM THE INSTRUCTOR OR TAs
 
 # Path to the repository root
-REPO_ROOT ?= $(shell git rev-parse --show-toplevel)
+REPO_ROOT ?= $(abspath $(CURDIR)/../..)
 
 # If you have the tools installed in a non-standard path,
 # you can override these to specify the path to the executable.
@@ -13,10 +13,14 @@ RSVG ?= rsvg-convert
 # that students can edit the filelist, that make knows about updates
 # to that filelist *and* the files themselves, and that pytest can
 # read the filelist, we store the listlist in a json file. We then
-# read the json file while checking dependencies.
-SYNTH_SOURCES = $(shell python3 $(REPO_ROOT)/util/get_filelist.py)
-SYNTH_SOURCES := $(addprefix $(REPO_ROOT)/,$(SYNTH_SOURCES))
-ABSTRACT_TOP = $(shell python3 $(REPO_ROOT)/util/get_top.py)
+# read the json file (through a generated filelist.mk, see
+# sources.mk) while checking dependencies.
+include $(REPO_ROOT)/frag/sources.mk
+SYNTH_SOURCES := $(addprefix $(REPO_ROOT)/,$(FILELIST_SOURCES))
+# Only the sources ABSTRACT_TOP reaches (see util/iplib.py), so that
+# the netlists of one module don't read the IP used by top.sv alone.
+SYNTH_TOP_SOURCES := $(addprefix $(REPO_ROOT)/,$(FILELIST_TOP_SOURCES))
+ABSTRACT_TOP := $(FILELIST_TOP)
 
 # The ice40 commands will only work if top.sv is provided, i.e. if
 # there is a design for the FPGA.
@@ -34,8 +38,8 @@ mapped.pdf: mapped.json
 	$(RSVG) -f pdf $(subst pdf,svg,$@) -o $@
 
 synth-mapped: mapped.json
-mapped.json: filelist.json $(SYNTH_SOURCES)
-	$(YOSYS) -ql mapped.yslog -p 'synth_ice40 -top $(ABSTRACT_TOP) -json $@' $(SYNTH_SOURCES)
+mapped.json: filelist.json $(SYNTH_TOP_SOURCES)
+	$(YOSYS) -ql mapped.yslog -p 'synth_ice40 -top $(ABSTRACT_TOP) -json $@' $(SYNTH_TOP_SOURCES)
 
 # These commands will always work.
 abstract.pdf: abstract.json
@@ -43,8 +47,8 @@ abstract.pdf: abstract.json
 	$(RSVG) -f pdf $(subst pdf,svg,$@) -o $@
 
 synth-abstract: abstract.json
-abstract.json: filelist.json $(SYNTH_SOURCES)
-	$(YOSYS) -ql abstract.yslog -p 'prep -top $(ABSTRACT_TOP) -flatten; json -o $@' $(SYNTH_SOURCES) 
+abstract.json: filelist.json $(SYNTH_TOP_SOURCES)
+	$(YOSYS) -ql abstract.yslog -p 'prep -top $(ABSTRACT_TOP) -flatten; json -o $@' $(SYNTH_TOP_SOURCES) 
 
 synth-clean:
 	rm -rf ice40.json
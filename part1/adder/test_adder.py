@@ -1,33 +1,24 @@
-import git
 import os
 import sys
-import git
 
-# I don't like this, but it's convenient.
-_REPO_ROOT = git.Repo(search_parent_directories=True).working_tree_dir
-assert (os.path.exists(_REPO_ROOT)), "REPO_ROOT path must exist"
-sys.path.append(os.path.join(_REPO_ROOT, "util"))
+# I don't like this, but it's convenient. util/ is two directories
+# up from every testbench.
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "util"))
 from utilities import runner, lint, assert_resolvable
+import golden
 tbpath = os.path.dirname(os.path.realpath(__file__))
 
-import pytest
-
 import cocotb
 
-from cocotb.clock import Clock
 from cocotb.regression import TestFactory
 from cocotb.utils import get_sim_time
-from cocotb.triggers import Timer, ClockCycles, RisingEdge, FallingEdge, with_timeout
-from cocotb.types import LogicArray, Range
-
-from cocotb_test.simulator import run
-
-from cocotbext.axi import AxiLiteBus, AxiLiteMaster, AxiStreamSink, AxiStreamMonitor, AxiStreamBus
+from cocotb.triggers import Timer
 
-from pytest_utils.decorators import max_score, visibility, tags
+from prelude import pytest, max_score
 
 import random
 timescale = "1ps/1ps"
+profile = "fast-compile"
 
 tests = ['width_in',
          'width_out',
@@ -52,7 +43,7 @@ def test_each(test_name, simulator, width_p):
     parameters = dict(locals())
     del parameters['test_name']
     del parameters['simulator']
-    runner(simulator, timescale, tbpath, parameters, testname=test_name)
+    runner(simulator, timescale, tbpath, parameters, testname=test_name, batch=tests, profile=profile)
 
 # Opposite above, run all the tests in one simulation but reset
 # between tests to ensure that reset is clearing all state.
@@ -63,7 +54,7 @@ def test_all(simulator, width_p):
     # This line must be first
     parameters = dict(locals())
     del parameters['simulator']
-    runner(simulator, timescale, tbpath, parameters)
+    runner(simulator, timescale, tbpath, parameters, profile=profile)
 
 @pytest.mark.parametrize("width_p", [7])
 @pytest.mark.parametrize("simulator", ["verilator"])
@@ -114,19 +105,19 @@ async def add_test(dut, a, b):
 
     # I would like to test numbers that depend on the parameters to
     # the DUT (e.g. width_p), but the parameters are not available
-    # until test runtime, so we occasionally have to pass in strings
-    # that reference the DUT. Hence, these if/else statements (until I
-    # find a better way).
+    # until test runtime, so we occasionally have to pass in functions
+    # of the DUT that compute the value. Hence, these if/else
+    # statements.
     
     if(isinstance(a, int)):
         A = a
     else:
-        A = eval(a)
+        A = a(dut)
 
     if(isinstance(b, int)):
         B = b
     else:
-        B = eval(b)
+        B = b(dut)
     
     dut.a_i.value = A
     dut.b_i.value = B
@@ -134,7 +125,8 @@ async def add_test(dut, a, b):
     await Timer(1, units="ns")
 
     assert_resolvable(dut.sum_o)
-    assert dut.sum_o.value == (A + B) , f"Incorrect Result: {dut.a_i.value} + {dut.b_i.value} != {dut.a_i.value + dut.b_i.value}. Got: {dut.sum_o.value} at Time {get_sim_time(units='ns')}ns."
+    expected = int(golden.adder(len(dut.a_i))[A, B])
+    assert dut.sum_o.value == expected , f"Incorrect Result: {dut.a_i.value} + {dut.b_i.value} != {expected}. Got: {dut.sum_o.value} at Time {get_sim_time(units='ns')}ns."
 
 tf = TestFactory(test_function=add_test)
 
@@ -152,23 +144,23 @@ for a,b in [(1,2), (2,1)]:
     #tf.generate_tests(prefix=f"{test}(a={a},b={b})_")
     tf.generate_tests()
 
-tf.add_option(name='a', optionlist=["(1 << len(dut.a_i)) - 1"])
+tf.add_option(name='a', optionlist=[lambda dut: (1 << len(dut.a_i)) - 1])
 tf.add_option(name='b', optionlist=[1])
 #tf.generate_tests(prefix="carryout(a=maxval,b=1)_")
 tf.generate_tests()
 
 tf.add_option(name='a', optionlist=[1])
-tf.add_option(name='b', optionlist=["(1 << len(dut.a_i)) - 1"])
+tf.add_option(name='b', optionlist=[lambda dut: (1 << len(dut.a_i)) - 1])
 #tf.generate_tests(prefix="carryout(a=1,b=maxval)_")
 tf.generate_tests()
 
-tf.add_option(name='a', optionlist=["(1 << len(dut.a_i)) - 1"])
-tf.add_option(name='b', optionlist=["(1 << len(dut.a_i)) - 1"])
+tf.add_option(name='a', optionlist=[lambda dut: (1 << len(dut.a_i)) - 1])
+tf.add_option(name='b', optionlist=[lambda dut: (1 << len(dut.a_i)) - 1])
 #tf.generate_tests(prefix="carryout(a=maxval,b=maxval)_")
 tf.generate_tests()
 
-tf.add_option(name='a', optionlist=3*["random.randint(0, (1 << len(dut.a_i)) - 1)"])
-tf.add_option(name='b', optionlist=3*["random.randint(0, (1 << len(dut.b_i)) - 1)"])
+tf.add_option(name='a', optionlist=3*[lambda dut: random.randint(0, (1 << len(dut.a_i)) - 1)])
+tf.add_option(name='b', optionlist=3*[lambda dut: random.randint(0, (1 << len(dut.b_i)) - 1)])
 #tf.generate_tests(prefix="random_")
 tf.generate_tests()
 
@@ -1,33 +1,22 @@
-import git
 import os
 import sys
-import git
 
-# I don't like this, but it's convenient.
-_REPO_ROOT = git.Repo(search_parent_directories=True).working_tree_dir
-assert (os.path.exists(_REPO_ROOT)), "REPO_ROOT path must exist"
-sys.path.append(os.path.join(_REPO_ROOT, "util"))
-from utilities import runner, lint, assert_resolvable
+# I don't like this, but it's convenient. util/ is two directories
+# up from every testbench.
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "util"))
+from utilities import runner, lint, assert_resolvable, sweep, check_sweep
+import golden
 tbpath = os.path.dirname(os.path.realpath(__file__))
 
-import pytest
-
 import cocotb
 
-from cocotb.clock import Clock
-from cocotb.regression import TestFactory
 from cocotb.utils import get_sim_time
-from cocotb.triggers import Timer, ClockCycles, RisingEdge, FallingEdge, with_timeout
-from cocotb.types import LogicArray, Range
-from cocotb.binary import BinaryValue
-
-from cocotb_test.simulator import run
-
-from cocotbext.axi import AxiLiteBus, AxiLiteMaster, AxiStreamSink, AxiStreamMonitor, AxiStreamBus
+from cocotb.triggers import Timer
 
-from pytest_utils.decorators import max_score, visibility, tags
+from prelude import pytest, max_score
    
 timescale = "1ps/1ps"
+profile = "fast-compile"
 
 tests = ['init_test',
          'all_test'
@@ -41,7 +30,7 @@ def test_each(test_name, simulator):
     parameters = dict(locals())
     del parameters['test_name']
     del parameters['simulator']
-    runner(simulator, timescale, tbpath, parameters, testname=test_name)
+    runner(simulator, timescale, tbpath, parameters, testname=test_name, batch=tests, profile=profile)
 
 @pytest.mark.parametrize("simulator", ["verilator"])
 @max_score(.4)
@@ -65,7 +54,7 @@ def test_all(simulator):
     # This line must be first
     parameters = dict(locals())
     del parameters['simulator']
-    runner(simulator, timescale, tbpath, parameters)
+    runner(simulator, timescale, tbpath, parameters, profile=profile)
 
 @cocotb.test()
 async def init_test(dut):
@@ -86,32 +75,13 @@ async def all_test(dut):
     hex_i = dut.hex_i
     hex_i.value = 0
 
-    values = {0:BinaryValue(0x40, 7, False),
-              1:BinaryValue(0x79, 7, False),
-              2:BinaryValue(0x24, 7, False),
-              3:BinaryValue(0x30, 7, False),
-              4:BinaryValue(0x19, 7, False),
-              5:BinaryValue(0x12, 7, False),
-              6:BinaryValue(0x02, 7, False),
-              7:BinaryValue(0x78, 7, False),
-              8:BinaryValue(0x00, 7, False),
-              9:BinaryValue(0x18, 7, False),
-              10:BinaryValue(0x08, 7, False),
-              11:BinaryValue(0x03, 7, False),
-              12:BinaryValue(0x46, 7, False),
-              13:BinaryValue(0x21, 7, False),
-              14:BinaryValue(0x06, 7, False),
-              15:BinaryValue(0x0e, 7, False)}
+    values = golden.hex2ssd()
 
     await Timer(1, units="ns")
 
     assert_resolvable(dut.ssd_o)
 
-    for i in range(0, (1 << len(hex_i)) - 1):
-       hex_i.value = i
-
-       await Timer(1, units="ns")
-       assert_resolvable(dut.ssd_o)
-
-       expected = values[hex_i.value.integer]
-       assert dut.ssd_o.value == (expected) , f"Incorrect Result: hex_i == {hex_i.value}. Got: ssd_o == {dut.ssd_o.value} at Time {get_sim_time(units='ns')}ns."
+    # Every input value, checked in one comparison at the end.
+    stimulus = golden.inputs(len(hex_i))
+    captured = await sweep([hex_i], [dut.ssd_o], stimulus)
+    check_sweep(captured, values, stimulus, [hex_i], [dut.ssd_o])
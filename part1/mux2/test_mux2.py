@@ -1,32 +1,23 @@
-import git
 import os
 import sys
-import git
 
-# I don't like this, but it's convenient.
-_REPO_ROOT = git.Repo(search_parent_directories=True).working_tree_dir
-assert (os.path.exists(_REPO_ROOT)), "REPO_ROOT path must exist"
-sys.path.append(os.path.join(_REPO_ROOT, "util"))
+# I don't like this, but it's convenient. util/ is two directories
+# up from every testbench.
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "util"))
 from utilities import runner, lint, assert_resolvable
+import golden
 tbpath = os.path.dirname(os.path.realpath(__file__))
 
-import pytest
-
 import cocotb
 
-from cocotb.clock import Clock
 from cocotb.regression import TestFactory
 from cocotb.utils import get_sim_time
-from cocotb.triggers import Timer, ClockCycles, RisingEdge, FallingEdge, with_timeout
-from cocotb.types import LogicArray, Range
-
-from cocotb_test.simulator import run
-
-from cocotbext.axi import AxiLiteBus, AxiLiteMaster, AxiStreamSink, AxiStreamMonitor, AxiStreamBus
+from cocotb.triggers import Timer
 
-from pytest_utils.decorators import max_score, visibility, tags
+from prelude import pytest, max_score
    
 timescale = "1ps/1ps"
+profile = "fast-compile"
 
 tests = ['init_test',
          'three_input_test_001',
@@ -47,7 +38,7 @@ def test_each(test_name, simulator):
     parameters = dict(locals())
     del parameters['test_name']
     del parameters['simulator']
-    runner(simulator, timescale, tbpath, parameters, testname=test_name)
+    runner(simulator, timescale, tbpath, parameters, testname=test_name, batch=tests, profile=profile)
 
 @pytest.mark.parametrize("simulator", ["verilator"])
 @max_score(.4)
@@ -71,7 +62,7 @@ def test_all(simulator):
     # This line must be first
     parameters = dict(locals())
     del parameters['simulator']
-    runner(simulator, timescale, tbpath, parameters)
+    runner(simulator, timescale, tbpath, parameters, profile=profile)
 
 ### Begin Tests ###
 
@@ -118,8 +109,7 @@ async def three_input_test(dut, a, b, s):
 
     await Timer(1, units="ns")
 
-    # Isn't python nice!
-    c_o = dut.a_i.value if not dut.select_i.value else dut.b_i.value
+    c_o = int(golden.mux2()[A, B, S])
 
     assert_resolvable(dut.c_o)
     assert dut.c_o.value == (c_o) , f"Incorrect Result: c_o for a_i == {dut.a_i.value}, b_i == {dut.b_i.value}, and select_i == {dut.select_i.value}). Got: {dut.c_o.value} at Time {get_sim_time(units='ns')}ns."
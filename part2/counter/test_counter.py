@@ -1,35 +1,29 @@
-import git
 import os
 import sys
-import git
 
-# I don't like this, but it's convenient.
-_REPO_ROOT = git.Repo(search_parent_directories=True).working_tree_dir
-assert (os.path.exists(_REPO_ROOT)), "REPO_ROOT path must exist"
-sys.path.append(os.path.join(_REPO_ROOT, "util"))
+# I don't like this, but it's convenient. util/ is two directories
+# up from every testbench.
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "util"))
 from utilities import runner, lint, assert_resolvable, clock_start_sequence, reset_sequence
+from refspec import RefCheck
+from stream import generate, drive
 tbpath = os.path.dirname(os.path.realpath(__file__))
 
-import pytest
-
 import cocotb
 
-from cocotb.clock import Clock
 from cocotb.regression import TestFactory
 from cocotb.utils import get_sim_time
-from cocotb.triggers import Timer, ClockCycles, RisingEdge, FallingEdge, with_timeout
-from cocotb.types import LogicArray, Range
-
-from cocotb_test.simulator import run
-
-from cocotbext.axi import AxiLiteBus, AxiLiteMaster, AxiStreamSink, AxiStreamMonitor, AxiStreamBus
+from cocotb.triggers import RisingEdge, FallingEdge, with_timeout
+from cocotb.types import LogicArray
 
-from pytest_utils.decorators import max_score, visibility, tags
+from prelude import pytest, max_score
    
 import random
 random.seed(42)
 
+
 timescale = "1ps/1ps"
+profile = "fast-run"
    
 tests = ['reset_test',
          'up_test',
@@ -51,7 +45,7 @@ def test_each(test_name, simulator, width_p):
     parameters = dict(locals())
     del parameters['test_name']
     del parameters['simulator']
-    runner(simulator, timescale, tbpath, parameters, testname=test_name)
+    runner(simulator, timescale, tbpath, parameters, testname=test_name, batch=tests, profile=profile)
 
 # Opposite above, run all the tests in one simulation but reset
 # between tests to ensure that reset is clearing all state.
@@ -62,7 +56,7 @@ def test_all(simulator, width_p):
     # This line must be first
     parameters = dict(locals())
     del parameters['simulator']
-    runner(simulator, timescale, tbpath, parameters)
+    runner(simulator, timescale, tbpath, parameters, profile=profile)
 
 @pytest.mark.parametrize("width_p", [5])
 @pytest.mark.parametrize("simulator", ["verilator"])
@@ -323,6 +317,11 @@ async def underflow_test(dut):
     assert count_o.value.is_resolvable, f"Unresolvable value (x or z in some or all bits) at Time {get_sim_time(units='ns')}ns."
     assert count_o.value == ex_val, f"Incorrect Result: count_o != {ex_val}. Got: {count_o.value} at Time {get_sim_time(units='ns')}ns."
 
+def random_updown():
+    """One random (up_i, down_i) vector."""
+    i = random.randint(0, 4)
+    return (int(i == 1 or i == 3), int(i == 2 or i == 3))
+
 async def fuzz_test(dut, l):
     """Test for Random Input"""
 
@@ -336,6 +335,7 @@ async def fuzz_test(dut, l):
     down_i.value = LogicArray(['x'])
 
     await clock_start_sequence(clk_i)
+    check = RefCheck(dut).start()
     await reset_sequence(clk_i, reset_i, 10)
 
     # set the initial inputs
@@ -344,21 +344,17 @@ async def fuzz_test(dut, l):
 
     await FallingEdge(dut.clk_i)
 
-    seq = [random.randint(0, 4) for i in range(l)]
-    for i in seq:
-        await FallingEdge(dut.clk_i)
-        up_i.value = (i == 1 or i == 3)
-        down_i.value = (i == 2 or i == 3)
+    # Check count_o on every cycle from here on, so that a failure is
+    # reported (and the test stops) at the cycle where it happens.
+    check.enable()
+    await drive(clk_i, [up_i, down_i], generate(l, random_updown))
 
     await FallingEdge(dut.clk_i)
+    check.finish()
 
-    ctrseq = list(range((1<<dut.width_p.value)))
-    idx = seq.count(1) - seq.count(2)
-    idx = idx % len(ctrseq)
-    ex_val = ctrseq[idx]
-    
-    assert count_o.value.is_resolvable, f"Unresolvable value (x or z in some or all bits) at Time {get_sim_time(units='ns')}ns."
-    assert count_o.value == ex_val , f"Incorrect Result: count_o != {ex_val}. Got: {count_o.value} at Time {get_sim_time(units='ns')}ns."
+    expected = check.expected("count_o")
+    assert_resolvable(count_o)
+    assert count_o.value == expected , f"Incorrect Result: count_o != {expected}. Got: {count_o.value} at Time {get_sim_time(units='ns')}ns."
 
 tf = TestFactory(test_function=fuzz_test)
 tf.add_option(name='l', optionlist=[10, 100, 1000])
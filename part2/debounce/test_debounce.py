@@ -1,40 +1,34 @@
-import git
 import os
 import sys
-import git
 
 from math import log, ceil
 
-# I don't like this, but it's convenient.
-_REPO_ROOT = git.Repo(search_parent_directories=True).working_tree_dir
-assert (os.path.exists(_REPO_ROOT)), "REPO_ROOT path must exist"
-sys.path.append(os.path.join(_REPO_ROOT, "util"))
+# I don't like this, but it's convenient. util/ is two directories
+# up from every testbench.
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "util"))
 from utilities import runner, lint, assert_resolvable, clock_start_sequence, reset_sequence
+from stream import generate, tap, drive
+from refspec import RefCheck
 tbpath = os.path.dirname(os.path.realpath(__file__))
 
-import pytest
-
 import cocotb
 
-from cocotb.clock import Clock
-from cocotb.regression import TestFactory
 from cocotb.utils import get_sim_time
-from cocotb.triggers import Timer, ClockCycles, RisingEdge, FallingEdge, with_timeout
-from cocotb.types import LogicArray, Range
+from cocotb.triggers import RisingEdge, FallingEdge, with_timeout
+from cocotb.types import LogicArray
 from cocotb.result import SimTimeoutError
-from cocotb_test.simulator import run
-
-from cocotbext.axi import AxiLiteBus, AxiLiteMaster, AxiStreamSink, AxiStreamMonitor, AxiStreamBus
 
-from pytest_utils.decorators import max_score, visibility, tags
+from prelude import pytest, max_score
    
 import random
 random.seed(42)
 timescale = "1ps/1ps"
+profile = "fast-run"
 tests = ['reset_test',
          'min_delay_test',
          'max_delay_test',
-         'noise_test'
+         'noise_test',
+         'fuzz_test'
          ]
 
 @pytest.mark.parametrize("min_delay_p", [10, 500, 1000])
@@ -46,7 +40,7 @@ def test_each(test_name, simulator, min_delay_p):
     parameters = dict(locals())
     del parameters['test_name']
     del parameters['simulator']
-    runner(simulator, timescale, tbpath, parameters, testname=test_name)
+    runner(simulator, timescale, tbpath, parameters, testname=test_name, batch=tests, profile=profile)
 
 # Opposite above, run all the tests in one simulation but reset
 # between tests to ensure that reset is clearing all state.
@@ -57,7 +51,7 @@ def test_all(simulator, min_delay_p):
     # This line must be first
     parameters = dict(locals())
     del parameters['simulator']
-    runner(simulator, timescale, tbpath, parameters)
+    runner(simulator, timescale, tbpath, parameters, profile=profile)
 
 @pytest.mark.parametrize("min_delay_p", [10])
 @pytest.mark.parametrize("simulator", ["verilator"])
@@ -201,19 +195,23 @@ async def noise_test(dut):
 
     button_i.value = LogicArray(['1'])
 
-    seq = [random.randint(0, 1) for i in range(min_delay_p)]
-    for i in seq:
-        await FallingEdge(dut.clk_i)
-        button_i.value = i
+    # Only the last value, and how long ago the last 0 was, matter.
+    last = {"value": None, "zero": None}
+    def track(i, v):
+        last["value"] = v
+        if(v == 0):
+            last["zero"] = i
+    await drive(clk_i, [button_i], tap(generate(min_delay_p, lambda: random.randint(0, 1)), track))
+    since_zero = None if last["zero"] is None else min_delay_p - 1 - last["zero"]
 
     await RisingEdge(dut.clk_i)
-    if(seq[-1] == 0):
+    if(last["value"] == 0):
         button_i.value = 1
         mindelay = cocotb.start_soon(with_timeout(wait_for(dut, value=1), min_delay_p - 1, 'ns'))
         maxdelay = cocotb.start_soon(with_timeout(wait_for(dut, value=1), (1 << ceil(log(min_delay_p, 2))) + 1, 'ns'))
     else:
-        mindelay = cocotb.start_soon(with_timeout(wait_for(dut, value=1), min_delay_p - seq[::-1].index(0) - 1, 'ns'))
-        maxdelay = cocotb.start_soon(with_timeout(wait_for(dut, value=1), (1 << ceil(log(min_delay_p, 2))) - seq[::-1].index(0) +1, 'ns'))
+        mindelay = cocotb.start_soon(with_timeout(wait_for(dut, value=1), min_delay_p - since_zero - 1, 'ns'))
+        maxdelay = cocotb.start_soon(with_timeout(wait_for(dut, value=1), (1 << ceil(log(min_delay_p, 2))) - since_zero +1, 'ns'))
 
     try:
         await mindelay
@@ -227,3 +225,37 @@ async def noise_test(dut):
         assert_resolvable(button_o)
         assert button_o.value == 1 , f"Too Late! button_o != {1}. Got: {button_o.value} at Time {get_sim_time(units='ns')}ns."
 
+def sticky(n, flip):
+    """n button values, where each cycle flips the last one with probability flip."""
+    v = 0
+    for i in range(n):
+        if(random.random() < flip):
+            v = 1 - v
+        yield v
+
+@cocotb.test()
+async def fuzz_test(dut):
+    """Test random presses and bounces against the reference model"""
+
+    reset_i = dut.reset_i
+    button_i = dut.button_i
+    clk_i = dut.clk_i
+    min_delay_p = dut.min_delay_p.value
+
+    await clock_start_sequence(clk_i)
+
+    button_i.value = LogicArray(['x'])
+    check = RefCheck(dut).start()
+
+    await reset_sequence(clk_i, reset_i, 10)
+
+    button_i.value = 0
+
+    await FallingEdge(clk_i)
+
+    # Runs average twice min_delay_p, so the button is held long
+    # enough to register about half the time.
+    check.enable()
+    await drive(clk_i, [button_i], sticky(8 * min_delay_p, 1 / (2 * min_delay_p)))
+    await RisingEdge(clk_i)
+    check.finish()
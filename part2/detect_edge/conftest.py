@@ -1,4 +1,6 @@
-# Nothing special here, just specifying how to print test parameters
-# as part of the test name.
-def pytest_make_parametrize_id(config, val, argname):
-    return f"{argname}={val}"
+# Shared pytest hooks: test names, and per-test results from batched
+# simulations, see util/simreport.py
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "util"))
+from simreport import pytest_make_parametrize_id, pytest_runtest_makereport
@@ -1,38 +1,31 @@
-import git
 import os
 import sys
-import git
 
-# I don't like this, but it's convenient.
-_REPO_ROOT = git.Repo(search_parent_directories=True).working_tree_dir
-assert (os.path.exists(_REPO_ROOT)), "REPO_ROOT path must exist"
-sys.path.append(os.path.join(_REPO_ROOT, "util"))
+# I don't like this, but it's convenient. util/ is two directories
+# up from every testbench.
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "util"))
 from utilities import runner, lint, assert_resolvable, clock_start_sequence, reset_sequence
+from stream import generate, drive
+from refspec import RefCheck
 tbpath = os.path.dirname(os.path.realpath(__file__))
 
-import pytest
-
 import cocotb
 
-from cocotb.clock import Clock
-from cocotb.regression import TestFactory
 from cocotb.utils import get_sim_time
-from cocotb.triggers import Timer, ClockCycles, RisingEdge, FallingEdge, with_timeout
-from cocotb.types import LogicArray, Range
-
-from cocotb_test.simulator import run
-
-from cocotbext.axi import AxiLiteBus, AxiLiteMaster, AxiStreamSink, AxiStreamMonitor, AxiStreamBus
+from cocotb.triggers import RisingEdge, FallingEdge
+from cocotb.types import LogicArray
 
-from pytest_utils.decorators import max_score, visibility, tags
+from prelude import pytest, max_score
    
 import random
 random.seed(42)
 
 timescale = "1ps/1ps"
+profile = "fast-run"
 tests = ['reset_test',
          'posedge_test',
-         'negedge_test'
+         'negedge_test',
+         'fuzz_test'
          ]
 
 
@@ -44,7 +37,7 @@ def test_each(test_name, simulator):
     parameters = dict(locals())
     del parameters['test_name']
     del parameters['simulator']
-    runner(simulator, timescale, tbpath, parameters, testname=test_name)
+    runner(simulator, timescale, tbpath, parameters, testname=test_name, batch=tests, profile=profile)
 
 # Opposite above, run all the tests in one simulation but reset
 # between tests to ensure that reset is clearing all state.
@@ -54,7 +47,7 @@ def test_all(simulator):
     # This line must be first
     parameters = dict(locals())
     del parameters['simulator']
-    runner(simulator, timescale, tbpath, parameters)
+    runner(simulator, timescale, tbpath, parameters, profile=profile)
 
 @pytest.mark.parametrize("simulator", ["verilator"])
 @max_score(.4)
@@ -201,3 +194,27 @@ async def negedge_test(dut):
         await RisingEdge(dut.clk_i)
         assert_resolvable(unbutton_o)
         assert unbutton_o.value == 0 , f"Incorrect Result: unbutton_o != {0}. Got: {button_o.value} at Time {get_sim_time(units='ns')}ns."
+
+@cocotb.test()
+async def fuzz_test(dut):
+    """Test random input against the reference model"""
+
+    reset_i = dut.reset_i
+    button_i = dut.button_i
+    clk_i = dut.clk_i
+
+    await clock_start_sequence(clk_i)
+
+    button_i.value = LogicArray(['x'])
+    check = RefCheck(dut).start()
+
+    await reset_sequence(clk_i, reset_i, 10)
+
+    button_i.value = 0
+
+    await FallingEdge(clk_i)
+
+    check.enable()
+    await drive(clk_i, [button_i], generate(1000, lambda: random.randint(0, 1)))
+    await RisingEdge(clk_i)
+    check.finish()
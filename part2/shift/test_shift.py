@@ -1,35 +1,30 @@
-import git
 import os
 import sys
-import git
+from unittest import mock
 
-# I don't like this, but it's convenient.
-_REPO_ROOT = git.Repo(search_parent_directories=True).working_tree_dir
-assert (os.path.exists(_REPO_ROOT)), "REPO_ROOT path must exist"
-sys.path.append(os.path.join(_REPO_ROOT, "util"))
+# I don't like this, but it's convenient. util/ is two directories
+# up from every testbench.
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "util"))
 from utilities import runner, lint, assert_resolvable, clock_start_sequence, reset_sequence
+from models import ClockMonitor
+from refspec import get_model, RefCheck
+from stream import generate, drive
 tbpath = os.path.dirname(os.path.realpath(__file__))
 
-import pytest
-
 import cocotb
 
-from cocotb.clock import Clock
 from cocotb.regression import TestFactory
 from cocotb.utils import get_sim_time
-from cocotb.triggers import Timer, ClockCycles, RisingEdge, FallingEdge, with_timeout
-from cocotb.types import LogicArray, Range
-
-from cocotb_test.simulator import run
-
-from cocotbext.axi import AxiLiteBus, AxiLiteMaster, AxiStreamSink, AxiStreamMonitor, AxiStreamBus
+from cocotb.triggers import RisingEdge, FallingEdge
+from cocotb.types import LogicArray
 
-from pytest_utils.decorators import max_score, visibility, tags
+from prelude import pytest, max_score
    
 import random
 random.seed(42)
    
 timescale = "1ps/1ps"
+profile = "fast-run"
 
 tests = ['reset_test',
          'en_tick_test',
@@ -46,7 +41,7 @@ def test_each(test_name, simulator, width_p, reset_val_p):
     parameters = dict(locals())
     del parameters['test_name']
     del parameters['simulator']
-    runner(simulator, timescale, tbpath, parameters, testname=test_name)
+    runner(simulator, timescale, tbpath, parameters, testname=test_name, batch=tests, profile=profile)
 
 @pytest.mark.parametrize("width_p,reset_val_p", [(2, 1), (2, 0), (5, 63)])
 @pytest.mark.parametrize("simulator", ["verilator", "icarus"])
@@ -55,7 +50,21 @@ def test_all(simulator, width_p, reset_val_p):
     # This line must be first
     parameters = dict(locals())
     del parameters['simulator']
-    runner(simulator, timescale, tbpath, parameters)
+    runner(simulator, timescale, tbpath, parameters, profile=profile)
+
+# Every reset after the first restores a snapshot (see
+# util/snapshot.py), which the reference models must still see. These
+# parameters are used by no other test, so that they get a model, and
+# snapshots, of their own.
+@pytest.mark.parametrize("width_p,reset_val_p", [(3, 5)])
+@pytest.mark.parametrize("simulator", ["verilator", "icarus"])
+@max_score(0)
+def test_snapshot(simulator, width_p, reset_val_p):
+    # This line must be first
+    parameters = dict(locals())
+    del parameters['simulator']
+    with mock.patch.dict(os.environ, {"SIM_SNAPSHOT": "1"}):
+        runner(simulator, timescale, tbpath, parameters, profile=profile)
 
 @pytest.mark.parametrize("width_p,reset_val_p", [(5, 63)])
 @pytest.mark.parametrize("simulator", ["verilator"])
@@ -95,8 +104,8 @@ async def reset_test(dut):
 
     await clock_start_sequence(clk_i)
 
-    model = ShiftModel(dut.width_p, dut.reset_val_p, clk_i, reset_i, enable_i, d_i, data_i, load_i, data_o)
-    model.start()
+    model = ShiftModel(dut.width_p.value, dut.reset_val_p.value)
+    ClockMonitor(clk_i, reset_i=reset_i, enable_i=enable_i, d_i=d_i, load_i=load_i, data_i=data_i).start(model)
 
     d_i.value = 0
     enable_i.value = 0
@@ -129,8 +138,8 @@ async def load_test(dut):
 
     await clock_start_sequence(clk_i)
 
-    model = ShiftModel(dut.width_p, dut.reset_val_p, clk_i, reset_i, enable_i, d_i, data_i, load_i, data_o)
-    model.start()
+    model = ShiftModel(dut.width_p.value, dut.reset_val_p.value)
+    ClockMonitor(clk_i, reset_i=reset_i, enable_i=enable_i, d_i=d_i, load_i=load_i, data_i=data_i).start(model)
 
     d_i.value = 0
     enable_i.value = 0
@@ -148,7 +157,7 @@ async def load_test(dut):
     await RisingEdge(clk_i)
 
     assert_resolvable(data_o)
-    assert data_o.value == model._data_o, f"Incorrect Result: data_o != {model._data_o}. Got: {data_o.value} at Time {get_sim_time(units='ns')}ns."
+    assert data_o.value == model.state, f"Incorrect Result: data_o != {model.state}. Got: {data_o.value} at Time {get_sim_time(units='ns')}ns."
 
 
 @cocotb.test()
@@ -168,8 +177,8 @@ async def en_tick_test(dut):
 
     await clock_start_sequence(clk_i)
 
-    model = ShiftModel(dut.width_p, dut.reset_val_p, clk_i, reset_i, enable_i, d_i, data_i, load_i, data_o)
-    model.start()
+    model = ShiftModel(dut.width_p.value, dut.reset_val_p.value)
+    ClockMonitor(clk_i, reset_i=reset_i, enable_i=enable_i, d_i=d_i, load_i=load_i, data_i=data_i).start(model)
 
     d_i.value = 0
     enable_i.value = 0
@@ -186,7 +195,7 @@ async def en_tick_test(dut):
     await RisingEdge(clk_i)
 
     assert_resolvable(data_o)
-    assert data_o.value == model._data_o, f"Incorrect Result: data_o != {model._data_o}. Got: {data_o.value} at Time {get_sim_time(units='ns')}ns."
+    assert data_o.value == model.state, f"Incorrect Result: data_o != {model.state}. Got: {data_o.value} at Time {get_sim_time(units='ns')}ns."
 
 
     # Then do the same test, but shift in a 0
@@ -200,7 +209,7 @@ async def en_tick_test(dut):
     await RisingEdge(clk_i)
 
     assert_resolvable(data_o)
-    assert data_o.value == model._data_o, f"Incorrect Result: data_o != {model._data_o}. Got: {data_o.value} at Time {get_sim_time(units='ns')}ns."
+    assert data_o.value == model.state, f"Incorrect Result: data_o != {model.state}. Got: {data_o.value} at Time {get_sim_time(units='ns')}ns."
 
 
 
@@ -221,8 +230,8 @@ async def bangen_tick_test(dut):
 
     await clock_start_sequence(clk_i)
 
-    model = ShiftModel(dut.width_p, dut.reset_val_p, clk_i, reset_i, enable_i, d_i, data_i, load_i, data_o)
-    model.start()
+    model = ShiftModel(dut.width_p.value, dut.reset_val_p.value)
+    ClockMonitor(clk_i, reset_i=reset_i, enable_i=enable_i, d_i=d_i, load_i=load_i, data_i=data_i).start(model)
 
     d_i.value = 0
     enable_i.value = 0
@@ -238,11 +247,11 @@ async def bangen_tick_test(dut):
 
     await RisingEdge(clk_i)
     assert_resolvable(data_o)
-    assert data_o.value == model._data_o, f"Incorrect Result: data_o != {model._data_o}. Got: {data_o.value} at Time {get_sim_time(units='ns')}ns."
+    assert data_o.value == model.state, f"Incorrect Result: data_o != {model.state}. Got: {data_o.value} at Time {get_sim_time(units='ns')}ns."
 
     await RisingEdge(clk_i)
     assert_resolvable(data_o)
-    assert data_o.value == model._data_o, f"Incorrect Result: data_o != {model._data_o}. Got: {data_o.value} at Time {get_sim_time(units='ns')}ns."
+    assert data_o.value == model.state, f"Incorrect Result: data_o != {model.state}. Got: {data_o.value} at Time {get_sim_time(units='ns')}ns."
 
     # Then do the same test, but "shift" in a 0
     await reset_sequence(clk_i, reset_i, 10)
@@ -254,11 +263,11 @@ async def bangen_tick_test(dut):
 
     await RisingEdge(clk_i)
     assert_resolvable(data_o)
-    assert data_o.value == model._data_o, f"Incorrect Result: data_o != {model._data_o}. Got: {data_o.value} at Time {get_sim_time(units='ns')}ns."
+    assert data_o.value == model.state, f"Incorrect Result: data_o != {model.state}. Got: {data_o.value} at Time {get_sim_time(units='ns')}ns."
 
     await RisingEdge(clk_i)
     assert_resolvable(data_o)
-    assert data_o.value == model._data_o, f"Incorrect Result: data_o != {model._data_o}. Got: {data_o.value} at Time {get_sim_time(units='ns')}ns."
+    assert data_o.value == model.state, f"Incorrect Result: data_o != {model.state}. Got: {data_o.value} at Time {get_sim_time(units='ns')}ns."
 
 async def free_run_test(dut, l):
     """Test l cycles of the shift register"""
@@ -276,8 +285,7 @@ async def free_run_test(dut, l):
 
     await clock_start_sequence(clk_i)
 
-    model = ShiftModel(dut.width_p, dut.reset_val_p, clk_i, reset_i, enable_i, d_i, data_i, load_i, data_o)
-    model.start()
+    check = RefCheck(dut).start()
 
     d_i.value = 0
     enable_i.value = 0
@@ -288,66 +296,19 @@ async def free_run_test(dut, l):
 
     await FallingEdge(clk_i)
 
-    ens = [random.randint(0, 1) for i in range(l)]
-    ds  = [random.randint(0, 1) for i in range(l)]
-    datas  = [random.randint(0, 1) for i in range(l)]
-    loads  = [random.randint(0, 10) for i in range(l)]
-    seq = zip(ens, ds, datas, loads)
-    for (en, d, data, load) in seq:
+    def vector():
+        # (enable_i, d_i, data_i, load_i), loading about one cycle in 11.
+        return (random.randint(0, 1), random.randint(0, 1), random.randint(0, 1), int(random.randint(0, 10) == 1))
 
-        await FallingEdge(clk_i)
-        enable_i.value = (en == 1)
-        d_i.value = d
-        data_i.value = data
-        load_i.value = (load == 1)
-
-        await RisingEdge(clk_i)
-        assert_resolvable(data_o)
-        assert data_o.value == model._data_o, f"Incorrect Result: data_o != {model._data_o}. Got: {data_o.value} at Time {get_sim_time(units='ns')}ns."
+    check.enable()
+    await drive(clk_i, [enable_i, d_i, data_i, load_i], generate(l, vector))
+    await RisingEdge(clk_i)
+    check.finish()
 
            
 tf = TestFactory(test_function=free_run_test)
 tf.add_option(name='l', optionlist=[100])
 tf.generate_tests()
 
-class ShiftModel():
-    def __init__(self, width_p, reset_val_p, clk_i, reset_i, enable_i, d_i, data_i, load_i, data_o):
-                 
-        self._width_p = width_p
-        self._reset_val_p = reset_val_p
-        self._clk_i = clk_i
-        self._reset_i = reset_i
-        self._enable_i = enable_i
-        self._d_i = d_i
-        self._load_i = load_i
-        self._data_i = data_i
-        self._coro_run = None
-        self._nstate = 0
-        self._data_o = 0
-
-    def start(self):
-        """Start model"""
-        if self._coro_run is not None:
-            raise RuntimeError("Model already started")
-        self._coro_run = cocotb.start_soon(self._run())
-
-    async def _run(self):
-        mask = (1 << self._width_p.value) -1
-        print(mask)
-
-        while True:
-            await RisingEdge(self._clk_i)
-            if(self._reset_i.value.is_resolvable and (self._reset_i.value == 1)):
-                self._nstate = self._reset_val_p.value
-            elif(self._load_i.value.is_resolvable and (self._load_i.value == 1)):
-                self._nstate = self._data_i.value
-            elif(self._enable_i.value.is_resolvable and (self._enable_i.value == 1)):
-                self._nstate = ((self._data_o << 1) | self._d_i.value) & mask
-
-            await FallingEdge(self._clk_i)
-            self._data_o = self._nstate
-
-    def stop(self) -> None:
-        """Stop monitor"""
-        if self._coro_run is None:
-            raise RuntimeError("Monitor never started")
+# The same model is compiled into Verilator with SIM_REFMODEL=native.
+ShiftModel = get_model("shift")
@@ -0,0 +1,196 @@
+# Cross-simulator benchmark.
+#
+# For every module suite, every parameter set its test_all is
+# parametrized with (e.g. the width_p or min_delay_p sweep), and every
+# simulator, measures:
+#   build    -- wall time of a cold build (into an empty build cache,
+#               with the object cache, see objcache.py, off)
+#   cycles/s -- simulated clock cycles per second of wall time, over
+#               all of the module's cocotb tests in one simulation
+#   memory   -- peak RSS of the build, and of the simulation
+#
+# Each point is measured in its own child processes, so the peak RSS
+# of the compiler and of the simulator are measured separately.
+#
+# Results are printed as a table, one row per module and parameter
+# set, with the simulators side by side, and written to bench.json.
+# With a baseline (saved from an earlier run with --save-baseline),
+# every metric that got worse by more than the threshold is flagged.
+#
+# Usage (from the repository root, or a module directory):
+#   python3 util/bench.py [-k EXPR] [-b baseline.json] [--save-baseline] [-t 0.2] [DIR ...]
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+
+UTIL = os.path.dirname(os.path.realpath(__file__))
+
+# Metrics, and whether bigger is better.
+METRICS = {"build_s": False, "cycles_per_sec": True, "build_mb": False, "sim_mb": False}
+
+def _point(job, build_root, build_only):
+    """ Run one benchmark step in this process, and print the result.
+    Called in a child process, see measure()."""
+    import regress
+    import timing
+    from utilities import simulate
+
+    mod = regress._import(job)
+    os.environ["SIM_BUILD_ROOT"] = build_root
+    # The object cache (or ccache) outlives build_root, and would make
+    # every build after the first a warm C++ build.
+    os.environ["SIM_OBJCACHE"] = "0"
+    os.chdir(job.tbpath)
+    failed = False
+    try:
+        simulate(job.simulator, job.timescale, job.tbpath, job.parameters, [], None,
+                 "bench", compile_only=build_only, pymodule=mod.__name__, profile=job.profile)
+    except (AssertionError, SystemExit):
+        failed = True
+
+    entries = timing.take()
+    rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    print(json.dumps({"entry": entries[-1] if entries else None, "rss_mb": rss, "failed": failed}))
+
+def _child(job, build_root, build_only):
+    """Run _point in a fresh interpreter, and get its result."""
+    args = json.dumps({"nodeid": job.nodeid, "path": job.path, "func": job.func,
+                       "params": job.params, "timescale": job.timescale, "profile": job.profile})
+    cmd = [sys.executable, os.path.join(UTIL, "bench.py"), "--point", args, build_root]
+    if(build_only):
+        cmd.append("--build-only")
+    p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    lines = p.stdout.strip().splitlines()
+    return json.loads(lines[-1]) if (p.returncode == 0 and lines) else {"entry": None, "rss_mb": 0.0, "failed": True}
+
+def measure(job):
+    """ Benchmark one (module, simulator, parameters) point.
+
+    Arguments:
+    job -- test_all Job from regress.collect
+    """
+    build_root = tempfile.mkdtemp(prefix="bench-")
+    try:
+        build = _child(job, build_root, True)
+        run = _child(job, build_root, False)
+    finally:
+        shutil.rmtree(build_root, ignore_errors=True)
+
+    entry = run["entry"] or {}
+    return {"module": os.path.basename(job.tbpath),
+            "simulator": job.simulator,
+            "parameters": {k: str(v) for (k, v) in sorted(job.parameters.items())},
+            "build_s": (build["entry"] or {}).get("phases", {}).get("compile", 0.0),
+            "cycles_per_sec": entry.get("cycles_per_sec", 0.0),
+            "build_mb": build["rss_mb"],
+            "sim_mb": run["rss_mb"],
+            "failed": build["failed"] or run["failed"]}
+
+def _key(r):
+    return (r["module"], r["simulator"], json.dumps(r["parameters"], sort_keys=True))
+
+def compare(results, baseline, threshold):
+    """ Get the regressions against a baseline.
+
+    Returns a list of (result, metric, baseline value, new value) for
+    every metric that got worse by more than threshold.
+
+    Arguments:
+    results -- list of results from measure
+    baseline -- list of results from an earlier run
+    threshold -- Allowed relative change (e.g. 0.2 for 20%)
+    """
+    old = {_key(r): r for r in baseline}
+    regressions = []
+    for r in results:
+        b = old.get(_key(r))
+        if(b is None or r["failed"] or b["failed"]):
+            continue
+        for (m, bigger_is_better) in METRICS.items():
+            if(not b.get(m)):
+                continue
+            change = (r[m] - b[m]) / b[m]
+            if((-change if bigger_is_better else change) > threshold):
+                regressions.append((r, m, b[m], r[m]))
+    return regressions
+
+def table(results):
+    """ Format results as a table, with the simulators side by side.
+
+    Arguments:
+    results -- list of results from measure
+    """
+    sims = sorted({r["simulator"] for r in results})
+    rows = {}
+    for r in results:
+        rows.setdefault((r["module"], json.dumps(r["parameters"], sort_keys=True)), {})[r["simulator"]] = r
+
+    header = f"{'module':12} {'parameters':32}"
+    for s in sims:
+        header += f" | {s + ' build':>16} {'cycles/s':>12} {'MB':>6}"
+    lines = [header + " | faster", "-" * len(header)]
+    for ((module, params), by_sim) in sorted(rows.items()):
+        params = ",".join(f"{k}={v}" for (k, v) in json.loads(params).items())
+        line = f"{module:12} {params:32}"
+        for s in sims:
+            r = by_sim.get(s)
+            if(r is None or r["failed"]):
+                line += f" | {'failed' if r else '-':>16} {'':>12} {'':>6}"
+            else:
+                line += f" | {r['build_s']:>15.2f}s {r['cycles_per_sec']:>12,.0f} {r['sim_mb']:>6.0f}"
+        ok = [r for r in by_sim.values() if not r["failed"] and r["cycles_per_sec"] > 0]
+        line += " | " + (max(ok, key=lambda r: r["cycles_per_sec"])["simulator"] if ok else "-")
+        lines.append(line)
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every module on every simulator.")
+    parser.add_argument("paths", nargs="*", default=["."], help="Module directories to benchmark (default: .)")
+    parser.add_argument("-k", dest="keyword", default=None, help="Only benchmark test_all points matching this pytest -k expression")
+    parser.add_argument("-o", "--output", default="bench.json", help="Results file")
+    parser.add_argument("-b", "--baseline", default="bench_baseline.json", help="Baseline to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Save the results as the new baseline")
+    parser.add_argument("-t", "--threshold", type=float, default=0.2, help="Relative change that counts as a regression")
+    parser.add_argument("--point", help=argparse.SUPPRESS)
+    parser.add_argument("--build-only", action="store_true", help=argparse.SUPPRESS)
+    (args, rest) = parser.parse_known_args(argv)
+
+    if(args.point is not None):
+        import regress
+        _point(regress.Job(**json.loads(args.point)), rest[0], args.build_only)
+        return 0
+
+    import regress
+    keyword = "test_all" if args.keyword is None else f"test_all and ({args.keyword})"
+    jobs = [j for j in regress.collect(args.paths, keyword) if j.func == "test_all"]
+
+    results = []
+    for job in jobs:
+        r = measure(job)
+        results.append(r)
+        print(f"{'FAILED' if r['failed'] else 'DONE':6} {r['module']} {r['simulator']} {r['parameters']}", flush=True)
+
+    with open(args.output, "w") as fd:
+        json.dump(results, fd, indent=2)
+    print(table(results))
+
+    status = 0
+    if(os.path.exists(args.baseline)):
+        with open(args.baseline) as fd:
+            regressions = compare(results, json.load(fd), args.threshold)
+        for (r, m, old, new) in regressions:
+            print(f"REGRESSION {r['module']} {r['simulator']} {r['parameters']}: {m} {old:,.2f} -> {new:,.2f}")
+        status = 1 if regressions else 0
+    if(args.save_baseline):
+        with open(args.baseline, "w") as fd:
+            json.dump(results, fd, indent=2)
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+# Import-time benchmark for the testbench modules.
+#
+# Imports each test_*.py in a fresh interpreter, the way pytest does
+# on the host and the way cocotb does inside a simulation, and reports
+# the median import time of each. The simulation case is imitated by
+# setting cocotb.top before the import (see prelude.py); the time to
+# import cocotb itself is reported separately, since every simulation
+# pays it regardless of the testbench.
+#
+# Usage (from the repository root, or a module directory):
+#   python3 util/bench_import.py [-n REPEAT] [DIR ...]
+
+import os
+import sys
+import glob
+import argparse
+import statistics
+import subprocess
+
+UTIL = os.path.dirname(os.path.realpath(__file__))
+
+_SCRIPT = """
+import sys, time
+sys.path[:0] = [{util!r}, {tbpath!r}]
+start = time.perf_counter()
+import cocotb
+cocotb_time = time.perf_counter() - start
+if {sim}:
+    cocotb.top = object()
+start = time.perf_counter()
+import {module}
+print(cocotb_time, time.perf_counter() - start)
+"""
+
+def time_import(path, sim):
+    """ Import a testbench module in a fresh interpreter.
+
+    Returns (cocotb, module) import times in seconds, or None if the
+    import failed.
+
+    Arguments:
+    path -- Path to the test_*.py file
+    sim -- Imitate the import inside a simulation
+    """
+    script = _SCRIPT.format(util=UTIL, tbpath=os.path.dirname(path), sim=sim,
+                            module=os.path.splitext(os.path.basename(path))[0])
+    p = subprocess.run([sys.executable, "-c", script], cwd=os.path.dirname(path),
+                       stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    if(p.returncode != 0):
+        return None
+    return tuple(float(t) for t in p.stdout.split())
+
+def bench(path, repeat):
+    """ Get the median (cocotb, module) import times, on the host and in
+    a simulation, for one testbench.
+
+    Arguments:
+    path -- Path to the test_*.py file
+    repeat -- Number of imports to take the median of
+    """
+    result = {}
+    for (mode, sim) in (("host", False), ("sim", True)):
+        times = [time_import(path, sim) for i in range(repeat)]
+        if(None in times):
+            result[mode] = None
+        else:
+            result[mode] = tuple(statistics.median(t[i] for t in times) for i in range(2))
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the import time of the testbench modules.")
+    parser.add_argument("paths", nargs="*", default=["."], help="Module directories to search (default: .)")
+    parser.add_argument("-n", "--repeat", type=int, default=5, help="Imports per module and mode")
+    args = parser.parse_args(argv)
+
+    paths = sorted(p for d in args.paths for p in glob.glob(os.path.join(d, "**", "test_*.py"), recursive=True))
+    fmt = lambda t: "failed" if t is None else f"{t[1] * 1000:8.1f}ms"
+    print(f"{'module':40} {'host':>10} {'sim':>10}  (cocotb itself)")
+    for p in paths:
+        r = bench(p, args.repeat)
+        base = next((t[0] for t in r.values() if t is not None), None)
+        base = "" if base is None else f"({base * 1000:.1f}ms)"
+        print(f"{os.path.relpath(p):40} {fmt(r['host']):>10} {fmt(r['sim']):>10}  {base}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
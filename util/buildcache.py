@@ -0,0 +1,256 @@
+# Content-addressed build cache for runner().
+#
+# A compiled model (a Verilator obj_dir, or an Icarus sim.vvp) is
+# identified by a hash of everything that goes into it: the contents
+# of every source file, the top module, parameters, defines, compile
+# arguments, timescale, and the simulator and cocotb versions. Every
+# test_each/test_all invocation with the same configuration shares
+# one build directory, including across pytest sessions.
+#
+# Cache entries live in <tbpath>/build/<simulator>/<key>. An entry is
+# only considered built once its manifest (cache.json) exists, and
+# the manifest is written after a successful compile. When a new
+# entry is created, older entries with the same configuration (i.e.
+# built from older versions of the sources) are evicted, and the
+# cache is capped at MAX_ENTRIES entries, least recently used first.
+#
+# Entries are protected by a lock file next to the entry: the build
+# happens under an exclusive lock, and the simulation runs under a
+# shared lock so that eviction never removes a model that is in use.
+# Eviction removes the lock file with the entry, while holding it, so
+# whoever was waiting on it opens it again (see _lock).
+
+import os
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import subprocess
+from contextlib import contextmanager
+from functools import lru_cache
+
+MANIFEST = "cache.json"
+MAX_ENTRIES = 32
+
+# Digests of source files, keyed by (path, mtime, size), so that
+# each file is only hashed once per process.
+_file_digests = {}
+
+@lru_cache(maxsize=None)
+def get_simulator_version(simulator):
+    """ Get the version string of a simulator, or "unknown".
+
+    Arguments:
+    simulator -- Simulator name, as passed to cocotb_test (e.g. "verilator")
+    """
+    if simulator.startswith("verilator"):
+        cmd = [os.environ.get("VERILATOR", "verilator"), "--version"]
+    elif simulator.startswith("icarus"):
+        cmd = [os.environ.get("IVERILOG", "iverilog"), "-V"]
+    else:
+        return "unknown"
+
+    try:
+        out = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True).stdout
+    except OSError:
+        return "unknown"
+    lines = out.strip().splitlines()
+    return lines[0] if lines else "unknown"
+
+@lru_cache(maxsize=None)
+def get_cocotb_version():
+    """ Get the version of cocotb that will be linked into the model."""
+    try:
+        import cocotb
+        return cocotb.__version__
+    except ImportError:
+        return "unknown"
+
+def hash_file(path):
+    """ Get the sha256 digest of the contents of a file.
+
+    Arguments:
+    path -- Path to the file
+    """
+    st = os.stat(path)
+    memo = (path, st.st_mtime_ns, st.st_size)
+    if memo not in _file_digests:
+        h = hashlib.sha256()
+        with open(path, "rb") as fd:
+            for chunk in iter(lambda: fd.read(1 << 16), b""):
+                h.update(chunk)
+        _file_digests[memo] = h.hexdigest()
+    return _file_digests[memo]
+
+def hash_config(config):
+    """ Get the sha256 digest of a json-serializable configuration.
+
+    Arguments:
+    config -- dict of configuration values
+    """
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+def get_build_config(simulator, toplevel, parameters, defines, compile_args, timescale, **extra):
+    """ Get the configuration of a build, everything except the source contents.
+
+    Arguments:
+    simulator -- Simulator name
+    toplevel -- Name of the top level module
+    parameters -- dict of top level parameters
+    defines -- list of preprocessor defines
+    compile_args -- list of extra compiler arguments
+    timescale -- Timescale string (e.g. "1ps/1ps")
+    extra -- Anything else that changes the compiled model (e.g. waves)
+    """
+    config = {"simulator": simulator,
+              "simulator_version": get_simulator_version(simulator),
+              "cocotb_version": get_cocotb_version(),
+              "toplevel": toplevel,
+              "parameters": {k: str(v) for k, v in parameters.items()},
+              "defines": list(defines),
+              "compile_args": list(compile_args),
+              "timescale": timescale}
+    config.update(extra)
+    return config
+
+def get_build_key(config, sources):
+    """ Get the cache key for a build configuration and its sources.
+
+    Arguments:
+    config -- dict returned by get_build_config
+    sources -- list of absolute paths to the source files
+    """
+    h = hashlib.sha256(hash_config(config).encode())
+    for s in sources:
+        h.update(os.path.basename(s).encode())
+        h.update(hash_file(s).encode())
+    return h.hexdigest()[:24]
+
+def read_manifest(entry):
+    """ Read the manifest of a cache entry, or None if it isn't built.
+
+    Arguments:
+    entry -- Path to the cache entry directory
+    """
+    try:
+        with open(os.path.join(entry, MANIFEST)) as fd:
+            return json.load(fd)
+    except (OSError, ValueError):
+        return None
+
+def _lock(path, operation):
+    """ Open a lock file and lock it. Returns the open file.
+
+    If the file was removed (by evict) while this was waiting for the
+    lock, the lock guards nothing, so the file is opened again.
+
+    Arguments:
+    path -- Path to the lock file
+    operation -- flock operation, e.g. fcntl.LOCK_EX (with LOCK_NB,
+                 raises BlockingIOError if the file is locked)
+    """
+    while True:
+        lock = open(path, "a")
+        try:
+            fcntl.flock(lock, operation)
+            if(os.path.exists(path) and os.path.samestat(os.fstat(lock.fileno()), os.stat(path))):
+                return lock
+        except BaseException:
+            lock.close()
+            raise
+        lock.close()
+
+def _remove_locked(path):
+    """ Remove a cache entry (or what is left of one) and its lock file,
+    unless it is in use. Returns whether it was removed.
+
+    Arguments:
+    path -- Path to the cache entry directory
+    """
+    try:
+        lock = _lock(path + ".lock", fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    with lock:
+        shutil.rmtree(path, ignore_errors=True)
+        os.remove(path + ".lock")
+    return True
+
+def evict(cache_dir, keep, config_id, max_entries=MAX_ENTRIES):
+    """ Remove stale and least recently used entries from the cache.
+
+    An entry is stale if it has the same configuration as the entry
+    being kept, but different sources. Entries that are in use
+    (locked) by another process are never removed. Lock files left
+    without an entry (e.g. by a build that failed) are removed too.
+
+    Arguments:
+    cache_dir -- Directory containing the cache entries
+    keep -- Key of the entry that must not be removed
+    config_id -- Configuration hash of the entry being kept
+    max_entries -- Maximum number of entries to keep
+    """
+    entries = []
+    for d in os.scandir(cache_dir):
+        if d.name.endswith(".lock") and d.name != keep + ".lock" and not os.path.isdir(d.path[:-len(".lock")]):
+            _remove_locked(d.path[:-len(".lock")])
+            continue
+        if not d.is_dir() or d.name == keep:
+            continue
+        # Every entry has a lock file; anything else isn't ours.
+        if not os.path.exists(d.path + ".lock"):
+            continue
+        manifest = read_manifest(d.path)
+        used = os.path.getmtime(os.path.join(d.path, MANIFEST)) if manifest else 0
+        stale = manifest is None or manifest.get("config_id") == config_id
+        entries.append((not stale, used, d))
+
+    # Stale entries sort first, then least recently used.
+    entries.sort(key=lambda e: (e[0], e[1]))
+    excess = len(entries) + 1 - max_entries
+    for (fresh, _, d) in entries:
+        if fresh and excess <= 0:
+            break
+        if _remove_locked(d.path):
+            excess -= 1
+
+@contextmanager
+def cached_build(cache_dir, config, sources, build):
+    """ Get a build directory for a configuration, building it on a miss.
+
+    Yields the path to the build directory, which stays locked
+    (shared) until the context exits.
+
+    Arguments:
+    cache_dir -- Directory containing the cache entries
+    config -- dict returned by get_build_config
+    sources -- list of absolute paths to the source files
+    build -- Function that compiles the model into the directory it is passed
+    """
+    key = get_build_key(config, sources)
+    config_id = hash_config(config)
+    entry = os.path.join(cache_dir, key)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    with _lock(entry + ".lock", fcntl.LOCK_EX) as lock:
+        manifest = read_manifest(entry)
+        if manifest is None:
+            # Never built, or a previous build failed part way.
+            shutil.rmtree(entry, ignore_errors=True)
+            os.makedirs(entry)
+            build(entry)
+            manifest = {"key": key,
+                        "config_id": config_id,
+                        "config": config,
+                        "sources": {s: hash_file(s) for s in sources},
+                        "created": time.time()}
+            with open(os.path.join(entry, MANIFEST), "w") as fd:
+                json.dump(manifest, fd, indent=2)
+            evict(cache_dir, key, config_id)
+        else:
+            os.utime(os.path.join(entry, MANIFEST))
+
+        # Downgrade so other processes can use the model concurrently.
+        fcntl.flock(lock, fcntl.LOCK_SH)
+        yield entry
@@ -0,0 +1,276 @@
+# Dependency index for incremental regressions.
+#
+# A suite is a module directory with a filelist.json (and its pytest
+# tests). The index maps every suite to the set of files it depends
+# on: the sources in its filelist, plus every module its top module
+# instantiates, transitively, found by parsing the SystemVerilog
+# sources in the repository (e.g. debounce pulls in counter_sat.sv).
+#
+# When a suite passes, the digest of all of its dependencies (sources,
+# filelist, test files, and the util scripts) is recorded in
+# <suite>/run/pass.json. A suite only needs to run again if that digest
+# changes, so a change to one .sv file only reruns the suites whose
+# closure includes it; every other suite reuses its cached pass.
+#
+# Usage (from anywhere in the repository):
+#   python3 util/depindex.py [DIR ...]           # suites that must rerun
+#   python3 util/depindex.py -c FILE [FILE ...]  # suites affected by FILEs
+# See also regress.py --incremental.
+
+import os
+import re
+import sys
+import json
+import glob
+import argparse
+
+import project
+import buildcache
+
+FILELIST = project.FILELIST
+PASS_FILE = os.path.join("run", "pass.json")
+
+# Directories that never contain suites or sources.
+SKIP_DIRS = {".git", "run", "build", "lint", "__pycache__", ".pytest_cache"}
+
+_COMMENTS = re.compile(r"//[^\n]*|/\*.*?\*/", re.S)
+_MODULE = re.compile(r"\b(?:module|macromodule)\s+([A-Za-z_]\w*)")
+_INCLUDE = re.compile(r"`include\s+\"([^\"]+)\"")
+
+def _walk(top, names):
+    """Yield the directories under top that contain any of names."""
+    for (d, dirs, files) in os.walk(top):
+        dirs[:] = sorted(x for x in dirs if x not in SKIP_DIRS)
+        if(any(n in files for n in names)):
+            yield d
+
+def find_suites(path):
+    """ Get the suite directories at or under a path.
+
+    Arguments:
+    path -- Directory to search
+    """
+    return [os.path.abspath(d) for d in _walk(path, [FILELIST])]
+
+def _read(path):
+    with open(path, errors="replace") as fd:
+        return _COMMENTS.sub(" ", fd.read())
+
+def parse_sources(root):
+    """ Parse every .sv/.v file in the repository.
+
+    Returns (definitions, texts): a dict of module name to the file
+    that defines it, and a dict of file to its comment-free text.
+
+    Arguments:
+    root -- Repository root
+    """
+    definitions = {}
+    texts = {}
+    for (d, dirs, files) in os.walk(root):
+        dirs[:] = sorted(x for x in dirs if x not in SKIP_DIRS)
+        for f in sorted(files):
+            if(os.path.splitext(f)[1] in (".sv", ".v", ".svh", ".vh")):
+                path = os.path.join(d, f)
+                texts[path] = _read(path)
+                for m in _MODULE.findall(texts[path]):
+                    definitions.setdefault(m, path)
+    return definitions, texts
+
+def get_instances(text, modules):
+    """ Get the names of the modules instantiated in some source text.
+
+    Only names in modules are considered, so that keywords, types and
+    function calls are never mistaken for instances.
+
+    Arguments:
+    text -- Source text, without comments
+    modules -- Known module names
+    """
+    if(not modules):
+        return set()
+    names = "|".join(sorted(map(re.escape, modules), key=len, reverse=True))
+    # <module> [#(...)] <instance> [range] (
+    pattern = re.compile(r"\b(" + names + r")\b\s*(?:#|[A-Za-z_]\w*\s*(?:\[[^\]]*\]\s*)?\()")
+    found = set()
+    for m in pattern.finditer(text):
+        # Skip the module's own definition header.
+        if(re.search(r"\b(?:module|macromodule)\s+$", text[max(0, m.start() - 32):m.start()])):
+            continue
+        found.add(m.group(1))
+    return found
+
+# Ports of an ANSI module header: (direction, range, name).
+_PORT = re.compile(r"\b(input|output|inout)\s+(?:wire\s+|logic\s+)?(\[[^\]]*\])?\s*([A-Za-z_]\w*)")
+
+def get_ports(text, module):
+    """ Get the ports of a module with an ANSI header, as a list of
+    (direction, width, name). Ranges that aren't integer constants
+    count as width 0. Returns None if text doesn't define the module.
+
+    Arguments:
+    text -- Source text, without comments
+    module -- Module name
+    """
+    m = re.search(r"\b(?:module|macromodule)\s+" + re.escape(module) + r"\b(.*?);", text, re.S)
+    if(m is None):
+        return None
+    ports = []
+    for (direction, bits, name) in _PORT.findall(m.group(1)):
+        width = 1
+        if(bits):
+            try:
+                (msb, lsb) = (int(x) for x in bits.strip("[]").split(":"))
+                width = abs(msb - lsb) + 1
+            except ValueError:
+                width = 0
+        ports.append((direction, width, name))
+    return ports
+
+def build_index(root):
+    """ Build the dependency index of every suite in the repository.
+
+    Returns a dict of suite directory to the sorted list of source
+    files it depends on.
+
+    Arguments:
+    root -- Repository root
+    """
+    definitions, texts = parse_sources(root)
+    modules = set(definitions)
+    instances = {p: get_instances(t, modules) for (p, t) in texts.items()}
+
+    index = {}
+    for suite in find_suites(root):
+        files = list(project.get_filelist(suite, FILELIST, root).sources)
+
+        # Prefer the definition in the suite's own filelist, if a
+        # module is defined more than once.
+        local = {}
+        for f in files:
+            for m in _MODULE.findall(texts.get(f, "")):
+                local[m] = f
+
+        deps = set(files)
+        todo = list(files)
+        while todo:
+            f = todo.pop()
+            text = texts.get(f, "")
+            children = [local.get(m, definitions.get(m)) for m in instances.get(f, ())]
+            children += [_resolve_include(root, f, i) for i in _INCLUDE.findall(text)]
+            for c in children:
+                if(c is not None and c not in deps):
+                    deps.add(c)
+                    todo.append(c)
+        index[suite] = sorted(deps)
+    return index
+
+def _resolve_include(root, src, name):
+    for d in (os.path.dirname(src), root):
+        path = os.path.join(d, name)
+        if(os.path.isfile(path)):
+            return path
+    return None
+
+def get_inputs(root, suite, deps):
+    """ Get every file that a suite's results depend on: its sources,
+    its filelist and test files, and the util scripts.
+
+    Arguments:
+    root -- Repository root
+    suite -- Suite directory
+    deps -- Source files, from build_index
+    """
+    files = set(deps)
+    files.add(os.path.join(suite, FILELIST))
+    files.update(glob.glob(os.path.join(suite, "*.py")))
+    files.update(glob.glob(os.path.join(root, "util", "*.py")))
+    return sorted(f for f in files if os.path.isfile(f))
+
+def get_digests(files):
+    """ Get the content digest of each file.
+
+    Arguments:
+    files -- list of paths
+    """
+    return {f: buildcache.hash_file(f) for f in files}
+
+def read_pass(suite):
+    """ Get the file digests recorded when a suite last passed, or None.
+
+    Arguments:
+    suite -- Suite directory
+    """
+    try:
+        with open(os.path.join(suite, PASS_FILE)) as fd:
+            return json.load(fd)["files"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+def record_pass(root, suite, deps):
+    """ Record that a suite passed with the current contents of its inputs.
+
+    Arguments:
+    root -- Repository root
+    suite -- Suite directory
+    deps -- Source files, from build_index
+    """
+    path = os.path.join(suite, PASS_FILE)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as fd:
+        json.dump({"files": get_digests(get_inputs(root, suite, deps))}, fd, indent=2)
+
+def clear_pass(suite):
+    """ Forget a suite's cached pass (e.g. because it failed).
+
+    Arguments:
+    suite -- Suite directory
+    """
+    try:
+        os.remove(os.path.join(suite, PASS_FILE))
+    except FileNotFoundError:
+        pass
+
+def get_stale(root, index, suites):
+    """ Get the suites whose inputs changed since they last passed.
+
+    Arguments:
+    root -- Repository root
+    index -- dict returned by build_index
+    suites -- Suite directories to check
+    """
+    stale = []
+    for suite in suites:
+        if(read_pass(suite) != get_digests(get_inputs(root, suite, index[suite]))):
+            stale.append(suite)
+    return stale
+
+def get_affected(index, changed):
+    """ Get the suites whose dependencies include any changed source.
+
+    Arguments:
+    index -- dict returned by build_index
+    changed -- list of changed file paths
+    """
+    changed = {os.path.abspath(c) for c in changed}
+    return [s for (s, deps) in index.items() if changed & set(deps) or any(os.path.dirname(c) == s for c in changed)]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List the module suites that need to run again.")
+    parser.add_argument("paths", nargs="*", default=["."], help="Directories to check (default: .)")
+    parser.add_argument("-c", "--changed", nargs="+", default=None, help="List the suites affected by these files instead")
+    args = parser.parse_args(argv)
+
+    root = project.get_root(args.paths[0])
+    index = build_index(root)
+    suites = [s for p in args.paths for s in find_suites(p)]
+    if(args.changed is not None):
+        result = [s for s in get_affected(index, args.changed) if s in suites]
+    else:
+        result = get_stale(root, index, suites)
+    for s in result:
+        print(os.path.relpath(s))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
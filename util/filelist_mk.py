@@ -0,0 +1,28 @@
+# Generate filelist.mk, the Make version of filelist.json, in the
+# current (module) directory. frag/sources.mk includes it, and only
+# runs this script again when filelist.json changes, so make doesn't
+# start a Python interpreter per variable on every invocation.
+#
+# FILELIST_TOP_SOURCES is the subset of FILELIST_SOURCES that
+# FILELIST_TOP reaches (see iplib.prune).
+
+import os
+
+import iplib
+import project
+
+def quote(words):
+    """Escape spaces so that make sees each path as one word."""
+    return " ".join(w.replace(" ", "\\ ") for w in words)
+
+root = project.get_root()
+filelist = project.get_filelist(".")
+relative = lambda paths: quote(os.path.relpath(p, root) for p in paths)
+
+with open("filelist.mk", "w") as fd:
+    fd.write("# Generated from filelist.json by util/filelist_mk.py, do not edit.\n")
+    fd.write(f"FILELIST_TOP := {filelist.top}\n")
+    fd.write(f"FILELIST_SOURCES := {relative(filelist.sources)}\n")
+    fd.write(f"FILELIST_TOP_SOURCES := {relative(iplib.prune(filelist.top, filelist.sources))}\n")
+    fd.write(f"FILELIST_INCLUDES := {relative(filelist.includes)}\n")
+    fd.write(f"FILELIST_DEFINES := {quote(filelist.defines)}\n")
@@ -1,7 +1,6 @@
-import json
+import os
 
-with open("filelist.json") as filelist:
-    files = json.load(filelist)["files"]
-    for f in files:
-        print(f,end=" ")
-    print()
+import project
+
+root = project.get_root()
+print(" ".join(os.path.relpath(f, root) for f in project.get_filelist(".").sources))
@@ -1,4 +1,3 @@
-import json
+import project
 
-with open("filelist.json") as filelist:
-    print(json.load(filelist)["top"])
+print(project.get_filelist(".").top)
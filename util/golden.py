@@ -0,0 +1,113 @@
+# Vectorized reference (golden) models for the part1 combinational
+# modules.
+#
+# Each function computes the full expected truth table of a module in
+# one NumPy call. Tables are indexed by the module inputs, in port
+# order, e.g. adder(width_p)[a, b] is the expected sum_o for a_i == a
+# and b_i == b. Testbenches compute the table once, then compare DUT
+# outputs against it instead of recomputing expectations per vector.
+#
+# Tables are cached per width and are read-only, so they can be
+# shared between tests in the same simulation.
+
+from functools import lru_cache
+
+import numpy as np
+
+# hex2ssd segment encodings (active low, GFEDCBA), indexed by hex_i.
+_HEX2SSD = (0x40, 0x79, 0x24, 0x30, 0x19, 0x12, 0x02, 0x78,
+            0x00, 0x18, 0x08, 0x03, 0x46, 0x21, 0x06, 0x0e)
+
+def _readonly(*arrays):
+    for a in arrays:
+        a.flags.writeable = False
+    return arrays[0] if len(arrays) == 1 else arrays
+
+def _bits():
+    """The two values of a one-bit input."""
+    return np.arange(2, dtype=np.uint8)
+
+def inputs(width_p):
+    """ Every value of a width_p bit input, in increasing order.
+
+    Arguments:
+    width_p -- Width of the input, in bits
+    """
+    dtype = np.uint32 if width_p <= 32 else np.uint64
+    return np.arange(1 << width_p, dtype=dtype)
+
+@lru_cache(maxsize=None)
+def adder(width_p):
+    """ Expected sum_o of adder, indexed [a_i, b_i].
+
+    Arguments:
+    width_p -- Width of a_i and b_i, in bits
+    """
+    v = inputs(width_p).astype(np.uint64)
+    return _readonly(v[:, None] + v[None, :])
+
+@lru_cache(maxsize=None)
+def half_add():
+    """ Expected (sum_o, carry_o) of half_add, each indexed [a_i, b_i]."""
+    a = _bits()[:, None]
+    b = _bits()[None, :]
+    return _readonly(a ^ b, a & b)
+
+@lru_cache(maxsize=None)
+def full_add():
+    """ Expected (sum_o, carry_o) of full_add, each indexed [a_i, b_i, carry_i]."""
+    a = _bits()[:, None, None]
+    b = _bits()[None, :, None]
+    c = _bits()[None, None, :]
+    total = a + b + c
+    return _readonly(total & 1, (total >> 1).astype(np.uint8))
+
+@lru_cache(maxsize=None)
+def xor2():
+    """ Expected c_o of xor2, indexed [a_i, b_i]."""
+    return _readonly(_bits()[:, None] ^ _bits()[None, :])
+
+@lru_cache(maxsize=None)
+def xnor2():
+    """ Expected c_o of xnor2, indexed [a_i, b_i]."""
+    return _readonly((_bits()[:, None] ^ _bits()[None, :]) ^ 1)
+
+@lru_cache(maxsize=None)
+def mux2():
+    """ Expected c_o of mux2, indexed [a_i, b_i, select_i]."""
+    a = _bits()[:, None, None]
+    b = _bits()[None, :, None]
+    s = _bits()[None, None, :]
+    return _readonly(np.where(s == 1, b, a).astype(np.uint8))
+
+@lru_cache(maxsize=None)
+def bin2gray(width_p):
+    """ Expected gray_o of bin2gray, indexed [bin_i].
+
+    Arguments:
+    width_p -- Width of bin_i, in bits
+    """
+    b = inputs(width_p)
+    return _readonly(b ^ (b >> 1))
+
+@lru_cache(maxsize=None)
+def gray2bin(width_p):
+    """ Expected bin_o of gray2bin, indexed [gray_i].
+
+    Each output bit is the xor of all gray_i bits at or above it,
+    computed as a prefix xor in log2(width_p) shifts.
+
+    Arguments:
+    width_p -- Width of gray_i, in bits
+    """
+    b = inputs(width_p).copy()
+    shift = 1
+    while shift < width_p:
+        b ^= b >> shift
+        shift <<= 1
+    return _readonly(b)
+
+@lru_cache(maxsize=None)
+def hex2ssd():
+    """ Expected ssd_o of hex2ssd, indexed [hex_i]."""
+    return _readonly(np.array(_HEX2SSD, dtype=np.uint8))
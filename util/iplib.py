@@ -0,0 +1,84 @@
+# Source pruning: build each model from what its top module reaches.
+#
+# A filelist lists every source of a module directory, including the
+# ones only the FPGA top.sv needs (e.g. part2/counter lists dff.sv,
+# inv.sv and hex2ssd.sv, which the simulated counter never
+# instantiates). Every simulation used to parse all of them, and hash
+# all of them into its build cache key, so editing any of them rebuilt
+# every model of the module.
+#
+# prune() keeps only the sources the top module actually reaches:
+# the files defining the modules it instantiates, transitively (found
+# the same way as depindex.py), plus every file that defines no module
+# at all (packages, interfaces), which can't be traced by instance.
+#
+# Icarus and Verilator builds both get the pruned sources, and so does
+# the synth flow (FILELIST_TOP_SOURCES, see filelist_mk.py).
+#
+# The provided IP is not prebuilt into libraries: it is compiled into
+# every model that reaches it, like any other source. Icarus has no
+# separately compiled units, and a Verilator --lib-create library
+# would have to be built with each model's own flags (threads, trace,
+# build profile), so it would rarely be shared. dff.sv and inv.sv are
+# cheaper to verilate in place, and the large netlist (joystick.sv) is
+# in no filelist.
+#
+# Usage (as in simulate()):
+#   sources = prune(top, sources)
+# Show which sources a module directory's simulations use:
+#   python3 util/iplib.py [DIR]
+
+import os
+import sys
+import argparse
+
+import project
+import depindex
+
+def _definitions(sources):
+    texts = {s: depindex._read(s) for s in sources}
+    definitions = {}
+    for (s, text) in texts.items():
+        for m in depindex._MODULE.findall(text):
+            definitions.setdefault(m, s)
+    return (definitions, texts)
+
+def prune(top, sources):
+    """ Get the sources a top module needs, in their original order.
+
+    Files that define no module are always kept. If top isn't defined
+    in sources, they are returned unchanged.
+
+    Arguments:
+    top -- Name of the top module
+    sources -- list of source files (e.g. from the filelist)
+    """
+    (definitions, texts) = _definitions(sources)
+    if(top not in definitions):
+        return list(sources)
+
+    modules = set(definitions)
+    needed = {definitions[top]}
+    todo = [definitions[top]]
+    while todo:
+        f = todo.pop()
+        for m in depindex.get_instances(texts[f], modules):
+            if(definitions[m] not in needed):
+                needed.add(definitions[m])
+                todo.append(definitions[m])
+    return [s for s in sources if s in needed or not depindex._MODULE.search(texts[s])]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show the sources a module's simulations are built from.")
+    parser.add_argument("path", nargs="?", default=".", help="Module directory (default: .)")
+    args = parser.parse_args(argv)
+
+    root = project.get_root(args.path)
+    filelist = project.get_filelist(args.path, root=root)
+    needed = prune(filelist.top, filelist.sources)
+    for s in filelist.sources:
+        print(f"{'used' if s in needed else 'pruned':8} {os.path.relpath(s, root)}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
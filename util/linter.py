@@ -0,0 +1,190 @@
+# Direct Verilator lint, with a result cache.
+#
+# Runs verilator --lint-only once per source set, without going
+# through cocotb_test (and a fake Makefile), and parses the output
+# into Diagnostic records. Results are cached by the contents of the
+# sources and everything on the command line (top, parameters,
+# defines, includes, flags, timescale and the Verilator version), in
+# <tbpath>/lint/cache, so test_lint and test_style only run Verilator
+# when something changed.
+#
+# lint_all lints every module suite under a set of directories in
+# parallel, e.g. to check all of part1 and part2 at once:
+#   python3 util/linter.py [-j JOBS] [--style] [DIR ...]
+
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+from typing import NamedTuple
+from concurrent.futures import ProcessPoolExecutor
+
+import project
+import buildcache
+
+# Flags for test_lint, and test_style.
+LINT_FLAGS = ["--lint-only"]
+STYLE_FLAGS = ["--lint-only", "-Wwarn-style", "-Wno-lint"]
+
+# %Warning-CODE: file:line:col: message (the location is optional, and
+# older versions of Verilator leave out the column).
+_DIAGNOSTIC = re.compile(r"^%(Warning|Error)(?:-([A-Z0-9_]+))?:\s*(?:([^:\s][^:]*):(\d+):(?:(\d+):)?)?\s*(.*)$")
+
+class Diagnostic(NamedTuple):
+    """One Verilator warning or error."""
+    severity: str
+    code: str
+    file: str
+    line: int
+    column: int
+    message: str
+
+    def __str__(self):
+        where = f"{self.file}:{self.line}:{self.column}: " if self.file else ""
+        code = f"-{self.code}" if self.code else ""
+        return f"%{self.severity.capitalize()}{code}: {where}{self.message}"
+
+class LintResult(NamedTuple):
+    """The outcome of linting one source set."""
+    passed: bool
+    diagnostics: tuple
+    output: str
+    cached: bool
+
+def get_verilator():
+    return os.environ.get("VERILATOR", "verilator")
+
+def parse(output):
+    """ Parse Verilator output into a list of Diagnostic.
+
+    Continuation lines (source excerpts, hints) and the final
+    "Exiting due to" summary are skipped.
+
+    Arguments:
+    output -- Combined stdout and stderr of Verilator
+    """
+    diagnostics = []
+    for l in output.splitlines():
+        m = _DIAGNOSTIC.match(l)
+        if(m is None or m.group(6).startswith("Exiting due to")):
+            continue
+        (severity, code, f, line, column, message) = m.groups()
+        diagnostics.append(Diagnostic(severity.lower(), code or "", f or "", int(line or 0), int(column or 0), message.strip()))
+    return diagnostics
+
+def get_command(top, sources, params=None, defines=(), includes=(), flags=LINT_FLAGS, timescale=None):
+    """ Get the Verilator command line to lint a source set.
+
+    Arguments:
+    top -- Name of the top level module
+    sources -- list of source file paths
+    params -- dict of top level parameters
+    defines -- list of preprocessor defines
+    includes -- list of include directories
+    flags -- Lint flags (e.g. LINT_FLAGS or STYLE_FLAGS)
+    timescale -- Timescale string (e.g. "1ps/1ps"), or None
+    """
+    # COCOTB_SIM is defined as it is when the model is built.
+    cmd = [get_verilator()] + list(flags) + ["-DCOCOTB_SIM=1", "--top-module", top]
+    if(timescale is not None):
+        cmd += ["--timescale", timescale]
+    cmd += [f"-G{k}={v}" for (k, v) in (params or {}).items()]
+    cmd += [f"-D{d}" for d in defines]
+    cmd += [f"-I{i}" for i in includes]
+    return cmd + list(sources)
+
+def lint_sources(top, sources, params=None, defines=(), includes=(), flags=LINT_FLAGS, timescale=None, cache_dir=None):
+    """ Lint a source set with Verilator, or get the cached result.
+
+    Returns a LintResult. It passes if Verilator exited cleanly, i.e.
+    without errors or (fatal) warnings.
+
+    Arguments:
+    cache_dir -- Directory for cached results, or None to not cache
+    (The rest are as for get_command)
+    """
+    cmd = get_command(top, sources, params, defines, includes, flags, timescale)
+
+    path = None
+    if(cache_dir is not None):
+        config = {"command": cmd[1:], "verilator_version": buildcache.get_simulator_version("verilator")}
+        path = os.path.join(cache_dir, buildcache.get_build_key(config, sources) + ".json")
+        try:
+            with open(path) as fd:
+                c = json.load(fd)
+            return LintResult(c["passed"], tuple(Diagnostic(*d) for d in c["diagnostics"]), c["output"], True)
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    diagnostics = tuple(parse(p.stdout))
+    result = LintResult(p.returncode == 0, diagnostics, p.stdout, False)
+
+    if(path is not None):
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}"
+        with open(tmp, "w") as fd:
+            json.dump({"passed": result.passed, "diagnostics": diagnostics, "output": p.stdout}, fd, indent=2)
+        os.replace(tmp, path)
+    return result
+
+def lint_module(tbpath, params=None, defs=(), flags=LINT_FLAGS, timescale=None, jsonpath=None, jsonname=project.FILELIST, root=None):
+    """ Lint the sources of a module directory, per its filelist.
+
+    Arguments:
+    tbpath -- Path to the module (testbench) directory
+    params -- dict of top level parameters
+    defs -- list of extra preprocessor defines
+    flags -- Lint flags (e.g. LINT_FLAGS or STYLE_FLAGS)
+    timescale -- Timescale string (e.g. "1ps/1ps"), or None
+    jsonpath -- Directory of the filelist (defaults to tbpath)
+    jsonname -- Name of the filelist
+    root -- Repository root (found from tbpath by default)
+    """
+    if(root is None):
+        root = project.get_root(tbpath)
+    filelist = project.get_filelist(jsonpath or tbpath, jsonname, root)
+    return lint_sources(filelist.top, filelist.sources, params, list(defs) + list(filelist.defines),
+                        filelist.includes, flags, timescale, os.path.join(tbpath, "lint", "cache"))
+
+def _lint_suite(args):
+    (suite, flags) = args
+    return (suite, lint_module(suite, flags=flags))
+
+def lint_all(paths, flags=LINT_FLAGS, workers=None):
+    """ Lint every module suite under a set of directories, in parallel,
+    with each top's default parameters.
+
+    Returns a dict of suite directory to LintResult.
+
+    Arguments:
+    paths -- list of directories
+    flags -- Lint flags (e.g. LINT_FLAGS or STYLE_FLAGS)
+    workers -- Number of worker processes (defaults to the CPU count)
+    """
+    import depindex
+    suites = sorted({s for p in paths for s in depindex.find_suites(p)})
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return dict(pool.map(_lint_suite, [(s, flags) for s in suites]))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lint module suites with Verilator, in parallel.")
+    parser.add_argument("paths", nargs="*", default=["."], help="Directories to lint (default: .)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument("--style", action="store_true", help="Check style warnings instead of lint warnings")
+    args = parser.parse_args(argv)
+
+    results = lint_all(args.paths, STYLE_FLAGS if args.style else LINT_FLAGS, args.jobs)
+    for (suite, r) in results.items():
+        status = "PASSED" if r.passed else "FAILED"
+        print(f"{status} {os.path.relpath(suite)}{' (cached)' if r.cached else ''}")
+        for d in r.diagnostics:
+            print(f"  {d}")
+    failed = sum(not r.passed for r in results.values())
+    print(f"{len(results) - failed} passed, {failed} failed")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+# Cycle-accurate reference models for synchronous modules.
+#
+# A ClockMonitor wakes up once per rising clock edge, samples the
+# input handles once, and passes that snapshot to every model attached
+# to it. A model (a SyncModel subclass) only implements next_state();
+# it never awaits triggers or reads handles itself, so one monitor can
+# feed several models for the cost of a single wakeup per cycle.
+#
+# The model output follows the DUT register: reads in the same time
+# step as the rising edge return the value from before the edge, and
+# the new value is visible from the next time step on (e.g. at the
+# falling edge). This is what the testbenches expect when they check
+# outputs right after awaiting RisingEdge.
+#
+# Usage:
+#   model = ShiftModel(width_p, reset_val_p)
+#   ClockMonitor(clk_i, reset_i=dut.reset_i, d_i=dut.d_i).start(model)
+#   ...
+#   await RisingEdge(clk_i)
+#   assert dut.data_o.value == model.state
+#
+# To check an output on every cycle instead, attach a Scoreboard to
+# the same monitor. It compares the output to the model in the
+# monitor's wakeup, so it costs no extra trigger, and fails the test at
+# the first mismatch with the cycle and the inputs that led up to it:
+#   monitor = ClockMonitor(clk_i, reset_i=dut.reset_i, d_i=dut.d_i).start(model)
+#   await reset_sequence(clk_i, reset_i, 10)
+#   monitor.attach(Scoreboard(data_o=(dut.data_o, model)))
+
+from collections import deque
+
+import cocotb
+from cocotb.triggers import RisingEdge
+from cocotb.utils import get_sim_time
+
+def _sample(handle):
+    """The integer value of a handle, or None if it has x/z bits."""
+    v = handle.value
+    return v.integer if v.is_resolvable else None
+
+class SyncModel():
+    """ Base class for synchronous reference models.
+
+    Subclasses implement next_state(state, **inputs), where inputs are
+    the sampled values of the monitor's signals (None if they were
+    not resolvable), and return the state after the edge.
+
+    Arguments:
+    state -- Initial (pre-reset) state of the model
+    """
+    __slots__ = ("_prev", "_next", "_stamp")
+
+    def __init__(self, state=0):
+        self._prev = state
+        self._next = state
+        self._stamp = -1
+
+    def next_state(self, state, **inputs):
+        raise NotImplementedError
+
+    @property
+    def state(self):
+        """The modelled register value, as seen at the current time."""
+        if get_sim_time() == self._stamp:
+            return self._prev
+        return self._next
+
+    def clock(self, inputs, now):
+        """ Advance the model by one clock edge.
+
+        Arguments:
+        inputs -- dict of sampled input values
+        now -- Simulation time of the edge, in simulator steps
+        """
+        self._prev = self._next
+        self._next = self.next_state(self._prev, **inputs)
+        self._stamp = now
+
+class ClockMonitor():
+    """ Samples a set of inputs on every rising clock edge, and clocks
+    the attached models with the snapshot.
+
+    Arguments:
+    clk_i -- Clock handle
+    signals -- Input handles to sample, by the name passed to next_state
+    """
+    __slots__ = ("_clk_i", "_signals", "_models", "_coro_run")
+
+    def __init__(self, clk_i, **signals):
+        self._clk_i = clk_i
+        self._signals = tuple(signals.items())
+        self._models = []
+        self._coro_run = None
+
+    def attach(self, *models):
+        """Clock these models on every edge from now on."""
+        self._models.extend(models)
+        return self
+
+    def start(self, *models):
+        """Start the monitor, optionally attaching models first."""
+        if self._coro_run is not None:
+            raise RuntimeError("Monitor already started")
+        self.attach(*models)
+        self._coro_run = cocotb.start_soon(self._run())
+        return self
+
+    def stop(self):
+        """Stop the monitor"""
+        if self._coro_run is None:
+            raise RuntimeError("Monitor never started")
+        self._coro_run.kill()
+        self._coro_run = None
+
+    async def _run(self):
+        edge = RisingEdge(self._clk_i)
+        signals = self._signals
+        models = self._models
+        while True:
+            await edge
+            now = get_sim_time()
+            inputs = {name: _sample(h) for (name, h) in signals}
+            for m in models:
+                m.clock(inputs, now)
+
+class Scoreboard():
+    """ Compares DUT outputs to reference models on every edge of the
+    ClockMonitor it is attached to.
+
+    At each rising edge the outputs (sampled before the edge) are
+    compared with model.state, which is also the value from before
+    the edge. The first mismatch (or unresolvable output) raises
+    AssertionError in the monitor, which fails the test right away.
+    The message gives the cycle (counted from when the scoreboard was
+    attached), and the inputs sampled over the last few cycles.
+
+    Arguments:
+    depth -- Number of cycles of input history to report
+    outputs -- (handle, model) pairs to compare, by output name, or
+               (handle, model, output) to compare with
+               model.output(output) instead of model.state
+    """
+    __slots__ = ("_outputs", "_history", "cycles")
+
+    def __init__(self, depth=8, **outputs):
+        self._outputs = tuple((name, o[0], o[1], o[2] if len(o) > 2 else None) for (name, o) in outputs.items())
+        self._history = deque(maxlen=depth)
+        self.cycles = 0
+
+    def clock(self, inputs, now):
+        self._history.append(inputs)
+        for (name, h, m, o) in self._outputs:
+            expected = m.state if o is None else m.output(o)
+            if _sample(h) != expected:
+                raise AssertionError(self._report(name, expected, h.value))
+        self.cycles += 1
+
+    def _report(self, name, expected, got):
+        first = self.cycles - len(self._history) + 1
+        lines = [f"Incorrect Result: {name} != {expected}. Got: {got} at cycle {self.cycles}, Time {get_sim_time(units='ns')}ns.",
+                 "Inputs at the preceding rising edges:"]
+        for (i, inputs) in enumerate(self._history, first):
+            values = ", ".join(f"{k}={'x' if v is None else v}" for (k, v) in inputs.items())
+            lines.append(f"  cycle {i}: {values}")
+        return "\n".join(lines)
@@ -0,0 +1,222 @@
+# Object cache for the C++ compiles of Verilator models.
+#
+# Every Verilator build directory compiles the Verilator runtime
+# (verilated.cpp, verilated_vpi.cpp, verilated_fst_c.cpp, ...) from
+# scratch, although it is the same for every model built with the same
+# toolchain and flags, and every parameter variant of a module
+# recompiles the generated model files, most of which don't depend on
+# the parameters at all.
+#
+# simulate() sets Verilator's OBJCACHE make variable to this script,
+# so that every compile goes through it. Each object file is cached by
+# a hash of the compiler version, the command line (less the output
+# paths) and the preprocessed source (without line markers, so that
+# the build directory doesn't matter). The runtime is then compiled
+# once per toolchain and set of flags, and shared by every model; a
+# new parameter variant only compiles the files whose contents
+# actually changed.
+#
+# ccache does the same, and is used instead when it is installed
+# (see get_objcache). The cache lives in <repository root>/build/objcache
+# and is capped at MAX_BYTES, least recently used first: simulate()
+# calls evict() once after each build, since walking the whole cache
+# after every compile would make each compile as slow as the cache is
+# large.
+#
+# Usage (as set by simulate()):
+#   make -f Vtop.mk OBJCACHE="python3 util/objcache.py --dir DIR"
+# Show the cache size, or clear it:
+#   python3 util/objcache.py --dir DIR [--stats|--clear]
+
+import os
+import sys
+import shlex
+import shutil
+import hashlib
+import argparse
+import subprocess
+
+MAX_BYTES = 2 << 30
+
+# Options that name output files, and so don't change the object.
+_OUTPUT_OPTS = ("-o", "-MF", "-MT", "-MQ")
+
+def get_objcache(d):
+    """ Get the OBJCACHE command for Verilator builds: ccache if it is
+    installed, and this script otherwise.
+
+    Arguments:
+    d -- Cache directory (used by this script only; ccache keeps its own)
+    """
+    if(os.environ.get("SIM_OBJCACHE", "1") == "0"):
+        return None
+    if(shutil.which("ccache") is not None):
+        return "ccache"
+    return " ".join(shlex.quote(a) for a in (sys.executable, os.path.realpath(__file__), "--dir", d))
+
+def parse(cmd):
+    """ Split a compile command into (args without output paths, source,
+    object, dependency file), or None if it isn't a single cacheable
+    compile (-c of one source into one object).
+
+    Arguments:
+    cmd -- Compiler command line, starting with the compiler
+    """
+    args = []
+    out = None
+    depfile = None
+    sources = []
+    i = 1
+    while(i < len(cmd)):
+        a = cmd[i]
+        if(a in _OUTPUT_OPTS and i + 1 < len(cmd)):
+            if(a == "-o"):
+                out = cmd[i + 1]
+            elif(a == "-MF"):
+                depfile = cmd[i + 1]
+            i += 2
+            continue
+        if(not a.startswith("-") and os.path.splitext(a)[1] in (".c", ".cc", ".cpp", ".cxx")):
+            sources.append(a)
+        else:
+            args.append(a)
+        i += 1
+    if("-c" not in args or len(sources) != 1 or out is None):
+        return None
+    # -MD/-MMD write the dependency file next to the object.
+    if(depfile is None and ("-MD" in args or "-MMD" in args)):
+        depfile = os.path.splitext(out)[0] + ".d"
+    return (args, sources[0], out, depfile)
+
+def get_key(compiler, args, source):
+    """ Hash a compile: the compiler version, its arguments and the
+    preprocessed source. Returns None if preprocessing fails.
+
+    Arguments:
+    compiler -- Compiler command
+    args -- Arguments, without output paths
+    source -- Source file
+    """
+    h = hashlib.sha256()
+    version = subprocess.run([compiler, "--version"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    h.update(version.stdout)
+    h.update("\0".join(args).encode())
+    h.update(os.path.basename(source).encode())
+
+    # Dependency options would make the preprocessor write a .d file.
+    pp_args = [a for a in args if a not in ("-c", "-MD", "-MMD", "-MP")]
+    p = subprocess.run([compiler] + pp_args + ["-E", "-P", source], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    if(p.returncode != 0):
+        return None
+    h.update(p.stdout)
+    return h.hexdigest()
+
+def _store(path, data):
+    if(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}"
+    with open(tmp, "wb") as fd:
+        fd.write(data)
+    os.replace(tmp, path)
+
+def _read(path):
+    with open(path, "rb") as fd:
+        return fd.read()
+
+def evict(d, max_bytes=MAX_BYTES):
+    """ Remove the least recently used entries until the cache is under
+    max_bytes.
+
+    Arguments:
+    d -- Cache directory
+    max_bytes -- Size limit
+    """
+    entries = []
+    for (dirpath, dirnames, filenames) in os.walk(d):
+        for f in filenames:
+            p = os.path.join(dirpath, f)
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+    total = sum(e[1] for e in entries)
+    for (mtime, size, p) in sorted(entries):
+        if(total <= max_bytes):
+            break
+        try:
+            os.remove(p)
+            total -= size
+        except OSError:
+            pass
+
+def compile(d, cmd):
+    """ Run one compile through the cache. Returns the exit code.
+
+    Arguments:
+    d -- Cache directory
+    cmd -- Compiler command line, starting with the compiler
+    """
+    parsed = parse(cmd)
+    key = None if parsed is None else get_key(cmd[0], parsed[0], parsed[1])
+    if(key is None):
+        return subprocess.run(cmd).returncode
+
+    (args, source, out, depfile) = parsed
+    entry = os.path.join(d, key[:2], key)
+    try:
+        obj = _read(entry + ".o")
+        dep = _read(entry + ".d") if depfile is not None else None
+    except OSError:
+        obj = None
+
+    if(obj is not None):
+        _store(out, obj)
+        if(depfile is not None):
+            _store(depfile, dep)
+        # Mark the entry as recently used.
+        os.utime(entry + ".o")
+        return 0
+
+    ret = subprocess.run(cmd).returncode
+    if(ret == 0):
+        if(depfile is not None):
+            if(not os.path.exists(depfile)):
+                return ret
+            _store(entry + ".d", _read(depfile))
+        _store(entry + ".o", _read(out))
+    return ret
+
+def stats(d):
+    """Get the (number of objects, total bytes) in the cache."""
+    n = 0
+    size = 0
+    for (dirpath, dirnames, filenames) in os.walk(d):
+        for f in filenames:
+            if(f.endswith(".o")):
+                n += 1
+            size += os.path.getsize(os.path.join(dirpath, f))
+    return (n, size)
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    # As a compiler wrapper: --dir DIR COMPILER ARGS... (the compiler
+    # arguments can't go through argparse, which would take them apart).
+    if(len(argv) > 2 and argv[0] == "--dir" and argv[2] not in ("--stats", "--clear")):
+        return compile(argv[1], argv[2:])
+
+    parser = argparse.ArgumentParser(description="Cache C++ object files of Verilator builds.")
+    parser.add_argument("--dir", required=True, help="Cache directory")
+    parser.add_argument("--clear", action="store_true", help="Remove everything in the cache")
+    parser.add_argument("--stats", action="store_true", help="Show the size of the cache (the default)")
+    args = parser.parse_args(argv)
+
+    if(args.clear):
+        shutil.rmtree(args.dir, ignore_errors=True)
+        return 0
+    (n, size) = stats(args.dir)
+    print(f"{n} objects, {size / (1 << 20):.1f} MiB in {args.dir}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
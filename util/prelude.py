@@ -0,0 +1,41 @@
+# Testbench prelude: the host-side names a test_*.py needs at import
+# time, and nothing else.
+#
+# Every testbench module is imported twice: by pytest on the host,
+# to collect test_each/test_all/test_lint/test_style, and by cocotb
+# inside every simulation, to find the cocotb tests. The pytest
+# decorators run in both, but only mean something on the host. Inside
+# a simulation they are replaced by no-ops, so the simulator doesn't
+# pay for importing pytest_utils (or pytest, if cocotb hasn't already
+# loaded it for assertion rewriting).
+#
+# Usage, in a testbench:
+#   from prelude import pytest, max_score
+#
+# Measure the import time of the testbenches with util/bench_import.py.
+
+import sys
+
+import cocotb
+
+# cocotb sets its top level handle before it imports the test modules.
+IN_SIM = cocotb.top is not None
+
+def _passthrough(*args, **kwargs):
+    """A decorator factory whose decorators do nothing."""
+    return lambda f: f
+
+class _Mark():
+    def __getattr__(self, name):
+        return _passthrough
+
+class _Pytest():
+    """Just enough of pytest for module-level @pytest.mark decorators."""
+    mark = _Mark()
+
+if IN_SIM:
+    pytest = sys.modules.get("pytest") or _Pytest()
+    max_score = visibility = tags = _passthrough
+else:
+    import pytest
+    from pytest_utils.decorators import max_score, visibility, tags
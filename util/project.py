@@ -0,0 +1,83 @@
+# Project model: the repository root and the module filelists.
+#
+# The root is found once per starting directory, by looking for .git
+# (no git subprocess or GitPython repository object). Each filelist is
+# parsed once, and parsed again only if its mtime or size changes, so
+# runner(), lint() and the Make helpers can ask for it as often as
+# they like.
+#
+# A filelist.json must have "top" and "files", and may have
+# "includes" (include directories) and "defines", all relative to the
+# repository root:
+#
+# {
+#     "top": "hello",
+#     "files": ["part1/sim/hello.sv"],
+#     "includes": ["provided"],
+#     "defines": ["SIMULATION"]
+# }
+
+import os
+import json
+from typing import NamedTuple, Tuple
+
+FILELIST = "filelist.json"
+
+class Filelist(NamedTuple):
+    """A parsed filelist.json, with absolute paths."""
+    path: str
+    top: str
+    sources: Tuple[str, ...]
+    includes: Tuple[str, ...]
+    defines: Tuple[str, ...]
+
+# Repository roots, keyed by the directory the search started from.
+_roots = {}
+
+# Parsed filelists, keyed by (path, root), with the (mtime, size) they
+# were parsed at.
+_filelists = {}
+
+def get_root(path=None):
+    """ Get the root of the repository that contains a path.
+
+    Arguments:
+    path -- Any path inside the repository (defaults to the cwd)
+    """
+    start = os.path.abspath(path or os.getcwd())
+    if(start not in _roots):
+        d = start if os.path.isdir(start) else os.path.dirname(start)
+        while not os.path.exists(os.path.join(d, ".git")):
+            parent = os.path.dirname(d)
+            assert parent != d, f"{start} is not inside a git repository."
+            d = parent
+        _roots[start] = d
+    return _roots[start]
+
+def get_filelist(d, name=FILELIST, root=None):
+    """ Get the parsed filelist of a module directory.
+
+    Arguments:
+    d -- Directory containing the filelist
+    name -- Name of the filelist, defaults to filelist.json
+    root -- Repository root the paths are relative to (found from d by default)
+    """
+    path = os.path.abspath(os.path.join(d, name))
+    if(root is None):
+        root = get_root(os.path.dirname(path))
+
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = _filelists.get((path, root))
+    if(cached is not None and cached[0] == stamp):
+        return cached[1]
+
+    with open(path) as fd:
+        data = json.load(fd)
+    filelist = Filelist(path=path,
+                        top=data["top"],
+                        sources=tuple(os.path.join(root, f) for f in data["files"]),
+                        includes=tuple(os.path.join(root, f) for f in data.get("includes", [])),
+                        defines=tuple(data.get("defines", [])))
+    _filelists[(path, root)] = (stamp, filelist)
+    return filelist
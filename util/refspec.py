@@ -0,0 +1,491 @@
+# Reference model specs, shared by the Python and native models.
+#
+# Each synchronous module with a reference model has a Spec: its
+# parameters, the inputs sampled at each rising edge, its state
+# variables with their next-state rules, and its outputs as functions
+# of the state. Expressions are written in a small subset of Python
+# (names, integers, arithmetic and bitwise operators, comparisons,
+# and/or/not, conditional expressions and clog2) that translates
+# directly to C.
+#
+# From one Spec, this generates:
+#   - a Python SyncModel (see models.py), for ClockMonitor and
+#     Scoreboard, with get_model(top). The testbenches use these
+#     instead of writing their own models.
+#   - a native checker for Verilator: a C++ model, called through
+#     DPI from a SystemVerilog module that is bound into the DUT. It
+#     steps the model and compares the outputs on every rising edge,
+#     inside the simulator, so long runs don't cross into Python every
+#     cycle. simulate() builds it in when SIM_REFMODEL=native is set
+#     (Verilator only; Icarus has no DPI, and checks in Python).
+# Since both come from the same Spec, they can't diverge.
+#
+# Testbenches don't need to know which one they get: RefCheck uses the
+# native checker if it was built in, and a Python model with a
+# Scoreboard otherwise.
+#
+# Usage, in a testbench:
+#   check = RefCheck(dut)
+#   check.start()                 # before reset
+#   await reset_sequence(clk_i, reset_i, 10)
+#   check.enable()                # compare on every cycle from now on
+#   ...
+#   assert dut.count_o.value == check.expected("count_o")
+#   check.finish()
+#
+# Print the generated sources with:
+#   python3 util/refspec.py [--python|--cpp|--sv] TOP
+
+import os
+import ast
+import sys
+import argparse
+from typing import NamedTuple
+
+import cocotb
+
+class Spec(NamedTuple):
+    """ A synchronous reference model.
+
+    rules gives, for each state variable, a list of (condition, value)
+    pairs: at each rising edge the first condition that holds gives
+    the next value, and the variable holds its value if none does.
+    Every state variable starts at 0.
+    """
+    params: tuple
+    inputs: tuple
+    rules: dict
+    outputs: dict
+    consts: dict = {}
+    widths: dict = {}
+
+SPECS = {
+    "counter": Spec(
+        params=("width_p", "reset_val_p"),
+        inputs=("reset_i", "up_i", "down_i"),
+        consts={"mask": "(1 << width_p) - 1"},
+        rules={"count": [("reset_i", "reset_val_p & mask"),
+                         ("up_i and not down_i", "(count + 1) & mask"),
+                         ("down_i and not up_i", "(count - 1) & mask")]},
+        outputs={"count_o": "count"},
+        widths={"count_o": "width_p"}),
+
+    "counter_sat": Spec(
+        params=("width_p", "reset_val_p", "sat_val_p"),
+        inputs=("reset_i", "up_i", "down_i"),
+        rules={"count": [("reset_i", "reset_val_p"),
+                         ("up_i and not down_i and count != sat_val_p", "count + 1"),
+                         ("down_i and not up_i and count != 0", "count - 1")]},
+        outputs={"count_o": "count"},
+        widths={"count_o": "width_p"}),
+
+    "shift": Spec(
+        params=("width_p", "reset_val_p"),
+        inputs=("reset_i", "enable_i", "d_i", "load_i", "data_i"),
+        consts={"mask": "(1 << width_p) - 1"},
+        rules={"data": [("reset_i", "reset_val_p & mask"),
+                        ("load_i", "data_i"),
+                        ("enable_i", "((data << 1) | d_i) & mask")]},
+        outputs={"data_o": "data"},
+        widths={"data_i": "width_p", "data_o": "width_p"}),
+
+    # The count saturates at min_delay_p, so it never needs a mask.
+    "debounce": Spec(
+        params=("min_delay_p",),
+        inputs=("reset_i", "button_i"),
+        rules={"count": [("reset_i", "0"),
+                         ("button_i and count != min_delay_p", "count + 1"),
+                         ("not button_i and count != 0", "count - 1")]},
+        outputs={"button_o": "count == min_delay_p"}),
+
+    "detect_edge": Spec(
+        params=(),
+        inputs=("reset_i", "button_i"),
+        rules={"prev": [("reset_i", "0"), ("True", "button_i")],
+               "button": [("reset_i", "0"), ("True", "button_i and not prev")],
+               "unbutton": [("reset_i", "0"), ("True", "prev and not button_i")]},
+        outputs={"button_o": "button", "unbutton_o": "unbutton"}),
+}
+
+def clog2(v):
+    """Ceiling of log2(v), as $clog2 in SystemVerilog."""
+    return max(0, (v - 1).bit_length())
+
+def _names(expr):
+    """The names an expression refers to."""
+    return {n.id for n in ast.walk(ast.parse(expr, mode="eval")) if isinstance(n, ast.Name)}
+
+def _inputs(spec, expr):
+    return [i for i in spec.inputs if i in _names(expr)]
+
+# Python operators, as C.
+_C_BINOP = {ast.Add: "+", ast.Sub: "-", ast.Mult: "*", ast.BitAnd: "&", ast.BitOr: "|",
+            ast.BitXor: "^", ast.LShift: "<<", ast.RShift: ">>"}
+_C_CMPOP = {ast.Eq: "==", ast.NotEq: "!=", ast.Lt: "<", ast.LtE: "<=", ast.Gt: ">", ast.GtE: ">="}
+_C_UNARYOP = {ast.Not: "!", ast.Invert: "~", ast.USub: "-"}
+
+def _c(node):
+    if isinstance(node, ast.Expression):
+        return _c(node.body)
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Constant) and isinstance(node.value, (bool, int)):
+        return f"{int(node.value)}LL"
+    if isinstance(node, ast.BinOp) and type(node.op) in _C_BINOP:
+        return f"({_c(node.left)} {_C_BINOP[type(node.op)]} {_c(node.right)})"
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _C_UNARYOP:
+        return f"({_C_UNARYOP[type(node.op)]}{_c(node.operand)})"
+    if isinstance(node, ast.BoolOp):
+        op = " && " if isinstance(node.op, ast.And) else " || "
+        return "(" + op.join(f"({_c(v)} != 0)" for v in node.values) + ")"
+    if isinstance(node, ast.Compare) and len(node.ops) == 1 and type(node.ops[0]) in _C_CMPOP:
+        return f"({_c(node.left)} {_C_CMPOP[type(node.ops[0])]} {_c(node.comparators[0])})"
+    if isinstance(node, ast.IfExp):
+        return f"({_c(node.test)} ? {_c(node.body)} : {_c(node.orelse)})"
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "clog2" and len(node.args) == 1:
+        return f"clog2({_c(node.args[0])})"
+    raise ValueError(f"Unsupported expression in spec: {ast.unparse(node)}")
+
+def to_c(expr):
+    """ Translate a spec expression to C.
+
+    Arguments:
+    expr -- Expression, in the Python subset described above
+    """
+    return _c(ast.parse(expr, mode="eval"))
+
+def python_source(spec):
+    """ Generate the Python model factory for a spec: a function of the
+    parameters that returns (step, outputs), where step(state, **inputs)
+    gives the next state, and outputs maps each output to a function of
+    the state.
+
+    An input that is not resolvable (None) in a condition holds the
+    variable from there on; in a value, it holds the variable.
+
+    Arguments:
+    spec -- Spec
+    """
+    state = list(spec.rules)
+    unpack = f"    {state[0]} = state" if len(state) == 1 else f"    ({', '.join(state)},) = state"
+    lines = [f"def factory({', '.join(spec.params)}):"]
+    lines += [f"    {k} = {v}" for (k, v) in spec.consts.items()]
+    lines += [f"    def step(state, {', '.join(spec.inputs)}):", "    " + unpack]
+    for (var, rules) in spec.rules.items():
+        checked = set()
+        branch = "if"
+        for (cond, value) in rules:
+            unknown = [i for i in _inputs(spec, cond) if i not in checked]
+            if(unknown):
+                lines += [f"        {branch}({' or '.join(f'{i} is None' for i in unknown)}):", f"            {var}_n = {var}"]
+                branch = "elif"
+                checked.update(unknown)
+            lines.append(f"        {branch}({cond}):")
+            unknown = [i for i in _inputs(spec, value) if i not in checked]
+            if(unknown):
+                lines.append(f"            {var}_n = {var} if ({' or '.join(f'{i} is None' for i in unknown)}) else ({value})")
+            else:
+                lines.append(f"            {var}_n = {value}")
+            branch = "elif"
+        lines += ["        else:", f"            {var}_n = {var}"]
+    if(len(state) == 1):
+        lines.append(f"        return {state[0]}_n")
+    else:
+        lines.append(f"        return ({', '.join(v + '_n' for v in state)},)")
+    for (name, expr) in spec.outputs.items():
+        lines += [f"    def {name}(state):", "    " + unpack, f"        return int({expr})"]
+    lines.append(f"    return (step, {{{', '.join(f'{n!r}: {n}' for n in spec.outputs)}}})")
+    return "\n".join(lines) + "\n"
+
+_models = {}
+
+def get_model(top):
+    """ Get the Python model class (a SyncModel) for a top module. Its
+    arguments are the spec's parameters, in order.
+
+    The state of a model with one state variable is that variable,
+    so model.state can be compared to the output directly. Otherwise
+    it is a tuple, and outputs are read with model.output(name).
+
+    Arguments:
+    top -- Name of the top level module
+    """
+    if top in _models:
+        return _models[top]
+
+    from models import SyncModel
+    spec = SPECS[top]
+    env = {"clog2": clog2}
+    exec(compile(python_source(spec), f"<refspec {top}>", "exec"), env)
+    factory = env["factory"]
+    initial = 0 if len(spec.rules) == 1 else (0,) * len(spec.rules)
+
+    def __init__(self, *params):
+        SyncModel.__init__(self, initial)
+        (self._step, self._outputs) = factory(*params)
+
+    def next_state(self, state, **inputs):
+        return self._step(state, **inputs)
+
+    def output(self, name):
+        """The value of an output, as seen at the current time."""
+        return self._outputs[name](self.state)
+
+    name = "".join(w.capitalize() for w in top.split("_")) + "Model"
+    _models[top] = type(name, (SyncModel,), {"__slots__": ("_step", "_outputs"), "__init__": __init__,
+                                             "next_state": next_state, "output": output})
+    return _models[top]
+
+# Name of the bound checker instance inside the DUT.
+CHECK_INSTANCE = "ref_check"
+
+def cpp_source(top, spec):
+    """ Generate the C++ model for a spec, with C (DPI) linkage.
+
+    Arguments:
+    top -- Name of the top level module
+    spec -- Spec
+    """
+    fields = list(spec.params) + list(spec.consts) + list(spec.rules)
+    # Load just the fields that the expressions use.
+    def local(exprs):
+        used = set().union(*(_names(e) for e in exprs))
+        return [f"    long long {n} = m->{n};" for n in fields if n in used]
+    lines = [f"// Generated by util/refspec.py from the {top} spec. Do not edit.",
+             "",
+             "namespace {",
+             f"struct {top}_ref {{",
+             f"    long long {', '.join(fields)};" if fields else "",
+             "};",
+             "",
+             "inline long long clog2(long long v) {",
+             "    long long r = 0;",
+             "    while((1LL << r) < v) r++;",
+             "    return r;",
+             "}",
+             "}",
+             "",
+             f"extern \"C\" void *{top}_ref_new({', '.join(f'long long {p}' for p in spec.params)}) {{",
+             f"    {top}_ref *m = new {top}_ref();"]
+    lines += [f"    m->{p} = {p};" for p in spec.params]
+    lines += [f"    long long {k} = {to_c(v)};\n    m->{k} = {k};" for (k, v) in spec.consts.items()]
+    lines += ["    return m;", "}", ""]
+
+    lines += [f"extern \"C\" void {top}_ref_clock(void *p, {', '.join(f'long long {i}' for i in spec.inputs)}) {{",
+              f"    {top}_ref *m = static_cast<{top}_ref *>(p);"]
+    lines += local([e for rules in spec.rules.values() for r in rules for e in r] + list(spec.rules))
+    for (var, rules) in spec.rules.items():
+        lines.append(f"    long long {var}_n = {var};")
+        branch = "if"
+        for (cond, value) in rules:
+            lines.append(f"    {branch}({to_c(cond)}) {var}_n = {to_c(value)};")
+            branch = "else if"
+    lines += [f"    m->{var} = {var}_n;" for var in spec.rules]
+    lines += ["}", ""]
+
+    lines += [f"extern \"C\" long long {top}_ref_output(void *p, int i) {{",
+              f"    {top}_ref *m = static_cast<{top}_ref *>(p);"]
+    lines += local(spec.outputs.values())
+    lines.append("    switch(i) {")
+    lines += [f"    case {i}: return {to_c(expr)};" for (i, expr) in enumerate(spec.outputs.values())]
+    lines += ["    }", "    return 0;", "}", ""]
+    return "\n".join(lines) + "\n"
+
+def sv_source(top, spec):
+    """ Generate the SystemVerilog checker for a spec, and the bind
+    statement that instantiates it in every instance of the top module.
+
+    At each rising edge, if enable_i is set, every output (before the
+    edge) is compared with the model (before the edge); then the model
+    is clocked with the inputs. The first mismatch sets failed_o, and
+    records the output index, the expected and actual values, and the
+    cycle. Expected outputs are in <output>_e, and update with the
+    DUT's registers.
+
+    Arguments:
+    top -- Name of the top level module
+    spec -- Spec
+    """
+    width = lambda n: f"[{spec.widths[n]}-1:0] " if n in spec.widths else "[0:0] "
+    ports = ["input [0:0] clk_i"] + [f"input {width(n)}{n}" for n in list(spec.inputs) + list(spec.outputs)]
+    params = [f"parameter {p} = 0" for p in spec.params]
+    args = lambda names: ", ".join(f"longint'({n})" for n in names)
+
+    lines = [f"// Generated by util/refspec.py from the {top} spec. Do not edit.",
+             f"module {top}_ref_check"]
+    if(params):
+        lines.append(f"  #({', '.join(params)})")
+    lines.append(f"   ({', '.join(ports)});")
+    lines += ["",
+              f"   import \"DPI-C\" function chandle {top}_ref_new({', '.join(f'input longint {p}' for p in spec.params)});",
+              f"   import \"DPI-C\" function void {top}_ref_clock(input chandle m, {', '.join(f'input longint {i}' for i in spec.inputs)});",
+              f"   import \"DPI-C\" function longint {top}_ref_output(input chandle m, input int i);",
+              "",
+              "   chandle model;",
+              "   // Set by the testbench once the DUT is out of reset.",
+              "   logic [0:0] enable_i = 1'b0;",
+              "   logic [0:0] failed_o = 1'b0;",
+              "   longint cycles_o = 0;",
+              "   longint mismatches_o = 0;",
+              "   // The first mismatch.",
+              "   int output_o = -1;",
+              "   longint expected_o = 0;",
+              "   longint got_o = 0;",
+              "   longint cycle_o = -1;"]
+    lines += [f"   longint {o}_e = 0;" for o in spec.outputs]
+    lines += ["",
+              "   initial begin",
+              f"      model = {top}_ref_new({args(spec.params)});"]
+    lines += [f"      {o}_e = {top}_ref_output(model, {i});" for (i, o) in enumerate(spec.outputs)]
+    lines += ["   end",
+              "",
+              "   always @(posedge clk_i) begin",
+              "      if(enable_i) begin"]
+    for (i, o) in enumerate(spec.outputs):
+        lines += [f"         if(longint'({o}) != {o}_e) begin",
+                  "            if(cycle_o < 0) begin",
+                  f"               output_o = {i};",
+                  f"               expected_o = {o}_e;",
+                  f"               got_o = longint'({o});",
+                  "               cycle_o = cycles_o;",
+                  f"               $display(\"%m: {o} != %0d. Got: %0d at cycle %0d.\", {o}_e, {o}, cycles_o);",
+                  "            end",
+                  "            failed_o <= 1'b1;",
+                  "            mismatches_o = mismatches_o + 1;",
+                  "         end"]
+    lines += ["         cycles_o = cycles_o + 1;",
+              "      end",
+              f"      {top}_ref_clock(model, {args(spec.inputs)});"]
+    lines += [f"      {o}_e <= {top}_ref_output(model, {i});" for (i, o) in enumerate(spec.outputs)]
+    lines += ["   end",
+              "",
+              "endmodule",
+              "",
+              f"bind {top} {top}_ref_check" + (f" #({', '.join(f'.{p}({p})' for p in spec.params)})" if spec.params else "") + f" {CHECK_INSTANCE} (.*);"]
+    return "\n".join(lines) + "\n"
+
+def write_checker(d, top):
+    """ Write the native checker sources for a top module into d, and
+    return their paths, or an empty list if it has no spec.
+
+    Arguments:
+    d -- Directory to write into
+    top -- Name of the top level module
+    """
+    if top not in SPECS:
+        return []
+    spec = SPECS[top]
+    os.makedirs(d, exist_ok=True)
+    paths = []
+    for (name, source) in ((f"{top}_ref.cpp", cpp_source(top, spec)), (f"{top}_ref_check.sv", sv_source(top, spec))):
+        path = os.path.join(d, name)
+        # Leave unchanged files alone, so their mtimes stay put.
+        try:
+            with open(path) as fd:
+                current = fd.read()
+        except OSError:
+            current = None
+        if(current != source):
+            with open(path, "w") as fd:
+                fd.write(source)
+        paths.append(path)
+    return paths
+
+class RefCheck():
+    """ Checks every output of a DUT against its reference model, on
+    every cycle: natively, if the checker was built in (see
+    write_checker), or with a Python model and Scoreboard otherwise.
+    Either way, the test fails at the first mismatch.
+
+    Arguments:
+    dut -- DUT handle (the top level module must have a spec)
+    depth -- Cycles of input history to report on a mismatch (Python only)
+    """
+
+    def __init__(self, dut, depth=8):
+        from models import ClockMonitor
+        self._dut = dut
+        self._spec = SPECS[dut._name]
+        self._depth = depth
+        self.native = hasattr(dut, CHECK_INSTANCE)
+        self._watch = None
+        if(self.native):
+            self._check = getattr(dut, CHECK_INSTANCE)
+        else:
+            self.model = get_model(dut._name)(*[getattr(dut, p).value for p in self._spec.params])
+            self._monitor = ClockMonitor(dut.clk_i, **{i: getattr(dut, i) for i in self._spec.inputs})
+            self._scoreboard = None
+
+    def start(self):
+        """Start clocking the model. Call this before reset."""
+        if(not self.native):
+            self._monitor.start(self.model)
+        return self
+
+    def enable(self):
+        """Compare the outputs on every cycle from now on."""
+        if(self.native):
+            self._check.enable_i.value = 1
+            self._watch = cocotb.start_soon(self._watch_failed())
+        else:
+            from models import Scoreboard
+            self._scoreboard = Scoreboard(self._depth, **{o: (getattr(self._dut, o), self.model, o) for o in self._spec.outputs})
+            self._monitor.attach(self._scoreboard)
+        return self
+
+    async def _watch_failed(self):
+        from cocotb.triggers import RisingEdge
+        await RisingEdge(self._check.failed_o)
+        raise AssertionError(self._report())
+
+    def _report(self):
+        c = self._check
+        name = list(self._spec.outputs)[int(c.output_o.value)]
+        return f"Incorrect Result: {name} != {int(c.expected_o.value)}. Got: {int(c.got_o.value)} at cycle {int(c.cycle_o.value)} (native check)."
+
+    def expected(self, output):
+        """The expected value of an output, as seen at the current time."""
+        if(self.native):
+            return int(getattr(self._check, f"{output}_e").value)
+        return self.model.output(output)
+
+    @property
+    def cycles(self):
+        """Number of cycles checked so far."""
+        if(self.native):
+            return int(self._check.cycles_o.value)
+        return 0 if self._scoreboard is None else self._scoreboard.cycles
+
+    def finish(self):
+        """Stop checking, and fail if there was any mismatch. Returns
+        the number of cycles checked."""
+        cycles = self.cycles
+        if(self.native):
+            self._check.enable_i.value = 0
+            if(self._watch is not None):
+                self._watch.kill()
+            assert int(self._check.mismatches_o.value) == 0, self._report()
+        else:
+            self._monitor.stop()
+        return cycles
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print the sources generated from a reference model spec.")
+    parser.add_argument("top", choices=sorted(SPECS), help="Top level module")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--python", action="store_const", dest="lang", const="python", help="Python model factory (default)")
+    group.add_argument("--cpp", action="store_const", dest="lang", const="cpp", help="C++ DPI model")
+    group.add_argument("--sv", action="store_const", dest="lang", const="sv", help="SystemVerilog checker")
+    args = parser.parse_args(argv)
+
+    spec = SPECS[args.top]
+    if(args.lang == "cpp"):
+        print(cpp_source(args.top, spec), end="")
+    elif(args.lang == "sv"):
+        print(sv_source(args.top, spec), end="")
+    else:
+        print(python_source(spec), end="")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,375 @@
+# Parallel regression runner.
+#
+# Collects the pytest tests in one or more module directories, and
+# runs them on a pool of worker processes instead of serially in one
+# pytest process. Each job is one collected test, i.e. one (module,
+# simulator, parameter set, testcase) for test_each/test_all, or one
+# lint/style check.
+#
+# test_each jobs for the same model are grouped onto one worker, since
+# they are reported from one batched simulation (see runner).
+#
+# Jobs run in two phases. First, every distinct (module, simulator,
+# parameter set) model is compiled once into the build cache (see
+# buildcache.py). Then every test runs against those models, so that
+# workers share compiled artifacts rather than racing to build them.
+#
+# Results are merged into a single results.json.
+#
+# With --incremental, only the module suites whose sources (or tests)
+# changed since they last passed are run; the rest are reported from
+# their cached pass (see depindex.py).
+#
+# Builds and tests are started longest first, by their cost in earlier
+# runs. With --smoke, each module and parameter set only runs on its
+# cheapest simulator, unless the suite changed since it last passed or
+# has no history on one of them (see scheduler.py).
+#
+# Usage (from the repository root, or a module directory):
+#   python3 util/regress.py [-j JOBS] [-k EXPR] [-o results.json] [-i] [--smoke] [DIR ...]
+
+import os
+import sys
+import json
+import time
+import inspect
+import argparse
+import importlib
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pytest
+
+import timing
+import project
+import depindex
+import scheduler
+
+# Test functions that call runner(), and can have their models prebuilt.
+SIM_TESTS = ("test_each", "test_all")
+
+class Job():
+    """One collected pytest test, in a form that can be sent to a worker."""
+
+    def __init__(self, nodeid, path, func, params, timescale, profile=None):
+        self.nodeid = nodeid
+        self.path = path
+        self.func = func
+        self.params = params
+        self.timescale = timescale
+        self.profile = profile
+
+    @property
+    def tbpath(self):
+        return os.path.dirname(self.path)
+
+    @property
+    def module(self):
+        return os.path.splitext(os.path.basename(self.path))[0]
+
+    @property
+    def simulator(self):
+        return self.params.get("simulator")
+
+    @property
+    def testname(self):
+        return self.params.get("test_name")
+
+    @property
+    def parameters(self):
+        """The test's parameters, less simulator and test_name: usually
+        the DUT parameters, but only the test function knows for sure."""
+        return {k: v for k, v in self.params.items() if k not in ("simulator", "test_name")}
+
+    @property
+    def build(self):
+        """Key of the model this job runs on, or None for lint jobs."""
+        if self.func not in SIM_TESTS:
+            return None
+        return (self.tbpath, self.simulator, tuple(sorted(self.parameters.items())))
+
+class _Collector():
+    """pytest plugin that records the collected tests."""
+
+    def __init__(self):
+        self.jobs = []
+
+    def pytest_collection_finish(self, session):
+        for item in session.items:
+            params = dict(item.callspec.params) if hasattr(item, "callspec") else {}
+            self.jobs.append(Job(item.nodeid,
+                                 str(item.fspath),
+                                 item.originalname,
+                                 params,
+                                 getattr(item.module, "timescale", None),
+                                 getattr(item.module, "profile", None)))
+
+def collect(paths, keyword=None):
+    """ Collect the tests in a list of module directories.
+
+    Arguments:
+    paths -- list of directories (or test files) to collect from
+    keyword -- optional pytest -k expression to select tests
+    """
+    collector = _Collector()
+    args = ["--collect-only", "-q", "-p", "no:cacheprovider"] + list(paths)
+    if(keyword is not None):
+        args += ["-k", keyword]
+    ret = pytest.main(args, plugins=[collector])
+    assert ret in (pytest.ExitCode.OK, pytest.ExitCode.NO_TESTS_COLLECTED), f"Test collection failed with exit code {ret}."
+
+    # pytest node ids are relative to the rootdir, make them absolute
+    # so that jobs from different directories can't collide.
+    for job in collector.jobs:
+        job.nodeid = job.path + "::" + job.nodeid.split("::", 1)[-1]
+    return collector.jobs
+
+def _import(job):
+    """Import the test module for a job (once per worker)."""
+    if job.tbpath not in sys.path:
+        sys.path.insert(0, job.tbpath)
+    return importlib.import_module(job.module)
+
+def _job_dir(job):
+    """Scratch directory for one job, so no two jobs share a cwd."""
+    name = job.nodeid.split("::", 1)[-1]
+    for c in "[]/ ":
+        name = name.replace(c, "_")
+    return os.path.join(job.tbpath, "run", "regress", name)
+
+def _execute(job, fn):
+    """ Run fn() for a job inside its scratch directory.
+
+    stdout/stderr (including the simulator subprocess output) are
+    redirected to a log file in the scratch directory.
+    """
+    work = _job_dir(job)
+    os.makedirs(work, exist_ok=True)
+    log = os.path.join(work, "output.log")
+
+    cwd = os.getcwd()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = (os.dup(1), os.dup(2))
+    start = time.time()
+    status = "passed"
+    message = ""
+    with open(log, "w") as fd:
+        os.dup2(fd.fileno(), 1)
+        os.dup2(fd.fileno(), 2)
+        try:
+            os.chdir(work)
+            fn()
+        except BaseException as e:
+            status = "failed"
+            message = "".join(traceback.format_exception_only(type(e), e)).strip()
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(saved[0], 1)
+            os.dup2(saved[1], 2)
+            os.close(saved[0])
+            os.close(saved[1])
+            os.chdir(cwd)
+
+    return {"name": job.nodeid,
+            "status": status,
+            "duration": time.time() - start,
+            "message": message,
+            "log": log}
+
+def build_job(job):
+    """ Compile the model a job runs on into the build cache.
+
+    The test function itself is called, with its module's runner
+    replaced by one that only builds, so the model is built with
+    exactly the parameters and defines the test runs it with.
+    """
+    mod = _import(job)
+    runner = mod.runner
+    signature = inspect.signature(runner)
+
+    def build(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.arguments.update(testname=None, batch=None, compile_only=True)
+        return runner(*bound.args, **bound.kwargs)
+
+    mod.runner = build
+    try:
+        result = _execute(job, lambda: getattr(mod, job.func)(**job.params))
+    finally:
+        mod.runner = runner
+    result["timing"] = timing.take()
+    return result
+
+def run_job(job):
+    """Run one collected test by calling its test function."""
+    mod = _import(job)
+    result = _execute(job, lambda: getattr(mod, job.func)(**job.params))
+    # The timing of every simulation this test ran, see timing.py.
+    result["timing"] = timing.take()
+    return result
+
+def run_group(jobs):
+    """Run several collected tests, in order, in one worker."""
+    return [run_job(j) for j in jobs]
+
+def group(jobs):
+    """ Group jobs that must run in the same worker process.
+
+    test_each runs every test of a (module, simulator, parameters)
+    model in one batched simulation, or in one warm worker simulation
+    (see runner), and reports the result of each test from that
+    simulation. Those jobs must share a worker, or each worker would
+    simulate the whole batch (or start its own warm simulation).
+    """
+    batched = os.environ.get("SIM_BATCH", "1") != "0" or os.environ.get("SIM_WARM", "0") == "1"
+    groups = {}
+    for (i, job) in enumerate(jobs):
+        key = job.build if (batched and job.func == "test_each") else i
+        groups.setdefault(key, []).append(job)
+    return list(groups.values())
+
+def regress(jobs, workers=None, out="results.json", cached=(), costs=None):
+    """ Run jobs on a process pool, and merge the results into one file.
+
+    Arguments:
+    jobs -- list of Job returned by collect
+    workers -- Number of worker processes (defaults to the CPU count)
+    out -- Path to the merged results file
+    cached -- Suite directories that were not run, because they passed
+              with the same inputs before
+    costs -- scheduler.Costs to order the work by (read from the
+             timing history of the jobs by default)
+    """
+    start = time.time()
+    if(costs is None):
+        costs = scheduler.get_costs({j.tbpath for j in jobs})
+    builds = {}
+    for job in jobs:
+        if job.build is not None and job.build not in builds:
+            builds[job.build] = job
+
+    # Share the CPUs between the workers' parallel C++ compiles.
+    if("SIM_MAKE_JOBS" not in os.environ):
+        os.environ["SIM_MAKE_JOBS"] = str(max(1, (os.cpu_count() or 1) // (workers or os.cpu_count() or 1)))
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Phase 1: build every model exactly once.
+        futures = [pool.submit(build_job, j) for j in scheduler.order(list(builds.values()), costs.build)]
+        compiles = []
+        for f in as_completed(futures):
+            r = f.result()
+            compiles.append(r)
+            if r["status"] != "passed":
+                print(f"BUILD FAILED {r['name']}: {r['message']}", flush=True)
+
+        # Phase 2: run every test. Tests whose model failed to build
+        # still run, so that the failure is reported against them.
+        futures = [pool.submit(run_group, g) for g in scheduler.order(group(jobs), lambda g: _group_cost(g, costs))]
+        for f in as_completed(futures):
+            for r in f.result():
+                results.append(r)
+                print(f"{r['status'].upper():6} {r['name']} ({r['duration']:.1f}s)", flush=True)
+
+    results.sort(key=lambda r: r["name"])
+    summary = {"passed": sum(r["status"] == "passed" for r in results),
+               "failed": sum(r["status"] != "passed" for r in results),
+               "builds": len(builds),
+               "cached": len(cached),
+               "wall_time": time.time() - start,
+               "phases": _total_phases(compiles + results)}
+    compiles.sort(key=lambda r: r["name"])
+    with open(out, "w") as fd:
+        json.dump({"tests": results, "builds": compiles, "cached": sorted(cached), "summary": summary}, fd, indent=2)
+    return summary, results
+
+def _group_cost(jobs, costs):
+    """Estimated time to run a group of jobs, or None if unknown."""
+    total = 0.0
+    for job in jobs:
+        if(job.build is None):
+            continue
+        c = costs.run(job)
+        if(c is None):
+            return None
+        total += c
+    return total
+
+def _total_phases(results):
+    """Total wall time per simulation phase, over every job."""
+    total = {}
+    for r in results:
+        for entry in r.get("timing", []):
+            for (k, v) in entry["phases"].items():
+                total[k] = total.get(k, 0.0) + v
+    return total
+
+def incremental(paths):
+    """ Split the suites under paths into those that must run, and
+    those whose cached pass is still valid.
+
+    Arguments:
+    paths -- list of directories
+    """
+    root = project.get_root(paths[0])
+    index = depindex.build_index(root)
+    suites = sorted({s for p in paths for s in depindex.find_suites(p)})
+    stale = depindex.get_stale(root, index, suites)
+    return root, index, stale, [s for s in suites if s not in stale]
+
+def record(root, index, suites, results):
+    """ Record a pass for every suite whose tests all passed.
+
+    Arguments:
+    root -- Repository root
+    index -- dict returned by depindex.build_index
+    suites -- Suite directories that were run
+    results -- list of job results from regress
+    """
+    failed = {os.path.dirname(r["name"].split("::", 1)[0]) for r in results if r["status"] != "passed"}
+    for suite in suites:
+        if(suite in failed):
+            depindex.clear_pass(suite)
+        else:
+            depindex.record_pass(root, suite, index[suite])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run module test suites in parallel.")
+    parser.add_argument("paths", nargs="*", default=["."], help="Module directories to test (default: .)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument("-k", dest="keyword", default=None, help="Only run tests matching this pytest -k expression")
+    parser.add_argument("-o", "--output", default="results.json", help="Merged results file")
+    parser.add_argument("-i", "--incremental", action="store_true", help="Only run suites whose inputs changed since they last passed")
+    parser.add_argument("--smoke", action="store_true", help="Run unchanged suites on their cheapest simulator only")
+    args = parser.parse_args(argv)
+
+    paths = args.paths
+    cached = []
+    if(args.incremental or args.smoke):
+        (root, index, stale, fresh) = incremental(args.paths)
+    if(args.incremental):
+        (paths, cached) = (stale, fresh)
+        for s in cached:
+            print(f"CACHED {os.path.relpath(s)}", flush=True)
+
+    jobs = collect(paths, args.keyword) if paths else []
+    costs = scheduler.get_costs({j.tbpath for j in jobs})
+    if(args.smoke):
+        (jobs, choices) = scheduler.select(jobs, costs, stale)
+        for (tbpath, params, keep, estimates) in choices:
+            if(keep is not None):
+                print(f"SMOKE  {os.path.relpath(tbpath)} {params} on {keep} only", flush=True)
+    (summary, results) = regress(jobs, args.jobs, args.output, cached, costs)
+
+    # A -k selection doesn't run the whole suite, so it can't record a pass.
+    if(args.incremental and args.keyword is None):
+        record(root, index, paths, results)
+
+    print(f"{summary['passed']} passed, {summary['failed']} failed, {summary['cached']} suites cached, {summary['builds']} models in {summary['wall_time']:.1f}s")
+    return 1 if summary["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
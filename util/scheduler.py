@@ -0,0 +1,164 @@
+# Cost-based job scheduling, from the timing history (see timing.py).
+#
+# Every test_each/test_all test is parametrized over both simulators,
+# but the two have very different costs: Verilator pays a large fixed
+# compile cost that dominates small combinational modules, while Icarus
+# is slow on long sequential runs. From the trend files of earlier
+# runs, each (module, simulator, parameter set) model gets an estimated
+# cost:
+#   build -- the compile phase of a simulation that missed the cache
+#   run   -- the per-simulation overhead, plus the time of each test
+#
+# select() keeps, for each module and parameter set, only the jobs of
+# the cheapest simulator (a smoke run). Both simulators still run when
+# the cross-simulator check is needed:
+#   - the suite's sources or tests changed since it last passed (see
+#     depindex.py), or
+#   - either simulator has no timing history for the model yet.
+#
+# order() sorts work longest first, which keeps the total wall time
+# of a run on a pool of workers close to the minimum: long jobs start
+# early, and short ones fill in at the end.
+#
+# Used by regress.py (see --smoke). Show the estimates with:
+#   python3 util/scheduler.py [DIR ...]
+
+import os
+import sys
+import argparse
+import statistics
+
+import timing
+
+def _model(tbpath, simulator, params):
+    return (tbpath, simulator, tuple(sorted((k, str(v)) for (k, v) in params.items())))
+
+class Costs():
+    """Estimated build and run costs, in seconds, per model."""
+
+    def __init__(self, entries):
+        """ Arguments:
+        entries -- list of timing entries (see timing.read_trend)
+        """
+        builds = {}
+        overheads = {}
+        tests = {}
+        for e in entries:
+            m = _model(e["tbpath"], e["simulator"], e["parameters"])
+            phases = e["phases"]
+            if(not e["cache_hit"] and "compile" in phases):
+                builds.setdefault(m, []).append(phases["compile"])
+            if("overhead" in phases):
+                overheads.setdefault(m, []).append(phases["overhead"])
+            for (name, t) in e["tests"].items():
+                tests.setdefault(m, {}).setdefault(name, []).append(t["time"])
+
+        self.builds = {m: statistics.median(v) for (m, v) in builds.items()}
+        self.overheads = {m: statistics.median(v) for (m, v) in overheads.items()}
+        self.tests = {m: {n: statistics.median(v) for (n, v) in t.items()} for (m, t) in tests.items()}
+
+    def known(self, job):
+        """Whether there is any run history for a job's model."""
+        return _model(job.tbpath, job.simulator, job.parameters) in self.overheads
+
+    def build(self, job):
+        """Estimated time to compile the model a job runs on, or None."""
+        return self.builds.get(_model(job.tbpath, job.simulator, job.parameters))
+
+    def run(self, job):
+        """ Estimated time to run a job on a built model, or None.
+
+        test_all runs every test that has been seen on the model;
+        test_each runs just its own.
+        """
+        m = _model(job.tbpath, job.simulator, job.parameters)
+        if(m not in self.overheads):
+            return None
+        tests = self.tests.get(m, {})
+        if(job.func == "test_all"):
+            return self.overheads[m] + sum(tests.values())
+        return self.overheads[m] + tests.get(job.testname, 0.0)
+
+def get_costs(tbpaths):
+    """ Get the cost estimates from the trend files of a set of
+    testbench directories.
+
+    Arguments:
+    tbpaths -- list of testbench directories
+    """
+    paths = {timing.get_trend_file(t) for t in tbpaths}
+    return Costs(timing.read_trend(sorted(p for p in paths if os.path.exists(p))))
+
+def select(jobs, costs, stale=()):
+    """ Keep only the jobs of the cheapest simulator for each module
+    and parameter set, unless both simulators need to run.
+
+    Returns (jobs, choices): the selected jobs, in their original
+    order, and a list of (tbpath, parameters, simulator, estimates),
+    where simulator is the one kept (or None for both) and estimates
+    is a dict of simulator to estimated total cost (or None).
+
+    Arguments:
+    jobs -- list of Job returned by regress.collect
+    costs -- Costs
+    stale -- Suite directories whose inputs changed since they last passed
+    """
+    # Every simulator's jobs for each (module, parameter set).
+    units = {}
+    for job in jobs:
+        if(job.build is None):
+            continue
+        key = (job.tbpath, tuple(sorted((k, str(v)) for (k, v) in job.parameters.items())))
+        units.setdefault(key, {}).setdefault(job.simulator, []).append(job)
+
+    dropped = set()
+    choices = []
+    for ((tbpath, params), by_sim) in units.items():
+        estimates = {}
+        for (sim, sim_jobs) in by_sim.items():
+            if(not all(costs.known(j) for j in sim_jobs)):
+                estimates[sim] = None
+            else:
+                estimates[sim] = (costs.build(sim_jobs[0]) or 0.0) + sum(costs.run(j) for j in sim_jobs)
+
+        keep = None
+        if(tbpath not in stale and None not in estimates.values()):
+            keep = min(estimates, key=estimates.get)
+            for (sim, sim_jobs) in by_sim.items():
+                if(sim != keep):
+                    dropped.update(id(j) for j in sim_jobs)
+        choices.append((tbpath, dict(params), keep, estimates))
+
+    return [j for j in jobs if id(j) not in dropped], choices
+
+def order(items, cost):
+    """ Sort work longest first. Work with no estimate goes first, since
+    it could be the longest.
+
+    Arguments:
+    items -- list of jobs (or groups of jobs)
+    cost -- function from an item to its estimated cost, or None
+    """
+    costs = [cost(i) for i in items]
+    known = [c for c in costs if c is not None]
+    unknown = max(known, default=0.0) + 1.0
+    ranked = sorted(zip(costs, range(len(items))), key=lambda c: -(unknown if c[0] is None else c[0]))
+    return [items[i] for (c, i) in ranked]
+
+def main(argv=None):
+    import regress
+    parser = argparse.ArgumentParser(description="Show the simulator each module would run on in a smoke run.")
+    parser.add_argument("paths", nargs="*", default=["."], help="Module directories (default: .)")
+    args = parser.parse_args(argv)
+
+    jobs = regress.collect(args.paths)
+    costs = get_costs({j.tbpath for j in jobs})
+    (_, choices) = select(jobs, costs)
+    for (tbpath, params, keep, estimates) in sorted(choices, key=lambda c: (c[0], sorted(c[1].items()))):
+        params = ",".join(f"{k}={v}" for (k, v) in params.items())
+        est = ", ".join(f"{s} " + ("?" if c is None else f"{c:.1f}s") for (s, c) in sorted(estimates.items()))
+        print(f"{os.path.relpath(tbpath):24} {params:24} {keep or 'both':10} ({est})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+# Host side of the warm simulator worker pool.
+#
+# runner() normally cold-starts the simulator (and an embedded Python
+# with cocotb) for every simulation. With SIM_WARM=1, runner() instead
+# sends each test to a long-lived simulation of the same compiled
+# model, one per (module, simulator, parameters, defines), so the
+# startup cost is paid once per model rather than once per test.
+#
+# Each worker is a child process that runs simulate() with the
+# simworker cocotb module (see simworker.py), which connects back
+# over a unix socket and runs tests on request. Workers are closed
+# when the Python process exits.
+#
+# A test that gets no reply within SIM_WARM_TIMEOUT seconds (default
+# TIMEOUT) fails, and its worker is killed, so a hung simulation
+# can't hang the whole run. The next test starts a new worker.
+
+import os
+import sys
+import json
+import atexit
+import signal
+import socket
+import tempfile
+import multiprocessing
+
+# Default seconds to wait for the result of one test.
+TIMEOUT = 600
+
+def get_timeout():
+    """Get the per-test timeout from SIM_WARM_TIMEOUT in the environment."""
+    return float(os.environ.get("SIM_WARM_TIMEOUT") or TIMEOUT)
+
+class SimWorker():
+    """A long-lived simulation of one compiled model."""
+
+    def __init__(self, simulator, timescale, tbpath, params, defs, pymodule, profile=None):
+        self._args = (simulator, timescale, tbpath, params, defs)
+        self._pymodule = pymodule
+        self._profile = profile
+        self._proc = None
+        self._sock = None
+        self._stream = None
+        self._tmpdir = None
+
+    def alive(self):
+        return self._proc is not None and self._proc.is_alive() and self._stream is not None
+
+    def start(self):
+        """Start the simulation, and wait until it connects."""
+        self._tmpdir = tempfile.mkdtemp(prefix="simworker")
+        path = os.path.join(self._tmpdir, "sock")
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(path)
+        server.listen(1)
+        # Compiling a model on a build cache miss can take a while.
+        server.settimeout(1.0)
+
+        ctx = multiprocessing.get_context("fork")
+        self._proc = ctx.Process(target=_serve, args=self._args + (self._pymodule, path, self._profile), daemon=True)
+        self._proc.start()
+
+        while True:
+            try:
+                (self._sock, _) = server.accept()
+                break
+            except socket.timeout:
+                if(not self._proc.is_alive()):
+                    server.close()
+                    raise RuntimeError(f"Simulator worker exited before connecting (exit code {self._proc.exitcode}).")
+        server.close()
+        self._sock.settimeout(get_timeout())
+        self._stream = self._sock.makefile("rw")
+
+    def run_test(self, testname):
+        """ Run one test in the simulation, and return its result.
+
+        Arguments:
+        testname -- Name of the cocotb test to run
+        """
+        self._stream.write(json.dumps({"test": testname}) + "\n")
+        self._stream.flush()
+        try:
+            line = self._stream.readline()
+        except socket.timeout:
+            self.kill()
+            return {"name": testname, "status": "failed", "time": 0.0, "sim_time_ns": 0.0,
+                    "message": f"Simulator worker didn't finish the test in {get_timeout():g}s (SIM_WARM_TIMEOUT), and was killed."}
+        if(not line):
+            self.close()
+            return {"name": testname, "status": "failed", "time": 0.0, "sim_time_ns": 0.0,
+                    "message": "Simulator worker exited during the test; see the simulation log."}
+        return json.loads(line)
+
+    def kill(self):
+        """Kill the simulation (and the simulator under it) without
+        waiting for it to finish."""
+        if(self._proc is not None and self._proc.is_alive()):
+            try:
+                os.killpg(self._proc.pid, signal.SIGKILL)
+            except OSError:
+                pass
+        if(self._stream is not None):
+            self._stream.close()
+            self._sock.close()
+            self._stream = None
+        self.close()
+
+    def close(self):
+        """Tell the simulation to finish, and wait for it."""
+        if(self._stream is not None):
+            try:
+                self._stream.write(json.dumps({"quit": True}) + "\n")
+                self._stream.flush()
+            except OSError:
+                pass
+            self._stream.close()
+            self._sock.close()
+            self._stream = None
+        if(self._proc is not None):
+            self._proc.join(timeout=30)
+            if(self._proc.is_alive()):
+                self._proc.kill()
+            self._proc = None
+        if(self._tmpdir is not None):
+            try:
+                os.remove(os.path.join(self._tmpdir, "sock"))
+                os.rmdir(self._tmpdir)
+            except OSError:
+                pass
+            self._tmpdir = None
+
+def _serve(simulator, timescale, tbpath, params, defs, pymodule, path, profile):
+    """Child process: run the worker simulation until the host quits."""
+    from utilities import simulate
+    # Its own process group, so that kill() also kills the simulator.
+    os.setpgrp()
+    os.environ["SIMWORKER_SOCKET"] = path
+    os.environ["SIMWORKER_MODULE"] = pymodule
+    # The simulator's Python must find both simworker and the test
+    # module. cocotb_test builds its PYTHONPATH from sys.path.
+    for path in (os.path.dirname(os.path.realpath(__file__)), tbpath):
+        if(path not in sys.path):
+            sys.path.insert(0, path)
+    simulate(simulator, timescale, tbpath, params, defs, "serve", "warm", pymodule="simworker", profile=profile)
+
+# Running workers, keyed by model.
+_workers = {}
+
+def run_test(simulator, timescale, tbpath, params, defs, testname, pymodule, profile=None):
+    """ Run a test on the warm worker for its model, starting it if necessary.
+
+    Arguments are as for runner(); pymodule is the real test module.
+    """
+    key = (tbpath, simulator, json.dumps(params, sort_keys=True, default=str), tuple(defs), profile)
+    worker = _workers.get(key)
+    if(worker is None or not worker.alive()):
+        worker = SimWorker(simulator, timescale, tbpath, params, defs, pymodule, profile)
+        worker.start()
+        _workers[key] = worker
+    return worker.run_test(testname)
+
+@atexit.register
+def close_all():
+    """Close every running worker."""
+    for worker in _workers.values():
+        worker.close()
+    _workers.clear()
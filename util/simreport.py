@@ -0,0 +1,63 @@
+# pytest hooks shared by every module: test names, and per-test
+# simulation results.
+#
+# When runner() reports a test from a batched simulation (several
+# cocotb tests in one simulator process), pytest would otherwise
+# charge the whole simulation to whichever test happened to run it.
+# runner() records the per-test result here, and the hook below
+# rewrites the pytest report so each test shows its own duration and
+# simulation time, as if it had been simulated separately.
+#
+# The timing of every simulation a test ran (see timing.py) is
+# attached to it as the "simulation" user property, and the simulated
+# clock cycles as "cycles".
+#
+# Test parameters are printed as part of the test name, as
+# <argname>=<value>.
+#
+# Each module's conftest.py imports the hooks from this file. (Not
+# with pytest_plugins, which pytest rejects in conftest.py files below
+# the rootdir, as when regress.py collects several modules at once.)
+
+import pytest
+
+import timing
+
+# Results recorded by runner() during the current pytest test.
+_pending = []
+
+def record(result):
+    """ Record a per-test result for the pytest test that is running.
+
+    Arguments:
+    result -- dict with at least the keys name, status and time
+    """
+    _pending.append(result)
+
+def pytest_make_parametrize_id(config, val, argname):
+    return f"{argname}={val}"
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    outcome = yield
+    report = outcome.get_result()
+
+    if(call.when == "setup"):
+        _pending.clear()
+        timing.take()
+    if(call.when != "call"):
+        return
+
+    for entry in timing.take():
+        item.user_properties.append(("simulation", entry))
+
+    results = list(_pending)
+    _pending.clear()
+
+    if(results):
+        report.duration = sum(r["time"] for r in results)
+    for r in results:
+        item.user_properties.append(("sim_time_ns", r["sim_time_ns"]))
+        item.user_properties.append(("cycles", r["sim_time_ns"] / timing.CLOCK_PERIOD_NS))
+        item.user_properties.append(("real_time", r["time"]))
+    report.user_properties = list(item.user_properties)
@@ -0,0 +1,136 @@
+# In-simulator side of the warm worker pool (see simpool.py).
+#
+# This is the cocotb test module (MODULE=simworker) of a long-lived
+# simulation. Its only test, serve, connects to the host over the
+# unix socket in SIMWORKER_SOCKET, then runs tests from the real test
+# module (SIMWORKER_MODULE) as the host requests them, one at a time,
+# sending each result back. Tests are scored with their cocotb.test
+# options (expect_fail, expect_error, timeout_time) as cocotb itself
+# would score them; like a test named in TESTCASE, a requested test
+# runs even if it is marked skip. Between tests, every task the test
+# started (clocks, models) is killed, and sequential DUTs are reset
+# with reset_sequence().
+#
+# Requests and replies are one json object per line:
+#   host -> sim: {"test": "<name>"} or {"quit": true}
+#   sim -> host: {"name", "status", "time", "sim_time_ns", "message"}
+
+import os
+import json
+import time
+import socket
+import importlib
+
+import cocotb
+
+from cocotb.utils import get_sim_time
+from cocotb.regression import _Failed
+
+from utilities import clock_start_sequence, reset_sequence
+
+class _TaskTracker():
+    """Records every task started with cocotb.start_soon while active."""
+
+    def __init__(self):
+        self.tasks = []
+        self._start_soon = None
+
+    def __enter__(self):
+        self._start_soon = cocotb.start_soon
+        def start_soon(coro):
+            task = self._start_soon(coro)
+            self.tasks.append(task)
+            return task
+        cocotb.start_soon = start_soon
+        return self
+
+    def __exit__(self, *exc):
+        cocotb.start_soon = self._start_soon
+        for task in self.tasks:
+            if(not task.done()):
+                task.kill()
+        self.tasks = []
+
+def _score(t, error):
+    """ Get the (status, message) of a test that raised error (or None),
+    given its cocotb.test options, the way cocotb's regression manager
+    scores it: expect_fail passes on a failed assertion, expect_error
+    on one of its exception types, and either fails if the test passes.
+
+    Arguments:
+    t -- Test, as decorated by cocotb.test
+    error -- Exception the test raised, or None
+    """
+    expect_fail = getattr(t, "expect_fail", False)
+    expect_error = getattr(t, "expect_error", ())
+    if(error is None):
+        if(expect_error):
+            return ("failed", "passed but we expected an error")
+        if(expect_fail):
+            return ("failed", "passed but we expected a failure")
+        return ("passed", "")
+    if(expect_fail and isinstance(error, (AssertionError, _Failed))):
+        return ("passed", "")
+    if(expect_error and isinstance(error, expect_error)):
+        return ("passed", "")
+    return ("failed", f"{type(error).__name__}: {error}")
+
+async def _run_one(dut, mod, name):
+    """Run one test from the test module, and return its result."""
+    result = {"name": name, "status": "passed", "message": "", "time": 0.0, "sim_time_ns": 0.0}
+
+    t = getattr(mod, name, None)
+    if(t is None):
+        result.update(status="failed", message=f"No test named {name} in {mod.__name__}")
+        return result
+
+    # cocotb.test (and TestFactory) wrap the test coroutine function;
+    # with timeout_time, _func is already wrapped in the timeout.
+    func = getattr(t, "_func", t)
+
+    start = time.time()
+    sim_start = get_sim_time(units="ns")
+    error = None
+    with _TaskTracker():
+        try:
+            await func(dut)
+        except Exception as e:
+            error = e
+    (result["status"], result["message"]) = _score(t, error)
+
+    result["time"] = time.time() - start
+    result["sim_time_ns"] = get_sim_time(units="ns") - sim_start
+    return result
+
+async def _reset(dut):
+    """Put sequential DUTs back into reset state between tests."""
+    if(not (hasattr(dut, "clk_i") and hasattr(dut, "reset_i"))):
+        return
+    clock = await clock_start_sequence(dut.clk_i)
+    await reset_sequence(dut.clk_i, dut.reset_i, 10)
+    clock.kill()
+
+@cocotb.test()
+async def serve(dut):
+    """Serve test requests from the host until told to quit."""
+    mod = importlib.import_module(os.environ["SIMWORKER_MODULE"])
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(os.environ["SIMWORKER_SOCKET"])
+    stream = sock.makefile("rw")
+
+    # Reading blocks the simulator, which is what we want: simulation
+    # time does not advance between requests.
+    for line in stream:
+        req = json.loads(line)
+        if(req.get("quit")):
+            break
+
+        result = await _run_one(dut, mod, req["test"])
+        stream.write(json.dumps(result) + "\n")
+        stream.flush()
+
+        await _reset(dut)
+
+    stream.close()
+    sock.close()
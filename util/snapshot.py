@@ -0,0 +1,152 @@
+# Post-reset snapshots, to skip the reset preamble of every test.
+#
+# Every sequential test starts with reset_sequence(), which holds reset
+# for a number of cycles before the test does anything useful. With
+# SIM_SNAPSHOT=1 in the environment, the state of the whole design at
+# the end of reset (the value of every signal in the hierarchy, except
+# the clock, the reset and the top level inputs) is saved the first
+# time a model is reset, next to the model in the build cache. Every
+# later reset_sequence() on the same model, in any simulation, with the
+# same reset signal, reset length and top level input values, restores
+# that state on the first falling edge, and holds reset for one cycle
+# instead of running all of the reset cycles.
+#
+# The snapshot is taken on the last falling edge of a real reset,
+# while reset is still asserted, and restored on the first falling
+# edge of the call. The one rising edge with reset asserted that
+# follows leaves the design in the same state, and resets anything
+# that is clocked alongside it (e.g. the Python reference models,
+# which follow the clock through models.ClockMonitor and never see
+# the restore). Reset is released on the next falling edge, and the
+# test starts on the one after, as after a real reset.
+#
+# This is taken at the signal level, through the simulator interface
+# (not Verilator's --savable, since cocotb's own state can't be
+# saved with the model), so it works the same on Icarus. It assumes
+# that reset clears all state, which is what the reset tests check,
+# so it is off by default: leave it off for graded and regression
+# runs. SIM_WARM (see simpool.py) skips the simulator startup cost.
+#
+# simulate() passes the snapshot file and the names of the top level
+# inputs to the simulation in SIM_SNAPSHOT_FILE and SIM_SNAPSHOT_INPUTS.
+# Usage (in reset_sequence):
+#   state = load(clk_i, reset_i, cycles, active_level)
+#   ...
+#   save(clk_i, reset_i, cycles, active_level)
+
+import os
+import json
+import fcntl
+
+import cocotb
+from cocotb.handle import RegionObject, ModifiableObject, IntegerObject, NonHierarchyIndexableObject, RealObject, EnumObject, StringObject
+from cocotb.types import LogicArray
+
+FILE = "snapshots.json"
+
+# Every signal in the design, by path, found on first use.
+_signals = None
+
+# Snapshots read from the file, by key.
+_snapshots = None
+
+def enabled():
+    """Whether this simulation takes and restores snapshots."""
+    return bool(os.environ.get("SIM_SNAPSHOT_FILE"))
+
+def _walk(handle, found):
+    # Signals (and integers) are leaves; arrays and scopes are searched.
+    if(isinstance(handle, (RealObject, EnumObject, StringObject))):
+        return
+    if(isinstance(handle, (ModifiableObject, IntegerObject))):
+        found[handle._path] = handle
+    elif(isinstance(handle, (RegionObject, NonHierarchyIndexableObject))):
+        for h in handle:
+            _walk(h, found)
+
+def get_signals():
+    """Get every writable signal under the top level, by path."""
+    global _signals
+    if(_signals is None):
+        _signals = {}
+        _walk(cocotb.top, _signals)
+    return _signals
+
+def _value(handle):
+    v = handle.value
+    return v if isinstance(v, int) else v.binstr
+
+def _skip(clk_i, reset_i):
+    inputs = [n for n in os.environ.get("SIM_SNAPSHOT_INPUTS", "").split(",") if n]
+    return {clk_i._path, reset_i._path} | {getattr(cocotb.top, n)._path for n in inputs}
+
+def get_key(clk_i, reset_i, cycles, active_level):
+    """ Get the key of a reset: the reset signal, its length and level,
+    and the current values of the top level inputs.
+
+    Arguments are as for reset_sequence.
+    """
+    inputs = sorted(n for n in os.environ.get("SIM_SNAPSHOT_INPUTS", "").split(",") if n)
+    values = {n: _value(getattr(cocotb.top, n)) for n in inputs
+              if getattr(cocotb.top, n)._path not in (clk_i._path, reset_i._path)}
+    return json.dumps([reset_i._path, cycles, bool(active_level), values], sort_keys=True)
+
+def _read(path):
+    try:
+        with open(path) as fd:
+            return json.load(fd)
+    except (OSError, ValueError):
+        return {}
+
+def load(clk_i, reset_i, cycles, active_level):
+    """ Get the saved state for a reset, or None if there isn't one (or
+    snapshots are off).
+
+    Arguments are as for reset_sequence.
+    """
+    global _snapshots
+    if(not enabled()):
+        return None
+    if(_snapshots is None):
+        _snapshots = _read(os.environ["SIM_SNAPSHOT_FILE"])
+    return _snapshots.get(get_key(clk_i, reset_i, cycles, active_level))
+
+def save(clk_i, reset_i, cycles, active_level):
+    """ Save the current state of the design for a reset, if snapshots
+    are on and it hasn't been saved yet.
+
+    Arguments are as for reset_sequence.
+    """
+    global _snapshots
+    if(not enabled()):
+        return
+    key = get_key(clk_i, reset_i, cycles, active_level)
+    if(_snapshots is not None and key in _snapshots):
+        return
+    skip = _skip(clk_i, reset_i)
+    state = {p: _value(h) for (p, h) in get_signals().items() if p not in skip}
+
+    # Other simulations of the same model may save at the same time.
+    path = os.environ["SIM_SNAPSHOT_FILE"]
+    with open(path + ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        _snapshots = _read(path)
+        _snapshots.setdefault(key, state)
+        tmp = f"{path}.{os.getpid()}"
+        with open(tmp, "w") as fd:
+            json.dump(_snapshots, fd)
+        os.replace(tmp, path)
+
+def restore(state):
+    """ Write a saved state back into the design. Signals that already
+    have their saved value are left alone.
+
+    Arguments:
+    state -- Saved state, from load
+    """
+    signals = get_signals()
+    for (p, v) in state.items():
+        h = signals.get(p)
+        if(h is None or _value(h) == v):
+            continue
+        h.value = v if isinstance(v, int) else LogicArray(v)
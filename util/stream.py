@@ -0,0 +1,93 @@
+# Streaming stimulus for long sequential runs.
+#
+# play() (in utilities.py) takes the whole stimulus as an array, so
+# its memory grows with the length of the run. drive() takes any
+# iterable of input vectors instead, usually a generator, and pulls
+# one vector per clock cycle. Nothing is kept from earlier cycles, so
+# a multi-million cycle soak test runs in the same memory as a short
+# one. (play() is drive() over the rows of its array.)
+#
+# Anything the test needs to know about the stimulus afterwards (how
+# many up pulses there were, where the last 0 was) is accumulated as
+# the vectors go by, with tap(), rather than by keeping the sequence.
+#
+# Usage:
+#   vectors = generate(n, lambda: (random.randint(0, 1), random.randint(0, 1)))
+#   await drive(clk_i, [enable_i, d_i], vectors)
+
+from cocotb.triggers import ClockCycles, FallingEdge
+
+def generate(n, fn):
+    """ Generate n input vectors, lazily.
+
+    Arguments:
+    n -- Number of vectors
+    fn -- Function returning the next vector (a tuple, with one value
+          per input, or a single value if there is only one input)
+    """
+    for i in range(n):
+        yield fn()
+
+def tap(vectors, fn):
+    """ Pass vectors through unchanged, calling fn(i, vector) on each
+    one as it is consumed.
+
+    Arguments:
+    vectors -- Iterable of input vectors
+    fn -- Function to call on every vector, with its index
+    """
+    for (i, v) in enumerate(vectors):
+        fn(i, v)
+        yield v
+
+# Stands in for the vector before the first one.
+_START = object()
+
+def _apply(inputs, vector, last):
+    if(not isinstance(vector, tuple)):
+        vector = (vector,)
+    for (j, v) in enumerate(vector):
+        if(v != last[j]):
+            inputs[j].value = v
+            last[j] = v
+
+async def drive(clk_i, inputs, vectors):
+    """ Apply one input vector per clock cycle, on the falling edge,
+    pulling the vectors from an iterable as they are needed. Returns
+    the number of vectors applied.
+
+    Vector i is applied on the (i+1)th falling edge after the call,
+    like awaiting FallingEdge and assigning the inputs in a loop, and
+    drive returns once the last vector has been applied. Only vectors
+    that differ from the previous one wake up Python: runs of
+    identical vectors are skipped with a single ClockCycles trigger,
+    and only the inputs that changed are written.
+
+    Arguments:
+    clk_i -- Clock handle
+    inputs -- list of input handles
+    vectors -- Iterable of input vectors (see generate)
+    """
+    fall = FallingEdge(clk_i)
+    last = [None] * len(inputs)
+
+    n = 0
+    wait = 0
+    prev = _START
+    for v in vectors:
+        n += 1
+        wait += 1
+        if(v == prev):
+            continue
+        if(wait == 1):
+            await fall
+        else:
+            await ClockCycles(clk_i, wait, rising=False)
+        wait = 0
+        _apply(inputs, v, last)
+        prev = v
+
+    # Hold the last vector until the end of the stimulus.
+    if(wait > 0):
+        await ClockCycles(clk_i, wait, rising=False)
+    return n
@@ -0,0 +1,253 @@
+# Verilator thread-count benchmark: at what design size does a
+# multithreaded model (SIM_THREADS, see utilities.py) pay off?
+#
+# Verilator's threads synchronize on every evaluation of the model,
+# so a small design runs slower on several threads than on one. To
+# find the crossover, this builds a wrapper (threadbench) around
+# copies_p copies of an FPGA top level (by default part2/counter/top.sv,
+# with everything in its filelist), each driven by its own inputs so
+# that Verilator can't merge any logic between them.
+# Every (copies, threads) point is built and simulated for a fixed
+# number of clock cycles in its own process, and the cycles per second
+# are tabulated. The crossover is the smallest number of copies at
+# which more than one thread is fastest.
+#
+# The wrapper, its filelist and the build cache are generated under
+# <repository root>/build/threadbench.
+#
+# Usage (from anywhere in the repository):
+#   python3 util/threadbench.py [-c 1,4,16,64] [-t 1,2,4] [-n CYCLES] [-o threadbench.json] [DIR]
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+import cocotb
+from cocotb.triggers import ClockCycles
+
+UTIL = os.path.dirname(os.path.realpath(__file__))
+TOP = "threadbench"
+
+def get_ports(path, module="top"):
+    """ Get the ports of a module, as a list of (direction, width, name).
+
+    Arguments:
+    path -- Source file defining the module
+    module -- Module name
+    """
+    import depindex
+    ports = depindex.get_ports(depindex._read(path), module)
+    assert ports is not None, f"{path} doesn't define {module}."
+    return ports
+
+def wrapper_source(ports, module="top"):
+    """ Get the source of the threadbench wrapper around copies of a
+    module. Every copy's clock input (the one named clk...) is driven
+    by clk_i. Its reset input (named ...reset..., active low if it has
+    _n in its name) is driven by its own bit of reset_i, and its other
+    inputs by its own slice of in_i. All of the outputs are reduced
+    into out_o.
+
+    Arguments:
+    ports -- Ports of the module, from get_ports
+    module -- Module name
+    """
+    inputs = [p for p in ports if p[0] == "input"]
+    clock = next(p[2] for p in inputs if p[2].startswith("clk"))
+    reset = next((p[2] for p in inputs if "reset" in p[2]), None)
+    data = [p for p in inputs if p[2] not in (clock, reset)]
+    outputs = [p for p in ports if p[0] == "output"]
+    width = max(1, sum(p[1] for p in data))
+
+    conns = [f".{clock}(clk_i)"]
+    if(reset is not None):
+        conns.append(f".{reset}({'~' if '_n' in reset else ''}reset_i[i])")
+    lsb = 0
+    for (direction, w, name) in data:
+        conns.append(f".{name}(in_w[{lsb + w - 1}:{lsb}])")
+        lsb += w
+    conns += [f".{name}({name})" for (direction, w, name) in outputs]
+
+    wires = "".join(f"      wire [{w - 1}:0] {name};\n" for (direction, w, name) in outputs)
+    reduce = ", ".join(name for (direction, w, name) in outputs)
+    return (f"// Generated by util/threadbench.py, do not edit.\n"
+            f"module {TOP}\n"
+            f"  #(parameter copies_p = 1)\n"
+            f"  (input [0:0] clk_i\n"
+            f"  ,input [copies_p-1:0] reset_i\n"
+            f"  ,input [copies_p*{width}-1:0] in_i\n"
+            f"  ,output [0:0] out_o);\n"
+            f"\n"
+            f"   wire [copies_p-1:0] out_w;\n"
+            f"   genvar i;\n"
+            f"   for (i = 0; i < copies_p; i++) begin : g_copy\n"
+            f"      wire [{width - 1}:0] in_w = in_i[i*{width} +: {width}];\n"
+            f"{wires}"
+            f"      {module} dut ({', '.join(conns)});\n"
+            f"      assign out_w[i] = ^{{{reduce}}};\n"
+            f"   end\n"
+            f"   assign out_o = ^out_w;\n"
+            f"endmodule\n")
+
+def setup(path, design="top.sv"):
+    """ Generate the wrapper and its filelist for the design in a module
+    directory, and return the directory they are in. Files are only
+    rewritten if they change, so that they don't invalidate the build
+    cache.
+
+    Arguments:
+    path -- Module directory, with the design and its filelist.json
+    design -- Source file of the top level, in path
+    """
+    import project
+    root = project.get_root(path)
+    filelist = project.get_filelist(path, root=root)
+    design = os.path.join(os.path.abspath(path), design)
+
+    d = os.path.join(root, "build", TOP)
+    os.makedirs(d, exist_ok=True)
+    wrapper = os.path.join(d, f"{TOP}.sv")
+    files = list(filelist.sources) + [design, wrapper]
+    outputs = {wrapper: wrapper_source(get_ports(design)),
+               os.path.join(d, project.FILELIST): json.dumps({"top": TOP,
+                                                               "files": [os.path.relpath(f, root) for f in files],
+                                                               "includes": [os.path.relpath(f, root) for f in filelist.includes],
+                                                               "defines": list(filelist.defines)}, indent=4) + "\n"}
+    for (f, text) in outputs.items():
+        if(not os.path.isfile(f) or open(f).read() != text):
+            with open(f, "w") as fd:
+                fd.write(text)
+    return d
+
+@cocotb.test()
+async def soak(dut):
+    """Run the wrapper for THREADBENCH_CYCLES cycles, changing the inputs every 1000."""
+    import random
+    from utilities import clock_start_sequence
+
+    cycles = int(os.environ.get("THREADBENCH_CYCLES", "100000"))
+    dut.in_i.value = 0
+    dut.reset_i.value = (1 << len(dut.reset_i)) - 1
+    await clock_start_sequence(dut.clk_i)
+    await ClockCycles(dut.clk_i, 10, rising=False)
+    dut.reset_i.value = 0
+    width = len(dut.in_i)
+    for i in range(0, cycles, 1000):
+        dut.in_i.value = random.getrandbits(width)
+        await ClockCycles(dut.clk_i, min(1000, cycles - i))
+
+def _point(d, copies, threads, cycles):
+    """ Build and run one point in this process, and print the result.
+    Called in a child process, see measure()."""
+    import timing
+    from utilities import simulate
+
+    os.environ["SIM_THREADS"] = str(threads)
+    os.environ["THREADBENCH_CYCLES"] = str(cycles)
+    failed = False
+    try:
+        simulate("verilator", "1ps/1ps", d, {"copies_p": copies}, [], None,
+                 f"threads{threads}", pymodule=TOP, profile="fast-run")
+    except (AssertionError, SystemExit):
+        failed = True
+    entries = timing.take()
+    print(json.dumps({"entry": entries[-1] if entries else None, "failed": failed}))
+
+def measure(d, copies, threads, cycles):
+    """ Measure one (copies, threads) point in a fresh interpreter.
+
+    Arguments:
+    d -- Directory from setup()
+    copies -- Number of copies of the design
+    threads -- Verilator thread count
+    cycles -- Clock cycles to simulate
+    """
+    cmd = [sys.executable, os.path.join(UTIL, "threadbench.py"), "--point", d, str(copies), str(threads), str(cycles)]
+    p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    lines = p.stdout.strip().splitlines()
+    r = json.loads(lines[-1]) if (p.returncode == 0 and lines) else {"entry": None, "failed": True}
+    entry = r["entry"] or {}
+    return {"copies": copies,
+            "threads": threads,
+            "build_s": entry.get("phases", {}).get("compile", 0.0),
+            "cycles_per_sec": entry.get("cycles_per_sec", 0.0),
+            "failed": r["failed"]}
+
+def crossover(results):
+    """ Get the smallest number of copies at which more than one thread
+    is fastest, or None if one thread is always fastest.
+
+    Arguments:
+    results -- list of results from measure
+    """
+    by_copies = {}
+    for r in results:
+        if(not r["failed"]):
+            by_copies.setdefault(r["copies"], []).append(r)
+    for (copies, rs) in sorted(by_copies.items()):
+        if(max(rs, key=lambda r: r["cycles_per_sec"])["threads"] > 1):
+            return copies
+    return None
+
+def table(results):
+    """ Format results as a table: one row per number of copies, with
+    the cycles per second of each thread count.
+
+    Arguments:
+    results -- list of results from measure
+    """
+    threads = sorted({r["threads"] for r in results})
+    rows = {}
+    for r in results:
+        rows.setdefault(r["copies"], {})[r["threads"]] = r
+    header = f"{'copies':>6}" + "".join(f" | {f'{t} thread' + ('s' if t > 1 else ''):>12}" for t in threads) + " | fastest"
+    lines = [header, "-" * len(header)]
+    for (copies, by_threads) in sorted(rows.items()):
+        line = f"{copies:>6}"
+        for t in threads:
+            r = by_threads.get(t)
+            line += f" | {'failed' if (r is None or r['failed']) else format(r['cycles_per_sec'], ',.0f'):>12}"
+        ok = [r for r in by_threads.values() if not r["failed"]]
+        line += " | " + (str(max(ok, key=lambda r: r["cycles_per_sec"])["threads"]) if ok else "-")
+        lines.append(line)
+    return "\n".join(lines)
+
+def _ints(s):
+    return [int(x) for x in s.split(",")]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find the design size at which multithreaded Verilator models pay off.")
+    parser.add_argument("path", nargs="?", default=None, help="Module directory with top.sv (default: part2/counter)")
+    parser.add_argument("-c", "--copies", type=_ints, default=[1, 4, 16, 64], help="Numbers of copies of the design")
+    parser.add_argument("-t", "--threads", type=_ints, default=[1, 2, 4], help="Thread counts")
+    parser.add_argument("-n", "--cycles", type=int, default=200000, help="Clock cycles per simulation")
+    parser.add_argument("-o", "--output", default="threadbench.json", help="Results file")
+    parser.add_argument("--point", nargs=4, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if(args.point is not None):
+        (d, copies, threads, cycles) = args.point
+        _point(d, int(copies), int(threads), int(cycles))
+        return 0
+
+    import project
+    path = args.path or os.path.join(project.get_root(), "part2", "counter")
+    d = setup(path)
+    results = []
+    for copies in args.copies:
+        for threads in args.threads:
+            r = measure(d, copies, threads, args.cycles)
+            results.append(r)
+            print(f"{'FAILED' if r['failed'] else 'DONE':6} copies={copies} threads={threads}", flush=True)
+
+    with open(args.output, "w") as fd:
+        json.dump(results, fd, indent=2)
+    print(table(results))
+    copies = crossover(results)
+    print("Crossover: " + ("one thread is always fastest" if copies is None else f"threads pay off from {copies} copies"))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
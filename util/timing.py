@@ -0,0 +1,226 @@
+# Per-simulation timing, for finding slow tests and slow simulators.
+#
+# simulate() measures the wall time of each phase of a simulation:
+#   resolve  -- reading the filelist and setting up the run directory
+#   compile  -- looking up the model in the build cache, and building
+#               it on a miss
+#   sim      -- the simulator process, start to finish, of which:
+#     tests    -- time spent in the cocotb tests (from results.xml)
+#     overhead -- everything else, of which:
+#       launch    -- cocotb_test's setup, until the simulator process
+#                    starts
+#       elaborate -- loading and elaborating the model, and starting
+#                    the embedded Python and cocotb, until cocotb
+#                    imports the test module
+#       startup   -- importing the test modules, and cocotb's setup
+#                    before and between the tests
+#       teardown  -- from writing results.xml, after the last test,
+#                    until the simulator process exits
+# as well as the simulated time, the number of clock cycles that is
+# (at the 1 ns clock from clock_start_sequence), and cycles per second.
+#
+# The overhead is split with wall clock marks (see get_marks): when
+# the simulator process started, and when the test module was loaded,
+# both recorded by mark() in the simulation, which utilities.py calls
+# when it is imported there, and when results.xml was written. Without
+# the marks (e.g. on a platform without /proc), only the overhead is
+# recorded.
+#
+# Each entry is attached to the pytest test that ran the simulation
+# as a user property (see simreport.py), added to the results.json
+# written by regress.py, and appended to a trend file: run/timing.jsonl
+# in the testbench directory, or SIM_TIMING_FILE if it is set.
+#
+# Summarize trend files with:
+#   python3 util/timing.py [-n N] [FILE ...]
+
+import os
+import sys
+import json
+import time
+
+CLOCK_PERIOD_NS = 1
+
+# Entries recorded since the last call to take().
+_pending = []
+
+# Suffix of the marks file written next to results.xml by mark().
+MARKS = ".marks.json"
+
+def _process_start():
+    """The wall clock time this process started, or None."""
+    try:
+        with open("/proc/self/stat") as fd:
+            stat = fd.read()
+        # starttime (field 22) is in clock ticks since boot.
+        ticks = int(stat.rsplit(")", 1)[1].split()[19])
+        since = time.clock_gettime(time.CLOCK_BOOTTIME) - ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+    return time.time() - since
+
+def mark():
+    """ In a simulation: record when the simulator process started, and
+    the current time (when the test module is loaded), next to the
+    results file."""
+    path = os.environ.get("COCOTB_RESULTS_FILE")
+    if(not path):
+        return
+    marks = {"python": time.time(), "process": _process_start()}
+    with open(path + MARKS, "w") as fd:
+        json.dump({k: v for (k, v) in marks.items() if v is not None}, fd)
+
+def get_marks(results, start, end):
+    """ Get the wall clock marks of one simulation: its start and end
+    (as seen by the host), the marks recorded by mark(), and when the
+    results file was written.
+
+    Arguments:
+    results -- Path to the results.xml file
+    start -- Wall clock time the simulation was started
+    end -- Wall clock time it finished
+    """
+    marks = {"start": start, "end": end}
+    try:
+        with open(results + MARKS) as fd:
+            marks.update(json.load(fd))
+        marks["written"] = os.path.getmtime(results)
+    except (OSError, ValueError):
+        pass
+    return marks
+
+def _split(overhead, marks):
+    """Split the overhead of a simulation into phases, with its marks."""
+    if(not {"python", "written"} <= set(marks)):
+        return {}
+    phases = {"teardown": min(overhead, max(0.0, marks["end"] - marks["written"]))}
+    left = overhead - phases["teardown"]
+    t = marks["start"]
+    for (phase, m) in (("launch", "process"), ("elaborate", "python")):
+        if(m in marks):
+            phases[phase] = min(left, max(0.0, marks[m] - t))
+            left -= phases[phase]
+            t = marks[m]
+    phases["startup"] = left
+    return phases
+
+def get_trend_file(tbpath):
+    """ Get the path of the trend file for a testbench.
+
+    Arguments:
+    tbpath -- Path to the testbench directory
+    """
+    return os.environ.get("SIM_TIMING_FILE") or os.path.join(tbpath, "run", "timing.jsonl")
+
+def get_entry(tbpath, simulator, params, testcase, phases, results, cache_hit, marks=None):
+    """ Make a timing entry for one simulation.
+
+    Arguments:
+    tbpath -- Path to the testbench directory
+    simulator -- Simulator name
+    params -- dict of top level parameters
+    testcase -- Test name(s) that were run, comma separated, or None for all
+    phases -- dict of phase name to wall time in seconds
+    results -- Per-test results, as returned by read_results
+    cache_hit -- Whether the model came from the build cache
+    marks -- Wall clock marks of the simulation, from get_marks
+    """
+    phases = dict(phases)
+    sim_time_ns = sum(r["sim_time_ns"] for r in results.values())
+    if("sim" in phases):
+        phases["tests"] = sum(r["time"] for r in results.values())
+        phases["overhead"] = max(0.0, phases["sim"] - phases["tests"])
+        phases.update(_split(phases["overhead"], marks or {}))
+
+    cycles = sim_time_ns / CLOCK_PERIOD_NS
+    return {"time": time.time(),
+            "tbpath": tbpath,
+            "simulator": simulator,
+            "parameters": {k: str(v) for (k, v) in params.items()},
+            "testcase": testcase or "all",
+            "cache_hit": cache_hit,
+            "phases": phases,
+            "sim_time_ns": sim_time_ns,
+            "cycles": cycles,
+            "cycles_per_sec": cycles / phases["sim"] if phases.get("sim") else 0.0,
+            "tests": {r["name"]: {"time": r["time"], "sim_time_ns": r["sim_time_ns"]} for r in results.values()}}
+
+def record(entry):
+    """ Record a timing entry: keep it for the test report, and append
+    it to the trend file.
+
+    Arguments:
+    entry -- dict returned by get_entry
+    """
+    _pending.append(entry)
+    path = get_trend_file(entry["tbpath"])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as fd:
+        fd.write(json.dumps(entry) + "\n")
+
+def take():
+    """Get (and forget) the entries recorded since the last call."""
+    entries = list(_pending)
+    _pending.clear()
+    return entries
+
+def read_trend(paths):
+    """ Read the entries from trend files.
+
+    Arguments:
+    paths -- list of trend file paths
+    """
+    entries = []
+    for p in paths:
+        with open(p) as fd:
+            entries += [json.loads(l) for l in fd if l.strip()]
+    return entries
+
+def summarize(entries, n=10):
+    """ Get a text summary of timing entries: totals per simulator and
+    phase, and the slowest tests.
+
+    Arguments:
+    entries -- list of timing entries
+    n -- Number of slowest tests to list
+    """
+    lines = []
+    sims = {}
+    for e in entries:
+        s = sims.setdefault(e["simulator"], {"runs": 0, "cycles": 0.0, "phases": {}})
+        s["runs"] += 1
+        s["cycles"] += e["cycles"]
+        for (k, v) in e["phases"].items():
+            s["phases"][k] = s["phases"].get(k, 0.0) + v
+
+    lines.append("Per simulator (total seconds):")
+    for (sim, s) in sorted(sims.items()):
+        phases = ", ".join(f"{k} {v:.1f}" for (k, v) in s["phases"].items())
+        rate = s["cycles"] / s["phases"]["sim"] if s["phases"].get("sim") else 0.0
+        lines.append(f"  {sim:10} {s['runs']:5} runs, {phases}, {rate:,.0f} cycles/s")
+
+    tests = []
+    for e in entries:
+        for (name, t) in e["tests"].items():
+            tests.append((t["time"], name, e))
+    tests.sort(key=lambda t: t[0], reverse=True)
+
+    lines.append("Slowest tests:")
+    for (t, name, e) in tests[:n]:
+        params = ",".join(f"{k}={v}" for (k, v) in e["parameters"].items())
+        lines.append(f"  {t:8.2f}s {os.path.basename(e['tbpath'])}/{name} [{e['simulator']}, {params}]")
+    return "\n".join(lines)
+
+def main(argv=None):
+    # Simulations import this module too (see mark), and never need
+    # the command line.
+    import argparse
+    parser = argparse.ArgumentParser(description="Summarize simulation timing trend files.")
+    parser.add_argument("files", nargs="*", default=[os.path.join("run", "timing.jsonl")], help="Trend files (default: run/timing.jsonl)")
+    parser.add_argument("-n", type=int, default=10, help="Number of slowest tests to list")
+    args = parser.parse_args(argv)
+    print(summarize(read_trend(args.files), args.n))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,130 +9,580 @@
 # }
 
 # Each file in the filelist is relative to the repository root.
+# Filelists are parsed (once) by project.py, which also accepts
+# optional "includes" and "defines" keys.
 
 import os
-import git
+import re
+import copy
+import time
+import logging
 
-import sys
-import json
 import cocotb
 
-from cocotb_test.simulator import run
 from cocotb.clock import Clock
-from cocotb.regression import TestFactory
 from cocotb.utils import get_sim_time
-from cocotb.triggers import Timer, ClockCycles, RisingEdge, FallingEdge, with_timeout
+from cocotb.triggers import Timer, ClockCycles, RisingEdge, FallingEdge
 from cocotb.types import LogicArray
-from cocotb.utils import get_sim_time
+from contextlib import contextmanager
+from typing import NamedTuple, Tuple
+from xml.etree import ElementTree
+
+import snapshot
+
+# Host-side messages, e.g. where the waves of a failing test are.
+_log = logging.getLogger(__name__)
 
-def runner(simulator, timescale, tbpath, params, defs=[], testname=None, pymodule=None, jsonpath=None, jsonname="filelist.json", root=None):
+# In a simulation, mark when the test module is loaded, to split the
+# startup time (see timing.py).
+if(cocotb.top is not None):
+    import timing
+    timing.mark()
+
+# Host-side modules (cocotb_test, simreport, which needs pytest,
+# simpool, and the build and lint modules, e.g. linter) are imported
+# where they are used, and so is numpy, which only sweep, check_sweep
+# and play need, so that importing utilities inside a simulation stays
+# cheap.
+
+def runner(simulator, timescale, tbpath, params, defs=[], testname=None, pymodule=None, jsonpath=None, jsonname="filelist.json", root=None, compile_only=False, batch=None, profile=None):
     """Run the simulator on test n, with parameters params, and defines
-    defs. If n is none, it will run all tests"""
+    defs. If n is none, it will run all tests. If compile_only is
+    True, only build the model (into the build cache) and return.
 
-    # if json path is none, assume that it is the same as tbpath
-    if(jsonpath is None):
-        jsonpath = tbpath
+    If batch is a list of test names that contains testname, every
+    test in batch is run in a single simulation (the first time any
+    of them is requested), and the result for testname is reported
+    from that simulation. Set SIM_BATCH=0 in the environment to run
+    each test in its own simulation regardless.
 
-    assert (os.path.exists(jsonpath)), "jsonpath directory must exist"
-    top = get_top(jsonpath, jsonname)
+    With SIM_WARM=1 in the environment, a single test (testname) is
+    instead sent to a long-lived simulation of the same model (see
+    simpool.py), which is started on first use.
 
-    # if pymodule is none, assume that the python module name is test+<name of the top module>.
-    if(pymodule is None):
-        pymodule = "test_" + top
+    Waveforms are controlled by SIM_TRACE in the environment (see
+    TRACE_POLICIES). By default nothing is traced.
+
+    profile names the build profile (see BUILD_PROFILES), usually the
+    test module's profile variable. SIM_PROFILE in the environment
+    overrides it for every test."""
+
+    profile = get_build_profile(profile)
+    if(testname is not None and os.environ.get("SIM_WARM", "0") == "1"):
+        return _run_warm(simulator, timescale, tbpath, params, defs, testname, pymodule, jsonpath, jsonname, profile)
+
+    if(batch is not None and testname in batch and os.environ.get("SIM_BATCH", "1") != "0"):
+        return _run_batched(simulator, timescale, tbpath, params, defs, testname, batch, pymodule, jsonpath, jsonname, root, profile)
 
     if(testname is None):
         testdir = "all"
     else:
         testdir=testname
-    
-    # Assume all paths in the json file are relative to the repository root.
-    if(root is None):
-        root = git.Repo(search_parent_directories=True).working_tree_dir
 
-    assert (os.path.exists(root)), "root directory path must exist"
+    return _run_single(simulator, timescale, tbpath, params, defs, testname, testdir, pymodule, jsonpath, jsonname, root, compile_only, profile)
+
+# Waveform policies, selected with SIM_TRACE:
+#   off    -- Never trace (the default).
+#   on     -- Trace every simulation.
+#   rerun  -- When a test fails, rerun only that test, on its own, with
+#             waves, into run/waves/<test>.
+#   window -- Like rerun, but only dump SIM_TRACE_WINDOW ns (default
+#             1000) either side of the failure time. Icarus only;
+#             Verilator traces the whole rerun.
+TRACE_POLICIES = ("off", "on", "rerun", "window")
+
+def get_trace_policy():
+    """ Get the waveform policy from SIM_TRACE in the environment."""
+    policy = os.environ.get("SIM_TRACE", "off")
+    assert policy in TRACE_POLICIES, f"SIM_TRACE must be one of {', '.join(TRACE_POLICIES)}, got {policy}."
+    return policy
+
+# Reference model modes, selected with SIM_REFMODEL:
+#   python -- Reference models run in Python, in the testbench (the
+#             default).
+#   native -- On Verilator, the reference models of the modules that
+#             have a spec are compiled into the simulation, and check
+#             the DUT there (see refspec.py). Icarus stays in Python.
+REFMODEL_MODES = ("python", "native")
+
+def get_refmodel_mode():
+    """ Get the reference model mode from SIM_REFMODEL in the environment."""
+    mode = os.environ.get("SIM_REFMODEL", "python")
+    assert mode in REFMODEL_MODES, f"SIM_REFMODEL must be one of {', '.join(REFMODEL_MODES)}, got {mode}."
+    return mode
+
+class BuildProfile(NamedTuple):
+    """Flags a build profile adds to every build."""
+    verilator: Tuple[str, ...] = ()
+    make: Tuple[str, ...] = ()
+    icarus: Tuple[str, ...] = ()
+    plus_args: Tuple[str, ...] = ()
+    waves: bool = False
+
+# Build profiles, selected per test module with runner(profile=...),
+# or for every test with SIM_PROFILE (which takes precedence):
+#   default      -- No extra flags.
+#   fast-compile -- Lowest compile latency, for short (e.g.
+#                   combinational) suites: Verilator and the C++
+#                   compiler don't optimize.
+#   fast-run     -- Fastest simulation, for long fuzz and soak runs:
+#                   optimized C++, output split into smaller files
+#                   (which parallel make builds at once), and X
+#                   assigned without randomization.
+#   debug        -- Waves from every simulation, X randomized, and C++
+#                   with debug symbols.
+# make holds make variables for Verilator's C++ build (e.g. OPT_FAST).
+# Every profile's flags are part of the build cache key, so models of
+# different profiles are cached side by side. Icarus has no
+# optimization flags, so only debug changes its builds.
+BUILD_PROFILES = {
+    "default": BuildProfile(),
+    "fast-compile": BuildProfile(verilator=("-O0",),
+                                 make=("OPT_FAST=-O0", "OPT_SLOW=-O0", "OPT_GLOBAL=-O0")),
+    "fast-run": BuildProfile(verilator=("-O3", "--x-assign", "fast", "--x-initial", "fast",
+                                        "--output-split", "5000", "--output-split-cfuncs", "5000"),
+                             make=("OPT_FAST=-O3", "OPT_SLOW=-O1", "OPT_GLOBAL=-O2")),
+    "debug": BuildProfile(verilator=("--x-assign", "unique", "--x-initial", "unique"),
+                          make=("OPT_FAST=-O0 -g", "OPT_SLOW=-O0 -g", "OPT_GLOBAL=-O0 -g"),
+                          plus_args=("+verilator+rand+reset+2",),
+                          waves=True),
+}
+
+def get_build_profile(profile=None):
+    """ Get the name of the build profile to use: SIM_PROFILE from the
+    environment if it is set, and profile (or "default") otherwise.
+
+    Arguments:
+    profile -- Name of the profile the test asks for, or None
+    """
+    name = os.environ.get("SIM_PROFILE") or profile or "default"
+    assert name in BUILD_PROFILES, f"Build profile must be one of {', '.join(BUILD_PROFILES)}, got {name}."
+    return name
+
+def get_threads():
+    """ Get the number of threads Verilator models are built to run
+    on, from SIM_THREADS in the environment (default 1).
+
+    More threads only pay off for large designs, since the threads
+    synchronize on every evaluation; see threadbench.py.
+    """
+    threads = int(os.environ.get("SIM_THREADS", "1"))
+    assert threads >= 1, f"SIM_THREADS must be at least 1, got {threads}."
+    return threads
+
+def get_make_jobs():
+    """ Get the number of parallel jobs for the C++ compile of
+    Verilator models, from SIM_MAKE_JOBS in the environment (default
+    the CPU count)."""
+    return max(1, int(os.environ.get("SIM_MAKE_JOBS") or os.cpu_count() or 1))
+
+def get_snapshot_env(build_dir, top, sources):
+    """ Get the environment that turns on post-reset snapshots (see
+    snapshot.py) in a simulation, if SIM_SNAPSHOT=1 is set. Snapshots
+    are kept with the model, and need the names of the top level
+    inputs, so they stay off if the top module's ports can't be parsed.
 
-    sources = get_sources(root, tbpath)
+    Arguments:
+    build_dir -- Build directory of the model
+    top -- Name of the top level module
+    sources -- list of source files
+    """
+    if(os.environ.get("SIM_SNAPSHOT", "0") != "1"):
+        return {}
+    import depindex
     for s in sources:
-        assert os.path.isfile(s), f"Error! File {s} does not exist.\
-        \n If this error is unexpected, and occurs on Gradescope:\
-        \n\t 1. Ensure the file is in Git.\
-        \n\t 2. If it is an 'imported' module, put the file in the imports directory."
+        ports = depindex.get_ports(depindex._read(s), top)
+        if(ports is not None):
+            inputs = [name for (direction, width, name) in ports if direction == "input"]
+            return {"SIM_SNAPSHOT_FILE": os.path.join(build_dir, snapshot.FILE),
+                    "SIM_SNAPSHOT_INPUTS": ",".join(inputs)} if inputs else {}
+    return {}
 
-    work_dir = os.path.join(tbpath, "run", testdir, get_param_string(params), simulator)
-    build_dir = os.path.join(tbpath, "build", get_param_string(params))
+def get_work_dir(tbpath, testdir, params, simulator):
+    """ Get the run directory of a simulation.
 
-    # Icarus doesn't build, it just runs.
-    if simulator.startswith("icarus"):
-        build_dir = work_dir
+    Arguments:
+    tbpath -- Path to the testbench directory
+    testdir -- Name of the run directory for this simulation
+    params -- dict of top level parameters
+    simulator -- Simulator name
+    """
+    return os.path.join(tbpath, "run", testdir, get_param_string(params), simulator)
+
+def _run_single(simulator, timescale, tbpath, params, defs, testcase, testdir, pymodule, jsonpath, jsonname, root, compile_only=False, profile=None):
+    """ Run one simulation, tracing any failing tests per SIM_TRACE."""
+    policy = get_trace_policy()
+    try:
+        return simulate(simulator, timescale, tbpath, params, defs, testcase, testdir, pymodule, jsonpath, jsonname, root, compile_only, waves=(policy == "on"), profile=profile)
+    except (AssertionError, SystemExit):
+        results = read_results(os.path.join(get_work_dir(tbpath, testdir, params, simulator), "results.xml"))
+        for r in results.values():
+            if(r["status"] == "failed"):
+                _trace_failure(simulator, timescale, tbpath, params, defs, r, pymodule, jsonpath, jsonname, root, profile)
+        raise
+
+def get_failure_time(result):
+    """ Get the time of a failure, in ns from the start of the test.
+
+    The time is taken from the last "at Time <t>ns" in the failure
+    message. Assertion messages report absolute simulation time, so
+    if the test didn't start at time 0 (e.g. in a batch), the test's
+    own simulated time is used instead, since it ends at the failure.
 
-    if simulator.startswith("verilator"):
-        compile_args=["-Wno-fatal", "-DVM_TRACE_FST=1", "-DVM_TRACE=1"]
-        plus_args = ["--trace", "--trace-fst"]
-        if(not os.path.exists(work_dir)):
-            os.makedirs(work_dir)
-    else:
-        compile_args=[]
-        plus_args = []
-
-    run(verilog_sources=sources,
-        simulator=simulator,
-        toplevel=top,
-        module=pymodule,
-        compile_args=compile_args,
-        plus_args=plus_args,
-        sim_build=build_dir,
-        timescale=timescale,
-        parameters=params,
-        defines=defs + ["VM_TRACE_FST=1", "VM_TRACE=1"],
-        work_dir=work_dir,
-        waves=True,
-        testcase=testname)
+    Arguments:
+    result -- Test result, as returned by read_results
+    """
+    duration = result.get("sim_time_ns", 0)
+    times = re.findall(r"at Time ([0-9.]+) ?ns", result.get("message", ""))
+    if(not times):
+        return duration
+    t = float(times[-1])
+    return min(t, duration) if duration > 0 else t
+
+def _trace_failure(simulator, timescale, tbpath, params, defs, result, pymodule, jsonpath, jsonname, root, profile=None):
+    """ Rerun a failed test on its own with waves, as SIM_TRACE asks.
+    Returns the run directory with the waveform, or None."""
+    policy = get_trace_policy()
+    if(policy not in ("rerun", "window")):
+        return None
+
+    window = None
+    if(policy == "window"):
+        t = get_failure_time(result)
+        half = float(os.environ.get("SIM_TRACE_WINDOW", "1000"))
+        window = (max(0, t - half), t + half)
+
+    testdir = os.path.join("waves", result["name"])
+    try:
+        simulate(simulator, timescale, tbpath, params, defs, result["name"], testdir, pymodule, jsonpath, jsonname, root, waves=True, window=window, profile=profile)
+    except (AssertionError, SystemExit):
+        # Expected, the test failed before.
+        pass
+
+    path = get_work_dir(tbpath, testdir, params, simulator)
+    _log.warning(f"Waveform of failing test {result['name']}: {path}")
+    return path
+
+def simulate(simulator, timescale, tbpath, params, defs, testcase, testdir, pymodule=None, jsonpath=None, jsonname="filelist.json", root=None, compile_only=False, waves=False, window=None, profile=None):
+    """ Build (if necessary) and run one simulation. Returns the path
+    to the results.xml file.
 
-# Function to build (run) the lint and style checks.
-def lint(simulator, timescale, tbpath, params, defs=[], compile_args=[], pymodule=None, jsonpath=None, jsonname="filelist.json", root=None):
+    Arguments:
+    testcase -- Test name(s) to run, comma separated, or None for all tests
+    testdir -- Name of the run directory for this simulation
+    waves -- Build a model with tracing, and dump waves
+    window -- (start, stop) in ns, only dump waves between these
+              times (Icarus only)
+    profile -- Name of the build profile (see get_build_profile)
+    (The rest are as for runner)
+
+    The wall time of each phase is recorded, see timing.py.
+    """
+    import project
+    import timing
+    import buildcache
+    import refspec
+    import objcache
+    import iplib
+    start = time.perf_counter()
 
     # if json path is none, assume that it is the same as tbpath
     if(jsonpath is None):
         jsonpath = tbpath
 
     assert (os.path.exists(jsonpath)), "jsonpath directory must exist"
-    top = get_top(jsonpath, jsonname)
-
 
     # Assume all paths in the json file are relative to the repository root.
     if(root is None):
-        root = git.Repo(search_parent_directories=True).working_tree_dir
+        root = project.get_root(tbpath)
 
     assert (os.path.exists(root)), "root directory path must exist"
-    sources = get_sources(root, tbpath)
+
+    filelist = project.get_filelist(jsonpath, jsonname, root)
+    top = filelist.top
 
     # if pymodule is none, assume that the python module name is test+<name of the top module>.
     if(pymodule is None):
         pymodule = "test_" + top
 
-    # Create the expected makefile so cocotb-test won't complain.
-    sim_build = "lint"
-    if(not os.path.exists("lint")):
-       os.mkdir("lint")
-
-    with open("lint/Vtop.mk", 'w') as fd:
-        fd.write("all:")
-
-    make_args = ["-n"]
-    compile_args += ["--lint-only"]
- 
-    run(verilog_sources=sources,
-        simulator=simulator,
-        toplevel=top,
-        module=pymodule,
-        compile_args=compile_args,
-        sim_build=sim_build,
-        timescale=timescale,
-        parameters=params,
-        defines=defs,
-        make_args=make_args,
-        compile_only=True)
+    sources = list(filelist.sources)
+    includes = list(filelist.includes)
+    for s in sources:
+        assert os.path.isfile(s), f"Error! File {s} does not exist.\
+        \n If this error is unexpected, and occurs on Gradescope:\
+        \n\t 1. Ensure the file is in Git.\
+        \n\t 2. If it is an 'imported' module, put the file in the imports directory."
+    # Only build from what the top module reaches, so that sources
+    # used by top.sv alone don't slow down (or invalidate) the build.
+    sources = iplib.prune(top, sources)
+
+    work_dir = get_work_dir(tbpath, testdir, params, simulator)
+    if(not os.path.exists(work_dir)):
+        os.makedirs(work_dir)
+    # SIM_BUILD_ROOT moves the build cache (e.g. to benchmark cold builds).
+    cache_dir = os.path.join(os.environ.get("SIM_BUILD_ROOT") or os.path.join(tbpath, "build"), simulator)
+
+    profile = get_build_profile(profile)
+    flags = BUILD_PROFILES[profile]
+    waves = waves or flags.waves
+
+    compile_args = []
+    plus_args = []
+    make_args = []
+    objcache_dir = None
+    defines = list(defs) + list(filelist.defines)
+    if simulator.startswith("verilator"):
+        compile_args += ["-Wno-fatal"] + list(flags.verilator)
+        plus_args += list(flags.plus_args)
+        make_args += list(flags.make) + [f"-j{get_make_jobs()}"]
+        # --threads is in compile_args, so it is part of the cache key.
+        threads = get_threads()
+        if(threads > 1):
+            compile_args += ["--threads", str(threads)]
+        # The C++ compiles share one object cache per repository, so
+        # the Verilator runtime is only compiled once (see objcache.py).
+        objcache_dir = os.path.join(root, "build", "objcache")
+        cache = objcache.get_objcache(objcache_dir)
+        if(cache is not None):
+            make_args += [f"OBJCACHE={cache}"]
+        if(waves):
+            compile_args += ["-DVM_TRACE_FST=1", "-DVM_TRACE=1"]
+            plus_args += ["--trace", "--trace-fst"]
+            defines += ["VM_TRACE_FST=1", "VM_TRACE=1"]
+        # SIM_REFMODEL=native binds the DPI reference model checker
+        # into the DUT (see refspec.py). It is written next to the
+        # cache, not into it, so eviction never removes it mid-build.
+        if(get_refmodel_mode() == "native"):
+            sources = sources + refspec.write_checker(os.path.join(os.path.dirname(cache_dir), "refmodel"), top)
+        sim_waves = waves
+    else:
+        compile_args += list(flags.icarus)
+        # Icarus dumps through our own module, which can be told to
+        # only dump a window (see write_dump_module).
+        if(waves):
+            sources = sources + [write_dump_module(cache_dir, top)]
+            compile_args += ["-s", DUMP_MODULE]
+            plus_args += ["-fst"]
+            if(window is not None):
+                plus_args += [f"+dump_start={int(window[0])}", f"+dump_stop={int(window[1]) + 1}"]
+        sim_waves = False
+
+    kwargs = dict(verilog_sources=sources,
+                  simulator=simulator,
+                  toplevel=top,
+                  module=pymodule,
+                  compile_args=compile_args,
+                  plus_args=plus_args,
+                  timescale=timescale,
+                  parameters=params,
+                  includes=includes,
+                  defines=defines,
+                  work_dir=work_dir,
+                  waves=sim_waves)
+    if(make_args):
+        kwargs["make_args"] = make_args
+
+    # Builds are shared between every test (and pytest session) with
+    # the same configuration, see buildcache.py. The model is compiled
+    # once on a cache miss, and then run without recompiling.
+    # cocotb_test appends to the argument lists it is given, so each
+    # call gets its own copy.
+    built = []
+    def build(build_dir):
+        from cocotb_test.simulator import run
+        run(sim_build=build_dir, compile_only=True, **copy.deepcopy(kwargs))
+        built.append(build_dir)
+        # The object cache is trimmed once per build, not per compile.
+        if(objcache_dir is not None):
+            objcache.evict(objcache_dir)
+
+    # The make variables change the model; -j and OBJCACHE don't.
+    config = buildcache.get_build_config(simulator, top, params, defines, compile_args, timescale, includes=includes, waves=waves,
+                                         profile=profile, make_vars=list(flags.make) if simulator.startswith("verilator") else [])
+
+    phases = {"resolve": time.perf_counter() - start}
+    start = time.perf_counter()
+    with buildcache.cached_build(cache_dir, config, sources, build) as build_dir:
+        phases["compile"] = time.perf_counter() - start
+        if(compile_only):
+            timing.record(timing.get_entry(tbpath, simulator, params, testcase, phases, {}, not built))
+            return None
+
+        # Keep results out of the shared build directory.
+        with results_file(os.path.join(work_dir, "results.xml")) as results:
+            for f in (results, results + timing.MARKS):
+                if(os.path.exists(f)):
+                    os.remove(f)
+            start = time.perf_counter()
+            wall = time.time()
+            try:
+                run_prebuilt(sim_build=build_dir, testcase=testcase, extra_env=get_snapshot_env(build_dir, top, sources), **copy.deepcopy(kwargs))
+            finally:
+                phases["sim"] = time.perf_counter() - start
+                marks = timing.get_marks(results, wall, time.time())
+                timing.record(timing.get_entry(tbpath, simulator, params, testcase, phases, read_results(results), not built, marks))
+        return results
+
+DUMP_MODULE = "sim_dump"
+
+def write_dump_module(d, top):
+    """ Write the Icarus waveform dump module for a top level module,
+    and return its path. The file is only rewritten if it changes, so
+    that it doesn't invalidate the build cache.
+
+    The module dumps everything under top to <top>.fst. With
+    +dump_start=<ns> and/or +dump_stop=<ns> on the command line, it
+    only dumps between those times.
+
+    Arguments:
+    d -- Directory to write the module into
+    top -- Name of the top level module
+    """
+    text = (f"`timescale 1ns/1ps\n"
+            f"module {DUMP_MODULE}();\n"
+            f"   integer start, stop;\n"
+            f"   initial begin\n"
+            f"      $dumpfile(\"{top}.fst\");\n"
+            f"      $dumpvars(0, {top});\n"
+            f"      if ($value$plusargs(\"dump_start=%d\", start) && start > 0) begin\n"
+            f"         $dumpoff;\n"
+            f"         #(start) $dumpon;\n"
+            f"      end\n"
+            f"      if ($value$plusargs(\"dump_stop=%d\", stop)) begin\n"
+            f"         #(stop - $time) $dumpoff;\n"
+            f"      end\n"
+            f"   end\n"
+            f"endmodule\n")
+
+    os.makedirs(d, exist_ok=True)
+    path = os.path.join(d, f"{DUMP_MODULE}_{top}.v")
+    if(not os.path.isfile(path) or open(path).read() != text):
+        with open(path, "w") as fd:
+            fd.write(text)
+    return path
+
+class _Prebuilt():
+    """ Simulator mixin that only runs the model. It has already been
+    compiled into the build cache, so the compile commands (always the
+    leading commands) are skipped."""
+
+    def build_command(self):
+        return super().build_command()[-1:]
+
+# _Prebuilt subclasses of the cocotb_test simulator classes, created
+# on first use.
+_prebuilt = {}
+
+def run_prebuilt(simulator, **kwargs):
+    """ Like cocotb_test's run(), for a model that is already built.
+
+    Arguments:
+    simulator -- Simulator name (icarus or verilator)
+    kwargs -- Arguments to cocotb_test's run(), including sim_build
+    """
+    from cocotb_test.simulator import Icarus, Verilator
+    base = Verilator if simulator.startswith("verilator") else Icarus
+    if(base not in _prebuilt):
+        _prebuilt[base] = type("_Prebuilt" + base.__name__, (_Prebuilt, base), {})
+    return _prebuilt[base](**kwargs).run()
+
+# Results of batched simulations, keyed by everything that
+# distinguishes one batch from another.
+_batches = {}
+
+def _run_batched(simulator, timescale, tbpath, params, defs, testname, batch, pymodule, jsonpath, jsonname, root, profile=None):
+    """ Report the result of testname from a batched simulation of
+    every test in batch, running the batch if it hasn't run yet."""
+    key = (tbpath, simulator, get_param_string(params), tuple(defs), tuple(batch), profile)
+    if(key not in _batches):
+        results = os.path.join(get_work_dir(tbpath, "batch", params, simulator), "results.xml")
+        if(os.path.exists(results)):
+            os.remove(results)
+        try:
+            results = simulate(simulator, timescale, tbpath, params, defs, ",".join(batch), "batch", pymodule, jsonpath, jsonname, root, waves=(get_trace_policy() == "on"), profile=profile)
+        except (AssertionError, SystemExit):
+            # cocotb_test raises if any test failed (or the simulator
+            # exited abnormally); the individual results are still in
+            # the results file.
+            pass
+        _batches[key] = read_results(results)
+
+    result = _batches[key].get(testname)
+    if(result is None):
+        # The simulator exited before reaching this test (e.g. it
+        # crashed in an earlier one), so run it on its own.
+        return _run_single(simulator, timescale, tbpath, params, defs, testname, testname, pymodule, jsonpath, jsonname, root, profile=profile)
+
+    import simreport
+    simreport.record(result)
+    if(result["status"] == "failed"):
+        _trace_failure(simulator, timescale, tbpath, params, defs, result, pymodule, jsonpath, jsonname, root, profile)
+    assert result["status"] != "failed", f"{testname} failed in batched simulation: {result['message']}"
+    return result
+
+def _run_warm(simulator, timescale, tbpath, params, defs, testname, pymodule, jsonpath, jsonname, profile=None):
+    """ Report the result of testname from a warm worker simulation."""
+    if(pymodule is None):
+        pymodule = "test_" + get_top(jsonpath or tbpath, jsonname)
+
+    import simpool
+    import simreport
+    result = simpool.run_test(simulator, timescale, tbpath, params, defs, testname, pymodule, profile)
+    simreport.record(result)
+    if(result["status"] == "failed"):
+        _trace_failure(simulator, timescale, tbpath, params, defs, result, pymodule, jsonpath, jsonname, None, profile)
+    assert result["status"] != "failed", f"{testname} failed in warm simulation: {result['message']}"
+    return result
 
+def read_results(path):
+    """ Read the per-test results from a cocotb results.xml file.
+
+    Returns a dict of test name to a dict with keys name, status
+    (passed, failed or skipped), time (real seconds), sim_time_ns
+    and message. Returns an empty dict if the file does not exist.
+
+    Arguments:
+    path -- Path to the results.xml file
+    """
+    results = {}
+    if(not os.path.isfile(path)):
+        return results
+
+    for tc in ElementTree.parse(path).iter("testcase"):
+        status = "passed"
+        message = ""
+        for failure in list(tc.iter("failure")) + list(tc.iter("error")):
+            status = "failed"
+            message = failure.get("message") or "see the simulation log"
+        if(tc.find("skipped") is not None):
+            status = "skipped"
+        results[tc.get("name")] = {"name": tc.get("name"),
+                                   "status": status,
+                                   "time": float(tc.get("time", 0)),
+                                   "sim_time_ns": float(tc.get("sim_time_ns", 0)),
+                                   "message": message}
+    return results
+
+# Function to build (run) the lint and style checks.
+def lint(simulator, timescale, tbpath, params, defs=[], compile_args=None, pymodule=None, jsonpath=None, jsonname="filelist.json", root=None):
+    """ Lint the module with Verilator, and fail on any warning.
+
+    Results are cached by source contents and flags (see linter.py),
+    so an unchanged module isn't linted again.
+
+    Arguments:
+    compile_args -- Lint flags, defaults to linter.LINT_FLAGS
+                    (e.g. pass linter.STYLE_FLAGS for style checks)
+    (The rest are as for runner; pymodule is unused)
+    """
+    import linter
+    assert simulator.startswith("verilator"), "Lint checks are only supported with verilator."
+    flags = linter.LINT_FLAGS if compile_args is None else compile_args
+    if("--lint-only" not in flags):
+        flags = list(flags) + ["--lint-only"]
+
+    result = linter.lint_module(tbpath, params, defs, flags, timescale, jsonpath, jsonname, root)
+    assert result.passed, "Verilator lint failed:\n" + ("\n".join(map(str, result.diagnostics)) or result.output)
 
 def get_files_from_filelist(p, n):
     """ Get a list of files from a json filelist.
@@ -141,10 +591,10 @@ def get_files_from_filelist(p, n):
     p -- Path to the directory that contains the .json file
     n -- name of the .json file to read.
     """
-    n = os.path.join(p, n)
-    with open(n) as filelist:
-        files = json.load(filelist)["files"]
-    return files
+    import project
+    filelist = project.get_filelist(p, n)
+    root = project.get_root(p)
+    return [os.path.relpath(f, root) for f in filelist.sources]
 
 def get_sources(r, p):
     """ Get a list of source file paths from a json filelist.
@@ -153,9 +603,8 @@ def get_sources(r, p):
     r -- Absolute path to the root of the repository.
     p -- Absolute path to the directory containing filelist.json
     """
-    sources = get_files_from_filelist(p, "filelist.json")
-    sources = [os.path.join(r, f) for f in sources]
-    return sources
+    import project
+    return list(project.get_filelist(p, "filelist.json", r).sources)
 
 def get_top(p, n="filelist.json"):
     """ Get the name of the top level module from a filelist.json.
@@ -173,10 +622,8 @@ def get_top_from_filelist(p, n):
     p -- Absolute path to the directory containing filelist.json
     n -- name of the .json file to read.
     """
-    n = os.path.join(p, n)
-    with open(n) as filelist:
-        top = json.load(filelist)["top"]
-        return top
+    import project
+    return project.get_filelist(p, n).top
 
 def get_param_string(parameters):
     """ Get a string of all the parameters concatenated together.
@@ -187,6 +634,23 @@ def get_param_string(parameters):
     return "_".join(("{}={}".format(*i) for i in parameters.items()))
 
 
+@contextmanager
+def results_file(path):
+    """ Tell cocotb_test (and cocotb) where to write the results file.
+
+    Arguments:
+    path -- Path to the results.xml file
+    """
+    old = os.environ.get("COCOTB_RESULTS_FILE")
+    os.environ["COCOTB_RESULTS_FILE"] = path
+    try:
+        yield path
+    finally:
+        if old is None:
+            del os.environ["COCOTB_RESULTS_FILE"]
+        else:
+            os.environ["COCOTB_RESULTS_FILE"] = old
+
 def assert_resolvable(s):
     assert s.value.is_resolvable, f"Unresolvable value in {s._path} (x or z in some or all bits) at Time {get_sim_time(units='ns')}ns."
 
@@ -199,19 +663,32 @@ async def clock_start_sequence(clk_i, period=1, unit='ns'):
     c = Clock(clk_i, period, unit)
 
     # Start the clock (soon). Start it low to avoid issues on the first RisingEdge
-    cocotb.start_soon(c.start(start_high=False))
+    # Returns the clock task, so that it can be killed.
+    return cocotb.start_soon(c.start(start_high=False))
 
 async def reset_sequence(clk_i, reset_i, cycles, FinishClkFalling=True, active_level=True):
     reset_i.setimmediatevalue(not active_level)
 
     # Always assign inputs on the falling edge
     await FallingEdge(clk_i)
-    reset_i.value = active_level
 
-    await ClockCycles(clk_i, cycles)
+    # With SIM_SNAPSHOT=1, restore the state at the end of an earlier
+    # reset instead of running the reset cycles (see snapshot.py).
+    # Reset is still held for one rising edge after the restore, so
+    # that the models clocked alongside the DUT (see models.py) are
+    # reset too.
+    state = snapshot.load(clk_i, reset_i, cycles, active_level)
+    reset_i.value = active_level
+    if(state is not None):
+        snapshot.restore(state)
+        await RisingEdge(clk_i)
+    else:
+        await ClockCycles(clk_i, cycles)
 
     # Always assign inputs on the falling edge
     await FallingEdge(clk_i)
+    if(state is None):
+        snapshot.save(clk_i, reset_i, cycles, active_level)
     reset_i.value = not active_level
 
     reset_i._log.debug("Reset complete")
@@ -220,3 +697,95 @@ async def reset_sequence(clk_i, reset_i, cycles, FinishClkFalling=True, active_l
     if (not FinishClkFalling):
         await RisingEdge(clk_i)
 
+
+async def sweep(inputs, outputs, stimulus, delay=1, unit='ns'):
+    """ Drive every stimulus vector through a combinational DUT, and
+    capture its outputs.
+
+    Each vector is applied, then after delay the outputs are read into
+    a preallocated array. Inputs are only written when their value
+    changes. Nothing is checked here; compare the returned array with
+    check_sweep once the sweep is done.
+
+    Returns an int64 array with one row per vector and one column per
+    output (1-D if there is only one output). Unresolvable (x or z)
+    outputs are captured as -1.
+
+    Arguments:
+    inputs -- list of input handles
+    outputs -- list of output handles
+    stimulus -- array of input values, one row per vector and one
+                column per input (1-D if there is only one input)
+    delay -- Time to wait after applying each vector
+    unit -- Unit of delay
+    """
+    import numpy as np
+    stimulus = np.asarray(stimulus)
+    if(stimulus.ndim == 1):
+        stimulus = stimulus[:, None]
+    assert stimulus.shape[1] == len(inputs), f"Stimulus has {stimulus.shape[1]} columns, but there are {len(inputs)} inputs."
+
+    captured = np.empty((stimulus.shape[0], len(outputs)), dtype=np.int64)
+    wait = Timer(delay, unit)
+    last = [None] * len(inputs)
+
+    for (i, vector) in enumerate(stimulus.tolist()):
+        for (j, v) in enumerate(vector):
+            if(v != last[j]):
+                inputs[j].value = v
+                last[j] = v
+
+        await wait
+
+        for (j, o) in enumerate(outputs):
+            v = o.value
+            captured[i, j] = v.integer if v.is_resolvable else -1
+
+    return captured[:, 0] if len(outputs) == 1 else captured
+
+def check_sweep(captured, expected, stimulus, inputs, outputs, limit=5):
+    """ Compare the outputs captured by sweep with the expected outputs,
+    in one vectorized comparison. Fails with the first few mismatches.
+
+    Arguments:
+    captured -- array returned by sweep
+    expected -- array of expected outputs, the same shape as captured
+    stimulus -- array of input vectors passed to sweep
+    inputs -- list of input handles (for messages)
+    outputs -- list of output handles (for messages)
+    limit -- Maximum number of mismatches to report
+    """
+    import numpy as np
+    captured = np.asarray(captured).reshape(len(stimulus), -1)
+    expected = np.asarray(expected).reshape(len(stimulus), -1).astype(np.int64)
+    stimulus = np.asarray(stimulus).reshape(len(stimulus), -1)
+
+    bad = np.nonzero((captured != expected).any(axis=1))[0]
+    if(len(bad) == 0):
+        return
+
+    lines = []
+    for i in bad[:limit]:
+        ins = ", ".join(f"{h._name} == {int(v)}" for (h, v) in zip(inputs, stimulus[i]))
+        got = ", ".join(f"{h._name} == {'x/z' if g < 0 else int(g)}" for (h, g) in zip(outputs, captured[i]))
+        exp = ", ".join(f"{h._name} == {int(e)}" for (h, e) in zip(outputs, expected[i]))
+        lines.append(f"  {ins}: Got: {got}, expected: {exp}")
+    assert False, f"Incorrect Result for {len(bad)} of {len(stimulus)} input vectors (first at vector {bad[0]}):\n" + "\n".join(lines)
+
+async def play(clk_i, inputs, stimulus):
+    """ Apply one input vector per clock cycle, on the falling edge:
+    stream.drive over the rows of an array.
+
+    Arguments:
+    clk_i -- Clock handle
+    inputs -- list of input handles
+    stimulus -- array of input values, one row per cycle and one
+                column per input (1-D if there is only one input)
+    """
+    import numpy as np
+    from stream import drive
+    stimulus = np.asarray(stimulus)
+    if(stimulus.ndim == 1):
+        stimulus = stimulus[:, None]
+    assert stimulus.shape[1] == len(inputs), f"Stimulus has {stimulus.shape[1]} columns, but there are {len(inputs)} inputs."
+    await drive(clk_i, inputs, map(tuple, stimulus.tolist()))